@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+
+"""
+Runs an external aligner (MAFFT) as a child process with an optional
+timeout and memory limit, and reports its exit code and resource usage.
+"""
+
+import os
+import sys
+import time
+import signal
+import platform
+import threading
+import subprocess
+
+
+class AlignerTimeout(Exception):
+    pass
+
+
+class AlignerRunner(object):
+
+    def __init__(self, argv, out_path, timeout=None, name="MAFFT"):
+        """
+        Run an aligner without a shell, its stdout goes straight to out_path
+        and its stderr (progress) is printed while it runs
+        :param argv: list of program and arguments
+        :param out_path: filepath receiving stdout of the aligner
+        :param timeout: seconds before the aligner is killed, None is no limit
+        :param name: name of the aligner, used in messages
+        """
+
+        super(AlignerRunner, self).__init__()
+
+        self.argv = [str(x) for x in argv]
+
+        self.out_path = out_path
+
+        self.timeout = timeout
+
+        self.name = name
+
+    def _stream_stderr(self, stderr):
+        # the progress of MAFFT is rewritten in place with '\r', so it is
+        # passed on as it comes rather than line by line
+        for chunk in iter(lambda: os.read(stderr.fileno(), 4096), b""):
+            sys.stdout.write(chunk.decode("utf-8", errors="replace"))
+            sys.stdout.flush()
+
+        stderr.close()
+
+    def _kill(self, process, posix):
+        # the whole process group, the aligner script starts other programs
+        try:
+            if posix:
+                os.killpg(process.pid, signal.SIGKILL)
+            else:
+                process.kill()
+
+        except OSError:
+            pass
+
+    def run(self):
+        """
+        :return: dict of argv, returncode, wall_time, cpu_time (seconds)
+                 and peak_rss_kb of the aligner (None if not available)
+        """
+        posix = platform.system().lower() != "windows"
+
+        wall_start = time.perf_counter()
+
+        with open(self.out_path, "wb") as out_file:
+
+            # own process group, so that a timeout also stops the
+            # programs started by the aligner script
+            process = subprocess.Popen(self.argv,
+                                       stdout=out_file,
+                                       stderr=subprocess.PIPE,
+                                       start_new_session=posix)
+
+            stderr_thread = threading.Thread(target=self._stream_stderr,
+                                             args=(process.stderr,))
+            stderr_thread.daemon = True
+            stderr_thread.start()
+
+            # (exit code, resource usage) of the aligner
+            wait_result = []
+
+            def wait_child():
+                if posix:
+                    # wait4 reports the resource usage of the aligner and
+                    # the children it has waited for
+                    pid, status, child_rusage = os.wait4(process.pid, 0)
+                    wait_result.append((os.waitstatus_to_exitcode(status),
+                                        child_rusage))
+                else:
+                    wait_result.append((process.wait(), None))
+
+            wait_thread = threading.Thread(target=wait_child)
+
+            wait_thread.daemon = True
+            wait_thread.start()
+
+            try:
+                wait_thread.join(self.timeout)
+
+                timed_out = wait_thread.is_alive()
+
+                if timed_out:
+                    self._kill(process, posix)
+
+                    wait_thread.join()
+
+                stderr_thread.join()
+
+            except BaseException:
+                # Ctrl-C does not reach the aligner in its own session, it
+                # must not go on writing to out_path after the run stops
+                if wait_thread.is_alive():
+                    self._kill(process, posix)
+
+                wait_thread.join()
+                stderr_thread.join()
+
+                raise
+
+        wall_time = time.perf_counter() - wall_start
+
+        if timed_out:
+            raise AlignerTimeout(self.name + " was stopped after "
+                                 + str(self.timeout) + " seconds")
+
+        returncode, rusage = wait_result[0]
+
+        cpu_time = None
+        peak_rss_kb = None
+
+        if rusage is not None:
+            cpu_time = rusage.ru_utime + rusage.ru_stime
+
+            # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+            peak_rss_kb = rusage.ru_maxrss
+            if sys.platform == "darwin":
+                peak_rss_kb = peak_rss_kb // 1024
+
+        return {"argv": self.argv,
+                "returncode": returncode,
+                "wall_time": wall_time,
+                "cpu_time": cpu_time,
+                "peak_rss_kb": peak_rss_kb}
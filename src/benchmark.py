@@ -0,0 +1,430 @@
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark of VirusRecom on synthetic recombinant alignments, every stage
+is timed separately and the results are saved as JSON, such as:
+
+    python benchmark.py --genome-length 10000 50000 --seqs-per-lineage 10 100
+                        --lineage-count 4 -o benchmark.json
+
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import importlib
+import platform
+import tempfile
+import itertools
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+
+import virusrecom
+
+from lineage_pool import LineagePool
+
+from table_writer import write_table
+
+from run_report import peak_rss_kb
+
+
+# the planted recombination region, as fractions of the genome length
+PLANTED_REGION = (0.4, 0.6)
+
+
+def make_recombinant_alignment(fasta_path, genome_length, seqs_per_lineage,
+                               lineage_count, gap_density, seed=0,
+                               lineage_divergence=0.05, seq_divergence=0.005,
+                               query_count=3):
+    """
+    Write a synthetic alignment, lineages are mutated from one ancestor and
+    the query is lineage 1 inside PLANTED_REGION and lineage 0 elsewhere
+    :param fasta_path: filepath of the alignment
+    :param gap_density: proportion of alignment columns with gaps, each run
+                        of gaps is an indel of one lineage (or of the query)
+    :return: dict of lineage marks, query mark and the planted region
+             (original sites, 1-based, right end included)
+    """
+    rng = np.random.default_rng(seed)
+
+    nt = np.frombuffer(b"ACGT", dtype=np.uint8)
+
+    ancestor = nt[rng.integers(0, 4, genome_length)]
+
+    def mutate(seq, rate):
+        seq = seq.copy()
+        site = np.flatnonzero(rng.random(seq.shape[0]) < rate)
+        seq[site] = nt[rng.integers(0, 4, site.shape[0])]
+        return seq
+
+    # indels are runs of 1 to 20 columns, the last owner is the query
+    gap_mask = np.zeros((lineage_count + 1, genome_length), dtype=bool)
+
+    run_count = rng.binomial(genome_length, gap_density / 10.5)
+    for start, length, owner in zip(rng.integers(0, genome_length, run_count),
+                                    rng.integers(1, 21, run_count),
+                                    rng.integers(0, lineage_count + 1, run_count)):
+        gap_mask[owner, start:start + length] = True
+
+    def add_gaps(seq, owner):
+        seq = seq.copy()
+        seq[gap_mask[owner]] = ord("-")
+        return seq
+
+    lineage_seq_list = [mutate(ancestor, lineage_divergence)
+                        for n in range(lineage_count)]
+
+    lineage_mark_list = ["L" + str(n + 1).zfill(3) + "_"
+                         for n in range(lineage_count)]
+
+    region_left = int(genome_length * PLANTED_REGION[0])
+    region_right = int(genome_length * PLANTED_REGION[1])
+
+    recombinant = lineage_seq_list[0].copy()
+    recombinant[region_left:region_right] = lineage_seq_list[1][region_left:region_right]
+
+    with open(fasta_path, "wb") as fasta_file:
+
+        for n in range(lineage_count):
+            for m in range(seqs_per_lineage):
+                fasta_file.write((">" + lineage_mark_list[n] + "s"
+                                  + str(m + 1) + "\n").encode("ascii"))
+                fasta_file.write(add_gaps(mutate(lineage_seq_list[n],
+                                                 seq_divergence), n).tobytes()
+                                 + b"\n")
+
+        for m in range(query_count):
+            fasta_file.write((">RQ_s" + str(m + 1) + "\n").encode("ascii"))
+            fasta_file.write(add_gaps(mutate(recombinant, seq_divergence),
+                                      lineage_count).tobytes()
+                             + b"\n")
+
+    return {"lineage_name_list": lineage_mark_list,
+            "query": "RQ_",
+            "major_parent": lineage_mark_list[0],
+            "minor_parent": lineage_mark_list[1],
+            "planted_region": [region_left + 1, region_right]}
+
+
+class StageTimer(object):
+
+    def __init__(self, trace_memory=True):
+        """
+        Wall time and peak memory (traced by tracemalloc) of each stage
+        :param trace_memory: trace the memory allocations, it slows the stages
+        """
+
+        super(StageTimer, self).__init__()
+
+        self.trace_memory = trace_memory
+
+        self.stage_dic = {}
+
+    def run(self, stage_name, stage_func, *args, **kwargs):
+        """
+        :return: the return value of stage_func
+        """
+        if self.trace_memory:
+            tracemalloc.start()
+
+        start = time.perf_counter()
+
+        result = stage_func(*args, **kwargs)
+
+        seconds = time.perf_counter() - start
+
+        peak_mb = None
+        if self.trace_memory:
+            peak_mb = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+            tracemalloc.stop()
+
+        self.stage_dic[stage_name] = {"seconds": seconds,
+                                      "peak_memory_mb": peak_mb}
+
+        return result
+
+
+def region_oracle(region_test, site_list, dataset):
+    """
+    Compare the detected regions of the minor parent with the planted region
+    :param region_test: see virusrecom.test_regions, None if no lineage
+                        dominates any window (everything is missed)
+    :return: dict
+    """
+    planted_left, planted_right = dataset["planted_region"]
+
+    recom_region_dic = {}
+    if region_test is not None:
+        recom_region_dic = region_test["recom_region"]
+
+    detected = []
+    for region_left, region_right in recom_region_dic.get(
+            dataset["minor_parent"], []):
+        detected.append([int(site_list[region_left]),
+                         int(site_list[min(region_right, len(site_list) - 1)])])
+
+    overlap = 0
+    covered = 0
+    breakpoint_error = None
+
+    for region_left, region_right in detected:
+        overlap += max(0, min(region_right, planted_right)
+                       - max(region_left, planted_left) + 1)
+        covered += region_right - region_left + 1
+
+        region_error = max(abs(region_left - planted_left),
+                           abs(region_right - planted_right))
+        if breakpoint_error is None or region_error < breakpoint_error:
+            breakpoint_error = region_error
+
+    planted_size = planted_right - planted_left + 1
+
+    return {"major_parent_found": (region_test is not None and
+                                   region_test["major_parent"] == dataset["major_parent"]),
+            "planted_region": [planted_left, planted_right],
+            "detected_region": detected,
+            "jaccard": overlap / (planted_size + covered - overlap),
+            "breakpoint_error": breakpoint_error}
+
+
+def run_case(work_dir, genome_length, seqs_per_lineage, lineage_count,
+             gap_density, seed, gaps_use, method, windows_size, step_size,
+             max_recom_fragment, recom_percentage, breakwins, output_format,
+             lineage_pool, trace_memory):
+    """
+    Generate one dataset and run every stage on it
+    :return: dict of parameters, stages and oracle
+    """
+    fasta_path = work_dir + "/" + "synthetic.fasta"
+
+    generate_start = time.perf_counter()
+
+    dataset = make_recombinant_alignment(fasta_path, genome_length,
+                                         seqs_per_lineage, lineage_count,
+                                         gap_density, seed)
+
+    generate_seconds = time.perf_counter() - generate_start
+
+    lineage_name_list = dataset["lineage_name_list"]
+
+    timer = StageTimer(trace_memory)
+
+    seq_matrix = timer.run("read_seq", virusrecom.load_alignment, fasta_path)
+
+    seq_matrix = timer.run("filter_sites", virusrecom.filter_sites,
+                           seq_matrix, gaps_use, method)[0]
+
+    site_list = seq_matrix.sites
+
+    query_matrix = seq_matrix.select_rows(dataset["query"]).matrix
+
+    lineage_stat_list = timer.run("reference_stats", virusrecom.reference_stats,
+                                  seq_matrix, lineage_name_list, gaps_use,
+                                  lineage_pool)
+
+    wic_matrix = timer.run("site_wic", virusrecom.site_wic, query_matrix,
+                           lineage_stat_list)
+
+    window_wic, window_site = timer.run("window_scan", virusrecom.window_scan,
+                                        wic_matrix, site_list, windows_size,
+                                        step_size)
+
+    detected_area_list = timer.run("region_search", virusrecom.detect_regions,
+                                   wic_matrix, window_wic, windows_size,
+                                   step_size, gaps_use, recom_percentage,
+                                   max_recom_fragment, lineage_pool)
+
+    region_test = None
+
+    if any(detected_area_list):
+        region_test = timer.run("mann_whitney", virusrecom.test_regions,
+                                wic_matrix, site_list, lineage_name_list,
+                                detected_area_list)
+
+    if method.upper() == "P" and breakwins > 0:
+        timer.run("breakpoint_scan", virusrecom.breakpoint_scan, wic_matrix,
+                  site_list, breakwins, lineage_pool)
+
+    def write_output():
+        import pandas as pd
+
+        site_data = pd.DataFrame(wic_matrix.T, columns=lineage_name_list)
+        site_data.insert(0, "Site", site_list)
+        write_table(site_data, work_dir + "/" + "sites", output_format)
+
+        window_data = pd.DataFrame(window_wic.T, columns=lineage_name_list)
+        window_data.insert(0, "Central position", window_site)
+        write_table(window_data, work_dir + "/" + "sliding window", output_format)
+
+    timer.run("output_writing", write_output)
+
+    return {"genome_length": genome_length,
+            "seqs_per_lineage": seqs_per_lineage,
+            "lineage_count": lineage_count,
+            "gap_density": gap_density,
+            "seed": seed,
+            "alignment_size_mb": os.path.getsize(fasta_path) / 1024 / 1024,
+            "sites_scanned": int(site_list.shape[0]),
+            "generate_seconds": generate_seconds,
+            "stages": timer.stage_dic,
+            "total_seconds": sum([x["seconds"] for x in timer.stage_dic.values()]),
+            "oracle": region_oracle(region_test, site_list, dataset)}
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        prog="VirusRecom benchmark",
+        description="Benchmark of VirusRecom on synthetic recombinant alignments.")
+
+    parser.add_argument("--genome-length", dest="genome_length", nargs="+",
+                        help="Lengths of the synthetic genomes, default is 10000.",
+                        type=int, default=[10000])
+
+    parser.add_argument("--seqs-per-lineage", dest="seqs_per_lineage", nargs="+",
+                        help="Numbers of sequences per lineage, default is 10.",
+                        type=int, default=[10])
+
+    parser.add_argument("--lineage-count", dest="lineage_count", nargs="+",
+                        help="Numbers of lineages (at least 2), default is 4.",
+                        type=int, default=[4])
+
+    parser.add_argument("--gap-density", dest="gap_density", nargs="+",
+                        help="Proportions of alignment columns with gaps (indels of single lineages), default is 0.01.",
+                        type=float, default=[0.01])
+
+    parser.add_argument("--repeat", dest="repeat",
+                        help="Repeats of each case with different seeds, default is 1.",
+                        type=int, default=1)
+
+    parser.add_argument("--seed", dest="seed",
+                        help="Seed of the first repeat, default is 0.",
+                        type=int, default=0)
+
+    parser.add_argument("-g", dest="gap", help="'-g' of VirusRecom, default is n.",
+                        type=str, default="n")
+
+    parser.add_argument("-m", dest="method", help="'-m' of VirusRecom, default is p.",
+                        type=str, default="p")
+
+    parser.add_argument("-w", dest="window", help="'-w' of VirusRecom, default is 100.",
+                        type=int, default=100)
+
+    parser.add_argument("-s", dest="step", help="'-s' of VirusRecom, default is 20.",
+                        type=int, default=20)
+
+    parser.add_argument("-mr", dest="max_region",
+                        help="'-mr' of VirusRecom, default is 100000 (larger than the planted region).",
+                        type=int, default=100000)
+
+    parser.add_argument("-cp", dest="percentage",
+                        help="'-cp' of VirusRecom, default is 0.9.",
+                        type=float, default=0.9)
+
+    parser.add_argument("-bw", dest="breakwin",
+                        help="'-bw' of VirusRecom, 0 skips the breakpoint scan, default is 200.",
+                        type=int, default=200)
+
+    parser.add_argument("--output-format", dest="output_format",
+                        help="'--output-format' of VirusRecom, default is xlsx.",
+                        type=str, default="xlsx")
+
+    parser.add_argument("--workers", dest="workers",
+                        help="'--workers' of VirusRecom, default is 1.",
+                        type=int, default=1)
+
+    parser.add_argument("--no-memory", dest="no_memory",
+                        help="Do not trace the memory of each stage, tracing slows the stages.",
+                        action="store_true")
+
+    parser.add_argument("-o", dest="outfile",
+                        help="FilePath of the JSON results, default is benchmark_<time>.json.",
+                        type=str, default="")
+
+    myargs = parser.parse_args(sys.argv[1:])
+
+    if min(myargs.lineage_count) < 2:
+        print("Error, at least 2 lineages are needed!")
+        exit()
+
+    outfile = myargs.outfile
+    if outfile == "":
+        outfile = "benchmark_" + str(time.time()).split(".")[0] + ".json"
+
+    benchmark = {"created": datetime.today().strftime("%Y-%m-%d %H:%M:%S"),
+                 "python": platform.python_version(),
+                 "numpy": np.__version__,
+                 "platform": platform.platform(),
+                 "options": {"gaps_use": myargs.gap,
+                             "method": myargs.method,
+                             "windows_size": myargs.window,
+                             "step_size": myargs.step,
+                             "max_recom_fragment": myargs.max_region,
+                             "recom_percentage": myargs.percentage,
+                             "breakwins": myargs.breakwin,
+                             "output_format": myargs.output_format,
+                             "workers": myargs.workers},
+                 "cases": []}
+
+    # libraries imported lazily by the stages are loaded before the timing
+    for module_name in ["pandas", "scipy.stats"]:
+        importlib.import_module(module_name)
+
+    lineage_pool = LineagePool(myargs.workers)
+
+    case_list = list(itertools.product(myargs.genome_length,
+                                       myargs.seqs_per_lineage,
+                                       myargs.lineage_count,
+                                       myargs.gap_density,
+                                       range(myargs.seed,
+                                             myargs.seed + myargs.repeat)))
+
+    try:
+        for n in range(len(case_list)):
+            genome_length, seqs_per_lineage, lineage_count, gap_density, seed = case_list[n]
+
+            print("Case " + str(n + 1) + "/" + str(len(case_list)) + ": "
+                  + "genome length " + str(genome_length)
+                  + ", sequences per lineage " + str(seqs_per_lineage)
+                  + ", lineages " + str(lineage_count)
+                  + ", gap density " + str(gap_density)
+                  + ", seed " + str(seed))
+
+            work_dir = tempfile.mkdtemp(prefix="virusrecom_benchmark_")
+
+            try:
+                case_result = run_case(work_dir, genome_length, seqs_per_lineage,
+                                       lineage_count, gap_density, seed,
+                                       myargs.gap, myargs.method, myargs.window,
+                                       myargs.step, myargs.max_region,
+                                       myargs.percentage, myargs.breakwin,
+                                       myargs.output_format, lineage_pool,
+                                       not myargs.no_memory)
+            finally:
+                shutil.rmtree(work_dir, ignore_errors=True)
+
+            for stage_name, stage in case_result["stages"].items():
+                print("  " + stage_name.ljust(16) + "%9.3f s" % stage["seconds"])
+
+            print("  oracle: major parent "
+                  + ("found" if case_result["oracle"]["major_parent_found"] else "missed")
+                  + ", Jaccard of region " + "%.3f" % case_result["oracle"]["jaccard"]
+                  + "\n")
+
+            benchmark["cases"].append(case_result)
+
+    finally:
+        # the finished cases are saved even if a case fails
+        lineage_pool.close()
+
+        benchmark["peak_rss_kb"] = peak_rss_kb()
+
+        with open(outfile, "w", encoding="utf-8") as benchmark_file:
+            json.dump(benchmark, benchmark_file, indent=2)
+
+        print("Results were saved in " + outfile)
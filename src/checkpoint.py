@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+
+"""
+Fingerprints of inputs and parameters, and the checkpoint directory that
+keeps the result of each finished stage for --resume.
+"""
+
+import os
+import re
+import json
+import hashlib
+
+import numpy as np
+
+
+# bump it when the meaning of a checkpoint changes
+CHECKPOINT_VERSION = "1"
+
+# larger files are fingerprinted by size and modification time, not content
+MAX_HASH_BYTES = 256 * 1024 * 1024
+
+
+def fingerprint(*parts):
+    """
+    Hash of the inputs and parameters of a stage
+    :param parts: str, numbers, lists, fingerprints of earlier stages or
+                  numpy arrays
+    :return: str
+    """
+    part_hash = hashlib.blake2b(digest_size=20)
+
+    part_hash.update(CHECKPOINT_VERSION.encode("utf-8"))
+
+    for each_part in parts:
+        if isinstance(each_part, np.ndarray):
+            part_hash.update(("|array" + str(each_part.shape)
+                              + each_part.dtype.str).encode("utf-8"))
+            part_hash.update(np.ascontiguousarray(each_part).tobytes())
+        else:
+            part_hash.update(("|" + repr(each_part)).encode("utf-8"))
+
+    return part_hash.hexdigest()
+
+
+def file_fingerprint(path):
+    """
+    Hash of the contents of a file, or of all files under a directory
+    :param path: filepath or dirpath
+    :return: str, "" if the path does not exist
+    """
+    if os.path.isdir(path):
+        part_list = []
+
+        for root, dir_list, file_list in os.walk(path):
+            dir_list.sort()
+
+            for each_file in sorted(file_list):
+                each_path = os.path.join(root, each_file)
+
+                part_list.append((os.path.relpath(each_path, path)
+                                  .replace("\\", "/"),
+                                  file_fingerprint(each_path)))
+
+        return fingerprint(part_list)
+
+    if not os.path.isfile(path):
+        return ""
+
+    file_size = os.path.getsize(path)
+
+    if file_size > MAX_HASH_BYTES:
+        return fingerprint("large file", file_size,
+                           os.stat(path).st_mtime_ns)
+
+    file_hash = hashlib.blake2b(digest_size=20)
+
+    with open(path, "rb") as input_file:
+        for chunk in iter(lambda: input_file.read(1 << 20), b""):
+            file_hash.update(chunk)
+
+    return file_hash.hexdigest()
+
+
+def _pack(value, array_dic):
+    # numpy arrays go to the .npz file, the rest is kept as json
+    if isinstance(value, np.ndarray):
+        array_name = "a" + str(len(array_dic))
+        array_dic[array_name] = value
+        return {"__array__": array_name}
+
+    if isinstance(value, tuple):
+        return {"__tuple__": [_pack(x, array_dic) for x in value]}
+
+    if isinstance(value, list):
+        return [_pack(x, array_dic) for x in value]
+
+    if isinstance(value, dict):
+        return {"__dict__": [[k, _pack(value[k], array_dic)] for k in value]}
+
+    if isinstance(value, np.generic):
+        return value.item()
+
+    return value
+
+
+def _unpack(value, array_file):
+    if isinstance(value, list):
+        return [_unpack(x, array_file) for x in value]
+
+    if isinstance(value, dict):
+        if "__array__" in value:
+            return array_file[value["__array__"]]
+
+        if "__tuple__" in value:
+            return tuple([_unpack(x, array_file) for x in value["__tuple__"]])
+
+        return dict([(k, _unpack(x, array_file)) for k, x in value["__dict__"]])
+
+    return value
+
+
+class Checkpoint(object):
+
+    def __init__(self, checkpoint_dir=None):
+        """
+        Results of the stages of a run, each one saved with the fingerprint
+        of its inputs and parameters. A stage whose fingerprint is unchanged
+        is loaded instead of computed when the run is resumed.
+        :param checkpoint_dir: dirpath of checkpoints, nothing is saved or
+                               loaded if it is None
+        """
+
+        super(Checkpoint, self).__init__()
+
+        self.checkpoint_dir = checkpoint_dir
+
+        # names of the stages loaded from checkpoints
+        self.hit_list = []
+
+        if checkpoint_dir is not None and not os.path.isdir(checkpoint_dir):
+            os.makedirs(checkpoint_dir)
+
+    def _path(self, name):
+        # names are marks chosen by users, the hash keeps the files apart
+        safe_name = re.sub(r"[^\w.-]", "_", name)
+
+        name_hash = hashlib.blake2b(name.encode("utf-8"),
+                                    digest_size=4).hexdigest()
+
+        return self.checkpoint_dir + "/" + safe_name + "_" + name_hash
+
+    def _read(self, name, stage_fingerprint):
+        if self.checkpoint_dir is None:
+            return None
+
+        checkpoint_path = self._path(name)
+
+        try:
+            with open(checkpoint_path + ".json", "r",
+                      encoding="utf-8") as info_file:
+                info = json.load(info_file)
+
+            if info["fingerprint"] != stage_fingerprint:
+                return None
+
+            if info["arrays"]:
+                with np.load(checkpoint_path + ".npz",
+                             allow_pickle=False) as npz_file:
+                    array_file = dict(npz_file)
+            else:
+                array_file = {}
+
+            value = _unpack(info["value"], array_file)
+
+        except (OSError, ValueError, KeyError):
+            return None
+
+        return value
+
+    def _hit(self, name):
+        self.hit_list.append(name)
+
+        print("The checkpoint of '" + name + "' is used." + "\n")
+
+    def load(self, name, stage_fingerprint):
+        """
+        :param name: name of the stage
+        :param stage_fingerprint: see fingerprint
+        :return: the saved value, None if there is no checkpoint of the
+                 stage or it was made from other inputs
+        """
+        value = self._read(name, stage_fingerprint)
+
+        if value is not None:
+            self._hit(name)
+
+        return value
+
+    def save(self, name, stage_fingerprint, value):
+        """
+        :param name: name of the stage
+        :param stage_fingerprint: see fingerprint
+        :param value: numpy arrays, str, numbers and lists, tuples or dicts
+                      of them
+        """
+        if self.checkpoint_dir is None:
+            return
+
+        checkpoint_path = self._path(name)
+
+        # the old checkpoint is invalid from now on, the json is written
+        # last so that a checkpoint is never read half written
+        if os.path.isfile(checkpoint_path + ".json"):
+            os.remove(checkpoint_path + ".json")
+
+        array_dic = {}
+
+        packed_value = _pack(value, array_dic)
+
+        if array_dic:
+            np.savez(checkpoint_path + ".tmp.npz", **array_dic)
+            os.replace(checkpoint_path + ".tmp.npz", checkpoint_path + ".npz")
+
+        with open(checkpoint_path + ".json.tmp", "w",
+                  encoding="utf-8") as info_file:
+            json.dump({"name": name,
+                       "fingerprint": stage_fingerprint,
+                       "arrays": len(array_dic),
+                       "value": packed_value},
+                      info_file)
+
+        os.replace(checkpoint_path + ".json.tmp", checkpoint_path + ".json")
+
+    def run(self, name, stage_fingerprint, func, *args):
+        """
+        :return: func(*args), loaded from the checkpoint of the stage if its
+                 fingerprint is unchanged, otherwise computed and saved
+        """
+        value = self.load(name, stage_fingerprint)
+
+        if value is None:
+            value = func(*args)
+
+            self.save(name, stage_fingerprint, value)
+
+        return value
+
+    def load_file(self, name, stage_fingerprint, file_path):
+        """
+        Checkpoint of a stage writing a file, it is only valid while the file
+        is the one written by the stage
+        :return: see load
+        """
+        saved = self._read(name, stage_fingerprint)
+
+        if saved is None or file_fingerprint(file_path) != saved["file"]:
+            return None
+
+        self._hit(name)
+
+        return saved["value"]
+
+    def save_file(self, name, stage_fingerprint, file_path, value=True):
+        """
+        :param file_path: filepath written by the stage
+        :param value: more results of the stage (see save), not None
+        """
+        self.save(name, stage_fingerprint, {"file": file_fingerprint(file_path),
+                                            "value": value})
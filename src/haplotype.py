@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+
+"""
+Collapses identical sequences of an alignment into weighted haplotypes.
+"""
+
+import numpy as np
+
+from seq_matrix import SeqMatrix
+
+
+def collapse_haplotypes(seq_matrix):
+    """
+    Keep one row per haplotype, identical sequences are counted in the
+    weights of the first one. Sequences are only merged when they also
+    match the same marks of seq_matrix.mark_index, so every lineage and
+    query keeps its own haplotypes; rows matching none of the marks are
+    dropped. The nucleotide counts weighted in this way are the same as
+    those of all sequences.
+    :param seq_matrix: SeqMatrix whose marks are indexed, see index_marks
+    :return: SeqMatrix of haplotypes with weights (multiplicity) and
+             members (names of the identical sequences), its marks are
+             indexed again, seq_matrix itself if no sequence is repeated
+    """
+    mark_index = seq_matrix.mark_index
+
+    row_marks = [[] for n in range(len(seq_matrix.names))]
+
+    mark_list = list(mark_index.rows)
+
+    for n in range(len(mark_list)):
+        for row in mark_index.rows[mark_list[n]].tolist():
+            row_marks[row].append(n)
+
+    weights = seq_matrix.weights
+    if weights is None:
+        weights = np.ones(len(seq_matrix.names), dtype=np.int64)
+
+    members = seq_matrix.members
+    if members is None:
+        members = [[x] for x in seq_matrix.names]
+
+    haplotype_row = {}
+
+    keep_row_list = []
+
+    haplotype_weights = []
+
+    haplotype_members = []
+
+    for row in range(len(seq_matrix.names)):
+        if row_marks[row] == []:
+            continue
+
+        # the bytes of the sequence are hashed by the dict, the marks are
+        # part of the key
+        key = (tuple(row_marks[row]), seq_matrix.matrix[row].tobytes())
+
+        if key in haplotype_row:
+            haplotype_weights[haplotype_row[key]] += int(weights[row])
+
+            haplotype_members[haplotype_row[key]].extend(members[row])
+
+        else:
+            haplotype_row[key] = len(keep_row_list)
+
+            keep_row_list.append(row)
+
+            haplotype_weights.append(int(weights[row]))
+
+            haplotype_members.append(list(members[row]))
+
+    if len(keep_row_list) == len(seq_matrix.names):
+        return seq_matrix
+
+    haplotype_matrix = SeqMatrix([seq_matrix.names[n] for n in keep_row_list],
+                                 seq_matrix.matrix[keep_row_list],
+                                 seq_matrix.sites,
+                                 seq_matrix.site_masks,
+                                 weights=np.array(haplotype_weights,
+                                                  dtype=np.int64),
+                                 members=haplotype_members)
+
+    haplotype_matrix.index_marks(mark_list, mark_index.match)
+
+    return haplotype_matrix
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+
+"""
+Process pool that runs per-lineage tasks on arrays in shared memory.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+# shared arrays attached in this process, {name: (SharedMemory, ndarray)}
+_attached_array = {}
+
+# arrays released by the pool are detached once the cache is full
+_max_attached = 8
+
+
+def attach_array(array_ref):
+    """
+    Get the array behind a reference returned by LineagePool.share
+    :param array_ref: ndarray, or (name, shape, dtype) of shared memory
+    :return: ndarray
+    """
+    if isinstance(array_ref, np.ndarray):
+        return array_ref
+
+    name, shape, dtype = array_ref
+
+    if name not in _attached_array:
+        if len(_attached_array) >= _max_attached:
+            _detach_array(next(iter(_attached_array)))
+
+        shm = shared_memory.SharedMemory(name=name)
+        _attached_array[name] = (shm, np.ndarray(shape, dtype=dtype,
+                                                 buffer=shm.buf))
+
+    return _attached_array[name][1]
+
+
+def _detach_array(name):
+    shm, array = _attached_array.pop(name)
+    del array
+
+    try:
+        shm.close()
+    except BufferError:
+        # a view of the array is still alive, it is closed with the process
+        pass
+
+
+class LineagePool(object):
+
+    def __init__(self, workers):
+        """
+        Process pool running the per-lineage tasks
+        :param workers: number of processes, run serially if it is 1
+        """
+
+        super(LineagePool, self).__init__()
+
+        self.workers = max(1, workers)
+
+        self.executor = None
+
+        if self.workers > 1:
+            self.executor = ProcessPoolExecutor(max_workers=self.workers)
+
+        self.shm_list = []
+
+    def share(self, array):
+        """
+        Put an array into shared memory, so that it is not pickled per task
+        :param array: ndarray
+        :return: reference of array, see attach_array
+        """
+        if self.executor is None:
+            return array
+
+        array = np.ascontiguousarray(array)
+
+        shm = shared_memory.SharedMemory(create=True,
+                                         size=max(1, array.nbytes))
+
+        np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+
+        self.shm_list.append(shm)
+
+        return (shm.name, array.shape, array.dtype.str)
+
+    def release(self, array_ref):
+        """
+        Free the shared memory of an array once no task needs it
+        :param array_ref: reference returned by share
+        """
+        if isinstance(array_ref, np.ndarray):
+            return
+
+        for shm in self.shm_list:
+            if shm.name == array_ref[0]:
+                shm.close()
+                shm.unlink()
+                self.shm_list.remove(shm)
+                break
+
+    def map(self, func, *iterables):
+        """
+        Run func over the tasks, results keep the order of tasks
+        :return: list
+        """
+        if self.executor is None:
+            return list(map(func, *iterables))
+
+        return list(self.executor.map(func, *iterables))
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+        for shm in self.shm_list:
+            shm.close()
+            shm.unlink()
+
+        self.shm_list = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
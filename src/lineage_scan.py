@@ -0,0 +1,435 @@
+# -*- coding: utf-8 -*-
+
+"""
+Window scan, recombination region search, Mann-Whitney U test and
+breakpoint scan on the WIC of all lineages at once.
+"""
+
+import numpy as np
+
+from lineage_pool import attach_array
+
+
+def scan_windows(wic_matrix, site_list, windows_size, step_size,
+                 wic_cumsum=None):
+    """
+    Mean WIC of all lineages in each sliding window, using the prefix sums
+    of WIC so that every window costs the same whatever the step size is
+    :param wic_matrix: 2-D array (lineages x sites) of WIC
+    :param site_list: original site of each column
+    :param wic_cumsum: see wic_prefix_sum, computed if it is None
+    :return: (2-D array (lineages x windows) of mean WIC,
+              1-D array of central position in alignment)
+    """
+    sites_count = wic_matrix.shape[1]
+
+    slid_number = int(sites_count / step_size)
+
+    start_row = step_size * np.arange(slid_number)
+
+    end_row = np.minimum(start_row + windows_size, sites_count)
+
+    # the scan stops at the first window reaching the last site
+    last_window = np.flatnonzero(end_row == sites_count)
+    if last_window.size > 0:
+        start_row = start_row[:last_window[0] + 1]
+        end_row = end_row[:last_window[0] + 1]
+
+    if wic_cumsum is None:
+        wic_cumsum = wic_prefix_sum(wic_matrix)
+
+    window_wic = ((wic_cumsum[:, end_row] - wic_cumsum[:, start_row])
+                  / (end_row - start_row)).astype(np.float64)
+
+    label_site = (start_row + end_row) // 2
+
+    return (window_wic, np.asarray(site_list)[label_site])
+
+
+def dominant_windows(window_wic, sites_count, windows_size, step_size,
+                     max_mic, recom_percentage):
+    """
+    Windows where a lineage has the highest mean WIC of all lineages and
+    mWIC / max_mic >= recom_percentage
+    :param window_wic: 2-D array (lineages x windows) of mean WIC
+    :param sites_count: number of sites scanned
+    :return: list (one per lineage) of list of window centers (site index)
+    """
+    window_count = window_wic.shape[1]
+
+    start_row = step_size * np.arange(window_count)
+
+    end_row = np.minimum(start_row + windows_size, sites_count)
+
+    windows_center = (start_row + end_row) // 2
+
+    if np.isnan(window_wic).any():
+        # max of a list skips nan only after the first value
+        window_max = np.array([max(window_wic[:, n].tolist())
+                               for n in range(window_count)])
+    else:
+        window_max = window_wic.max(axis=0)
+
+    dominant = ((window_wic == window_max)
+                & (window_wic / max_mic >= recom_percentage))
+
+    return [windows_center[x].tolist() for x in dominant]
+
+
+def wic_prefix_sum(wic_matrix):
+    """
+    Prefix sums of WIC of every lineage, the sum of WIC in sites
+    [a, b) is wic_cumsum[:, b] - wic_cumsum[:, a]. Extended precision
+    keeps the differences of prefix sums close to the sums site by site
+    :param wic_matrix: 2-D array (lineages x sites) of WIC
+    :return: 2-D longdouble array (lineages x (sites + 1))
+    """
+    wic_cumsum = np.zeros((wic_matrix.shape[0], wic_matrix.shape[1] + 1),
+                          dtype=np.longdouble)
+    np.cumsum(wic_matrix, axis=1, out=wic_cumsum[:, 1:])
+
+    return wic_cumsum
+
+
+def region_judgment(wic_matrix, lineage_n, region_left, region_right,
+                    max_mic, recom_percentage):
+    """
+    Whether the lineage dominates the region [region_left, region_right),
+    summing WIC site by site
+    """
+    region_sites_count = region_right - region_left + 1
+
+    lineage_Ri_wic = sum(wic_matrix[lineage_n][region_left:region_right].tolist())
+
+    max_lineage_ic = 0
+
+    for n in range(wic_matrix.shape[0]):
+        if n != lineage_n:
+            lineage_ic = sum(wic_matrix[n][region_left:region_right].tolist())
+            if lineage_ic >= max_lineage_ic:
+                max_lineage_ic = lineage_ic
+
+    return (lineage_Ri_wic > max_lineage_ic
+            and lineage_Ri_wic / (
+                    region_sites_count * max_mic) >= recom_percentage)
+
+
+def search_recom_region(wic_matrix, lineage_n, lineage_frag_list,
+                        step_size, max_mic, recom_percentage,
+                        max_recom_fragment, wic_cumsum=None):
+    """
+    Search the recombination regions of one lineage
+    :param wic_matrix: 2-D array (lineages x sites) of WIC
+    :param lineage_n: row of the lineage in wic_matrix
+    :param lineage_frag_list: centers of the windows dominated by the lineage
+    :param wic_cumsum: see wic_prefix_sum, computed if it is None
+    :return: list of [region_left, region_right]
+    """
+    detected_area = []
+
+    if lineage_frag_list == []:
+        return detected_area
+
+    sites_count = wic_matrix.shape[1]
+
+    if wic_cumsum is None:
+        wic_cumsum = wic_prefix_sum(wic_matrix)
+
+    other_rows = np.array([n for n in range(wic_matrix.shape[0])
+                           if n != lineage_n], dtype=np.intp)
+
+    # the sums from prefix sums may differ from the site by site sums in
+    # the last digits, judgments closer than this are summed again
+    total_wic = float(np.fmax.reduce(np.abs(wic_cumsum[:, -1])))
+    judge_tol = 1e-9 * (1 + (total_wic if np.isfinite(total_wic) else 0))
+
+    frag_array = np.asarray(lineage_frag_list, dtype=np.float64)
+
+    frag_count = len(lineage_frag_list)
+    # print(frag_count)
+
+    cursor_site = 1
+    cursor_center = lineage_frag_list[cursor_site -1]
+
+    while cursor_site <= frag_count:
+
+        Flage = False
+
+        breakpoint_judgment = []
+
+        # all regions from the cursor to each later center at once
+        region_left = max(0,int(cursor_center - step_size / 2))
+        region_right = np.minimum(
+            sites_count,
+            (frag_array[cursor_site - 1:] + step_size / 2).astype(np.int64))
+
+        region_sites_count = region_right - region_left + 1
+
+        # bounds of the slices [region_left:region_right]
+        slice_left = min(region_left, sites_count)
+        slice_right = np.maximum(region_right, slice_left)
+
+        lineage_Ri_wic = (wic_cumsum[lineage_n, slice_right]
+                          - wic_cumsum[lineage_n, slice_left]).astype(np.float64)
+
+        # fmax skips lineages without WIC (nan), as the site by site loop does
+        max_lineage_ic = np.zeros(slice_right.shape[0])
+        if other_rows.size > 0:
+            max_lineage_ic = np.fmax(
+                max_lineage_ic,
+                np.fmax.reduce(wic_cumsum[np.ix_(other_rows, slice_right)]
+                               - wic_cumsum[other_rows, slice_left][:, None],
+                               axis=0)).astype(np.float64)
+
+        eic = np.maximum(region_sites_count, 1) * max_mic
+
+        judgment = ((region_sites_count > 0)
+                    & (lineage_Ri_wic > max_lineage_ic)
+                    & (lineage_Ri_wic / eic >= recom_percentage))
+
+        uncertain = ((np.abs(lineage_Ri_wic - max_lineage_ic) <= judge_tol)
+                     | (np.abs(lineage_Ri_wic - recom_percentage * eic)
+                        <= judge_tol))
+
+        for k in np.flatnonzero(uncertain).tolist():
+            judgment[k] = region_judgment(wic_matrix, lineage_n, region_left,
+                                          int(region_right[k]), max_mic,
+                                          recom_percentage)
+
+        for k in np.flatnonzero(judgment).tolist():
+
+            breakpoint_judgment.append([cursor_site + k,region_left,
+                                        int(region_right[k]),
+                                        "True"])
+
+            Flage = True
+
+
+        if cursor_site ==frag_count:
+            break
+
+
+        if Flage == False:
+
+            cursor_site = cursor_site + 1
+
+            # print(cursor_site)
+            cursor_center = lineage_frag_list[cursor_site - 1]
+
+        else:
+
+            first_each_region = breakpoint_judgment[0]
+            first_ri = first_each_region[2] - first_each_region[1] + 1
+
+            if first_ri > max_recom_fragment:
+                cursor_site = cursor_site + 1
+                cursor_center = lineage_frag_list[cursor_site - 1]
+
+            else:
+
+                max_Ri = breakpoint_judgment[-1]
+                max_Ri_ri = max_Ri[2] - max_Ri[1] + 1
+
+                if max_Ri_ri <= max_recom_fragment:
+                    detected_area.append([max_Ri[1], max_Ri[2]])
+
+                    break
+
+                else:
+
+                    for n in range(len(breakpoint_judgment)):
+                        each_region = breakpoint_judgment[n]
+                        ri = each_region[2] - each_region[1] + 1
+
+                        if ri > max_recom_fragment:
+                            local_max_Ri = breakpoint_judgment[n-1]
+                            detected_area.append([local_max_Ri[1],
+                                                  local_max_Ri[2]])
+
+                            last_breakpoint = breakpoint_judgment[n-1][0]
+
+                            if last_breakpoint == cursor_site:
+                                cursor_site = cursor_site + 1
+                                cursor_center = lineage_frag_list[cursor_site - 1]
+
+                            else:
+                                cursor_site = last_breakpoint
+                                cursor_center = lineage_frag_list[cursor_site - 1]
+
+                            break
+
+    return detected_area
+
+
+def rank_rows(value_matrix):
+    """
+    Average ranks (ties share the mean rank) of the values in each row
+    :param value_matrix: 2-D array
+    :return: (2-D array of ranks in sorted order, 2-D array of the sorted
+              column of each rank, 2-D array of the tie group size of each rank)
+    """
+    rows, cols = value_matrix.shape
+
+    sort_index = np.argsort(value_matrix, axis=1, kind="mergesort")
+    sort_value = np.take_along_axis(value_matrix, sort_index, axis=1)
+
+    col_index = np.broadcast_to(np.arange(cols), (rows, cols))
+
+    new_group = np.ones((rows, cols), dtype=bool)
+    new_group[:, 1:] = sort_value[:, 1:] != sort_value[:, :-1]
+
+    group_end = np.ones((rows, cols), dtype=bool)
+    group_end[:, :-1] = new_group[:, 1:]
+
+    group_first = np.maximum.accumulate(np.where(new_group, col_index, 0),
+                                        axis=1)
+
+    group_last = np.minimum.accumulate(
+        np.where(group_end, col_index, cols - 1)[:, ::-1], axis=1)[:, ::-1]
+
+    rank = (group_first + group_last) / 2 + 1
+
+    return (rank, sort_index, group_last - group_first + 1)
+
+
+def mannwhitneyu_rows(left_matrix, right_matrix):
+    """
+    Two-sided p-value of Mann-Whitney U test between each pair of rows,
+    using the normal approximation with continuity and tie correction
+    (the same as scipy.stats.mannwhitneyu for samples larger than 8)
+    :param left_matrix: 2-D array, one sample per row
+    :param right_matrix: 2-D array, one sample per row
+    :return: 1-D array of p-value
+    """
+    # scipy is only loaded when a test runs
+    from scipy import special
+
+    n1 = left_matrix.shape[1]
+    n2 = right_matrix.shape[1]
+    n = n1 + n2
+
+    rank, sort_index, tie_size = rank_rows(
+        np.concatenate((left_matrix, right_matrix), axis=1))
+
+    R1 = (rank * (sort_index < n1)).sum(axis=1)
+    U1 = R1 - n1*(n1+1)/2
+    U2 = n1 * n2 - U1
+    U = np.maximum(U1, U2)
+
+    # the sum of t^3 - t over tie groups, counted once per member
+    tie_term = (tie_size**2 - 1).sum(axis=1)
+    s = np.sqrt(n1*n2/12 * ((n + 1) - tie_term/(n*(n-1))))
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        z = (U - n1 * n2 / 2 - 0.5) / s
+
+    p = special.ndtr(-z) * 2
+
+    return np.clip(p, 0, 1)
+
+
+def scan_breakpoint(lineage_wic, site_list, breakwins, chunk_size=4096):
+    """
+    -lg(p-value) of Mann-Whitney U test between the left and right half
+    of a window sliding by one site
+    :param lineage_wic: 1-D array, WIC of the lineage in every site
+    :param site_list: original site of each row
+    :param breakwins: window size
+    :param chunk_size: number of windows tested together
+    :return: (list of central position in alignment, list of -lg(p-value))
+    """
+    half_win = breakwins // 2
+
+    run_number = lineage_wic.shape[0] - breakwins + 1
+
+    # small samples may use the exact test in scipy, keep it
+    if half_win - 1 <= 8 or breakwins - half_win - 1 <= 8:
+        return scan_breakpoint_each(lineage_wic, site_list, breakwins)
+
+    if run_number <= 0:
+        return ([], [])
+
+    win_matrix = np.lib.stride_tricks.sliding_window_view(lineage_wic,
+                                                          breakwins)
+
+    negative_lg_p_list = []
+
+    for start in range(0, run_number, chunk_size):
+        chunk_win = win_matrix[start:start + chunk_size]
+
+        p_value = mannwhitneyu_rows(chunk_win[:, :half_win - 1],
+                                    chunk_win[:, half_win + 1:])
+
+        with np.errstate(divide="ignore"):
+            negative_lg_p_list.extend((- np.log10(p_value)).tolist())
+
+    central_pos_list = list(site_list[half_win:half_win + run_number])
+
+    return (central_pos_list, negative_lg_p_list)
+
+
+def scan_breakpoint_each(lineage_wic, site_list, breakwins):
+    """
+    scan_breakpoint calling scipy.stats.mannwhitneyu for every window
+    """
+    import scipy.stats as stats
+
+    run_number = lineage_wic.shape[0] - breakwins + 1
+
+    central_pos_list = []
+    negative_lg_p_list = []
+
+    for i in range (run_number):
+        start_site = i
+        end_site = i + breakwins
+
+        central_pos = int((start_site + end_site) / 2)
+
+
+        left_region  = list(lineage_wic[start_site: central_pos-1])
+        right_region = list(lineage_wic[central_pos + 1: end_site])
+
+        central_pos_list.append(site_list[central_pos])
+
+
+        try:
+
+            zihe_test = stats.mannwhitneyu(left_region,right_region,
+                                           alternative="two-sided")
+            p_value = zihe_test[1]
+            negative_lg_p = - np.log10(p_value)
+            negative_lg_p_list.append(negative_lg_p)
+
+        except:
+            negative_lg_p = 0
+            negative_lg_p_list.append(negative_lg_p)
+
+        finally:
+            pass
+
+    return (central_pos_list, negative_lg_p_list)
+
+
+def search_recom_region_task(wic_ref, lineage_n, lineage_frag_list,
+                             step_size, max_mic, recom_percentage,
+                             max_recom_fragment, wic_cumsum_ref=None):
+    """
+    Task of LineagePool, search_recom_region on the shared WIC matrix
+    and its shared prefix sums
+    """
+    wic_cumsum = None
+    if wic_cumsum_ref is not None:
+        wic_cumsum = attach_array(wic_cumsum_ref)
+
+    return search_recom_region(attach_array(wic_ref), lineage_n,
+                               lineage_frag_list, step_size, max_mic,
+                               recom_percentage, max_recom_fragment,
+                               wic_cumsum)
+
+
+def scan_breakpoint_task(wic_ref, lineage_n, site_list, breakwins):
+    """
+    Task of LineagePool, scan_breakpoint on a row of the shared WIC matrix
+    """
+    return scan_breakpoint(attach_array(wic_ref)[lineage_n], site_list,
+                           breakwins)
@@ -12,28 +12,24 @@ Time: 2022/4/17 17:29
 import sys
 import os
 
-import pandas as pd
-import numpy as np
 import platform
 import argparse
 import time
-import matplotlib
+from datetime import datetime
 
-matplotlib.use("agg")
+startup_time = time.perf_counter()
 
-import matplotlib.pyplot as plt
-import scipy.stats as stats
-from datetime import datetime
+from startup_profile import StartupProfile
+
+from run_report import RunReport
 
-# plt.style.use("ggplot")
+from table_writer import check_table_format
 
-from my_func import (resolve_file_path,get_all_path,
-                     read_seq, calEnt, calEnt_gap,
-                     make_dir)
+from wic_plot import (FigurePlotter, PLOT_FORMATS)
 
-from plt_corlor_list import plt_corlor
+from mark_index import MARK_MATCH
 
-from sequence_align import SeqAlign
+from sweep_values import parse_sweep_values
 
 app_dir = os.path.dirname(os.path.dirname(os.path.abspath(sys.argv[0])))
 if platform.system().lower() == "windows":
@@ -51,6 +47,9 @@ example_use  = r'''
   (2) If the input-sequence has been aligned:
       VirusRecom -a alignment.fasta -q XE_ -l lineage_name_list.txt -g n -m p -w 100 -s 20           
 
+  (3) Scan many queries against the same reference lineages in one run:
+      VirusRecom -a alignment.fasta --query-list query_name_list.txt -l lineage_name_list.txt -g n -m p -w 100 -s 20
+
 -----------------------------------------------------
 
 '''
@@ -84,7 +83,7 @@ if __name__ == "__main__":
 
         parser.add_argument(
             "-a", dest="alignment",
-            help="FilePath of an aligned sequence set(*.fasta format) containing all sequences used for analysis, then the alignment will be skipped. Default is null. If using, name of each sequence in aligned sequence set requires containing the mark(a unique string) of the lineage.",
+            help="FilePath of an aligned sequence set(*.fasta format) containing all sequences used for analysis, then the alignment will be skipped. It can also be the DirPath of a store made by 'python seq_store.py -a alignment.fasta -o store', then only the sequences matching the marks of the query and lineages are read. Default is null. If using, name of each sequence in aligned sequence set requires containing the mark(a unique string) of the lineage. The sequences may contain A, C, G, T, U, gaps (-), N and the IUPAC ambiguity codes only.",
             default="")
 
 
@@ -94,12 +93,36 @@ if __name__ == "__main__":
             default = "")
 
 
+        parser.add_argument(
+            "--query-list", dest="query_list",
+            help = "FilePath of a text file listing many queries (one per line) which are scanned against the same reference lineages in one run, each query gets its own result directory. Lines are FilePaths of query lineages (*.fasta format), or marks of queried recombinants if the '-a alignment' has been used. Replaces '-q'.",
+            default = "")
+
+
         parser.add_argument(
             "-l", dest="lineage",
             help = "DirPath of reference lineages. One sequence file (*.fasta format) per lineage, and each lineage could contain multiple sequences. Note, if the '-a alignment' has been used, please enter a text file containing the marks (a unique string) of lineages here, not a DirPath.",
             default = "")
 
 
+        parser.add_argument(
+            "--mark-match", dest="mark_match",
+            help = "How the marks of lineages and queries are matched with the sequence names, 'contains': the mark is found anywhere in the name as a regular expression (as before), 'substring': the mark is found literally anywhere in the name, 'prefix': the name starts with the mark. A warning is printed if two marks match the same sequences. Default is contains.",
+            type = str, default = "contains")
+
+
+        parser.add_argument(
+            "--no-collapse", dest="no_collapse",
+            help = "Do not collapse identical sequences of a lineage (or query) into one weighted haplotype before the calculation. The results are the same either way, collapsing saves time and memory when many sequences are identical.",
+            action = "store_true")
+
+
+        parser.add_argument(
+            "--per-sequence", dest="per_sequence",
+            help = "Scan every sequence matching the query mark on its own instead of their consensus, and write one summary table (major parent, other parents, recombination regions and significance of each sequence). The tables and figures of sites, windows and breakpoints are not written in this mode.",
+            action = "store_true")
+
+
         parser.add_argument("-g", dest="gap",
                             help="Gaps (-) in the alignment were used in analysis? '-g y': reserve gaps, '-g n': delete gaps.",
                             type=str,
@@ -133,6 +156,26 @@ if __name__ == "__main__":
                             type=float,
                             default=0.9)
 
+        parser.add_argument(
+            "--sweep-w", dest="sweep_window",
+            help = "Sweep mode, values of '-w' to try, given as a list '50,100,200' or a range '50:200:50' (the stop is included). The same for '--sweep-s', '--sweep-mr' and '--sweep-cp', every combination is scanned from one calculation of the WIC of sites, and a summary table (major parent, regions and p-values of each combination) is written instead of the usual tables and figures. A parameter without sweep values keeps its single value.",
+            type = str, default = "")
+
+        parser.add_argument(
+            "--sweep-s", dest="sweep_step",
+            help = "Sweep mode, values of '-s' to try, see '--sweep-w'.",
+            type = str, default = "")
+
+        parser.add_argument(
+            "--sweep-mr", dest="sweep_max_region",
+            help = "Sweep mode, values of '-mr' to try, see '--sweep-w'.",
+            type = str, default = "")
+
+        parser.add_argument(
+            "--sweep-cp", dest="sweep_percentage",
+            help = "Sweep mode, values of '-cp' to try (greater than 0 and at most 1), see '--sweep-w'.",
+            type = str, default = "")
+
 
         parser.add_argument("-b", dest="breakpoint",
                             help="Whether to run the breakpoint scan of recombination. ‘-b y’: yes, ‘-b n’: no. Note: this option only takes effect when '-m p' has been specified!",
@@ -151,6 +194,76 @@ if __name__ == "__main__":
             type = int,
             default = 1)
 
+        parser.add_argument(
+            "--ref-msa", dest="ref_msa",
+            help = "DirPath keeping a versioned alignment of the reference lineages in '-l'. The query sequences are added to it (MAFFT --add --keeplength) instead of aligning all sequences again, the reference alignment is only rebuilt when the lineage files change. Default is null (align all sequences).",
+            default = "")
+
+        parser.add_argument(
+            "--add-fragments", dest="add_fragments",
+            help = "The query sequences are fragments, add them with MAFFT --addfragments. Note: this option only takes effect when '--ref-msa' has been specified!",
+            action = "store_true")
+
+        parser.add_argument(
+            "--align-timeout", dest="align_timeout",
+            help = "The maximum running time (seconds) of each MAFFT alignment, MAFFT is stopped beyond it. Default is 0 (no limit).",
+            type = int,
+            default = 0)
+
+        parser.add_argument(
+            "--workers", dest="workers",
+            help = "Number of processes used for the per-lineage calculations (WIC, sliding window, recombination region and breakpoint scan), default is 1.",
+            type = int,
+            default = 1)
+
+        parser.add_argument(
+            "--cache-dir", dest="cache_dir",
+            help = "DirPath of the cache of reference-lineage statistics (per-site information content and nucleotide frequency). Repeat runs with the same lineages and options load them from the cache. Default is null (no cache).",
+            default = "")
+
+        parser.add_argument(
+            "--cache-size", dest="cache_size",
+            help = "The maximum size (MB) of the cache, the least recently used lineages are deleted beyond it, default is 2048.",
+            type = int,
+            default = 2048)
+
+        parser.add_argument(
+            "--resume", dest="resume",
+            help = "DirPath of the results (result_<run id>) of an earlier run to resume. Its stages (merged and aligned sequences, masks of sites, WIC of sites, sliding windows, recombination regions and breakpoint scan) are loaded from the checkpoints in run_record when their inputs and parameters are unchanged, the others are computed again. Default is null (a new run).",
+            default = "")
+
+        parser.add_argument(
+            "--output-format", dest="output_format",
+            help = "Format of the result tables (WIC in sites, WIC in sliding windows and -lg(p-value) of breakpoint scan). 'xlsx': Excel workbook, 'csv' or 'tsv': plain text, 'parquet' or 'arrow': columnar files that can be read lazily (requires pyarrow). Default is xlsx.",
+            type = str,
+            default = "xlsx")
+
+        parser.add_argument(
+            "--plot-format", dest="plot_format",
+            help = "Format of the figures, 'pdf' or 'png'. The points of long series are reduced to the pixel width of the figure and drawn rasterized. Default is pdf.",
+            type = str,
+            default = "pdf")
+
+        parser.add_argument(
+            "--no-plots", dest="no_plots",
+            help = "Do not draw any figure, only the tables and the report are written.",
+            action = "store_true")
+
+        parser.add_argument(
+            "--plot-background", dest="plot_background",
+            help = "Draw the figures in a background process while the calculations continue.",
+            action = "store_true")
+
+        parser.add_argument(
+            "--trace", dest="trace",
+            help = "Also write the stages of the run as a Chrome trace (Trace_<run id>.json in run_record), which can be opened in chrome://tracing or https://ui.perfetto.dev. The JSON run report with time, CPU time and memory of each stage is always written.",
+            action = "store_true")
+
+        parser.add_argument(
+            "--profile-startup", dest="profile_startup",
+            help = "Print the time of each startup step (argument parsing and imports of modules) before the calculations start.",
+            action = "store_true")
+
         parser.add_argument(
             "-y", dest="y_start",
             help="Specify the starting value of the Y axis in the picture, the default is 0.",
@@ -161,6 +274,10 @@ if __name__ == "__main__":
 
         return myargs
 
+    startup_profile = StartupProfile(startup_time)
+
+    startup_profile.mark("standard library")
+
     myargs = parameter()
 
 
@@ -174,6 +291,8 @@ if __name__ == "__main__":
 
     query_seq_path = myargs.query
 
+    query_list_path = myargs.query_list       # file of queries in batch mode
+
     lineage_file_dir = myargs.lineage
 
     gaps_use = myargs.gap                     #  strategy of handling gap
@@ -194,817 +313,447 @@ if __name__ == "__main__":
 
     thread_num = myargs.thread                #  thread of MAS
 
-    y_start = myargs.y_start                  #  Y-axis starting point when plotting
-
-    # 处理不正确的输入
-
-    if gaps_use.upper() not in ["N","Y"]:
-        print("Error, the parameter after '-g' is incorrect!")
-        exit()
-
-    if method.upper() not in ["P","A"]:
-        print("Error, the parameter after '-m' is incorrect!")
-        exit()
-
-    print("\n" + "VirusRecom is running..." + "\n")
-
+    ref_msa_dir = myargs.ref_msa              #  versioned reference alignment
 
-    aligned_out_path = ""
-
-    out_dir = ""
+    add_fragments = myargs.add_fragments      #  queries are fragments
 
-    query_seq_prefix = ""
-
-    run_record = ""
-
-    lineage_name_list = []
+    align_timeout = myargs.align_timeout      #  time limit (s) of MAFFT
 
+    workers = myargs.workers                  #  processes of per-lineage calculations
 
+    y_start = myargs.y_start                  #  Y-axis starting point when plotting
 
-    if seq_aligned_path == "":
+    cache_dir = myargs.cache_dir              #  cache of reference-lineage statistics
 
+    cache_size = myargs.cache_size            #  maximum size (MB) of the cache
 
-        query_seq_path = query_seq_path.replace("\\", "/")
+    resume_dir = myargs.resume.replace("\\", "/").rstrip("/")   #  results to resume
 
-        query_seq_dir, query_seq_prefix = resolve_file_path(query_seq_path)
+    output_format = myargs.output_format.lower()   #  format of result tables
 
-        out_dir = query_seq_dir + "/" + "result_" + run_id
+    plot_format = myargs.plot_format.lower()  #  format of figures
 
-        run_record = out_dir + "/" + "run_record"
+    if myargs.no_plots:
+        plot_format = "none"
 
-        make_dir(out_dir)
-        make_dir(run_record)
-
-        aligned_out_path = (run_record + "/" + query_seq_prefix
-                            + "_" + run_id + "_merge_mafft.fasta")
+    plot_background = myargs.plot_background  #  draw figures in background
 
+    mark_match = myargs.mark_match.lower()    #  how marks match the names
 
-        seq_align_task = SeqAlign(query_seq_path,
-                                  lineage_file_dir,
-                                  run_record,
-                                  run_id,
-                                  thread_num,
-                                  aligned_out_path)
+    collapse = not myargs.no_collapse         #  collapse identical sequences
 
-        lineage_name_list = seq_align_task.run()
+    per_sequence = myargs.per_sequence        #  scan each query sequence
 
+    sweep_text_list = [myargs.sweep_window, myargs.sweep_step,
+                       myargs.sweep_max_region, myargs.sweep_percentage]
 
+    sweep = any([x != "" for x in sweep_text_list])   #  parameter sweep
 
-    else:
-
-        aligned_out_path = seq_aligned_path.replace("\\", "/")
+    # 处理不正确的输入
 
-        input_dir, input_prefix = resolve_file_path(aligned_out_path)
+    if gaps_use.upper() not in ["N","Y"]:
+        print("Error, the parameter after '-g' is incorrect!")
+        exit()
 
-        out_dir = input_dir + "/" + "result_" + run_id
+    if method.upper() not in ["P","A"]:
+        print("Error, the parameter after '-m' is incorrect!")
+        exit()
 
-        run_record = out_dir + "/" + "run_record"
+    table_format_error = check_table_format(output_format)
+    if table_format_error != "":
+        print("Error, " + table_format_error + "!")
+        exit()
 
-        make_dir(out_dir)
-        make_dir(run_record)
+    if plot_format not in PLOT_FORMATS + ["none"]:
+        print("Error, the parameter after '--plot-format' is incorrect!")
+        exit()
 
+    if mark_match not in MARK_MATCH:
+        print("Error, the parameter after '--mark-match' is incorrect!")
+        exit()
 
-        query_seq_prefix = query_seq_path
+    if sweep and per_sequence:
+        print("Error, '--per-sequence' and the sweep options can not be used together!")
+        exit()
 
+    sweep_value_list = [[windows_size], [step_size], [max_recom_fragment],
+                        [recom_percentage]]
 
-        with open(lineage_file_dir) as lineage_file:
-            for line in lineage_file:
+    if sweep:
+        try:
+            for n, value_type in enumerate([int, int, int, float]):
+                if sweep_text_list[n] != "":
+                    sweep_value_list[n] = parse_sweep_values(sweep_text_list[n],
+                                                             value_type)
+
+        except ValueError as sweep_error:
+            print("Error, the values of the sweep are incorrect, "
+                  + str(sweep_error) + "!")
+            exit()
+
+        if min([min(x) for x in sweep_value_list]) <= 0:
+            print("Error, the values of the sweep must be greater than 0!")
+            exit()
+
+        if max(sweep_value_list[3]) > 1:
+            print("Error, the values of '--sweep-cp' must be greater than 0 and at most 1!")
+            exit()
+
+    if resume_dir != "":
+        if (not os.path.basename(resume_dir).startswith("result_")
+                or not os.path.isdir(resume_dir + "/run_record")):
+            print("Error, the directory after '--resume' is not the result of a run!")
+            exit()
+
+        # the files of the resumed run keep their names
+        run_id = os.path.basename(resume_dir)[len("result_"):]
+
+    query_path_list = [query_seq_path]
+
+    if query_list_path != "":
+        query_path_list = []
+        with open(query_list_path) as query_list_file:
+            for line in query_list_file:
                 line = line.strip()
                 if line != "":
-                    lineage_name_list.append(line)
-
-
-
-    site_dir = out_dir + "/" + "WICs of sites"
-
-    slide_window_dir = out_dir + "/" + "WICs of slide_window"
-
-    make_dir(site_dir)
-    make_dir(slide_window_dir)
-
-
-    site_ic_table = (site_dir + "/" + run_id + "_"
-                     + query_seq_prefix
-                     + "_WIC contribution from lineage in sites" + ".xlsx")
-
-    site_ic_fig = (site_dir + "/" + run_id + "_"
-                   + query_seq_prefix
-                   + "_WIC contribution from lineage in sites" + ".pdf")
-
-    window_ic_table = (slide_window_dir + "/" + run_id + "_"
-                       + query_seq_prefix
-                       + "_WIC contribution from lineage in sliding window"
-                       + ".xlsx")
-
-    window_ic_fig = (slide_window_dir + "/" + run_id + "_"
-                     + query_seq_prefix
-                     + "_WIC contribution from lineage in sliding window"
-                     + run_id + ".pdf")
-
-
-
-    print("VirusRecom starts calculating weighted information content from each lineage..."
-          + "\n")
-
-    seq_pd = read_seq(aligned_out_path)
-
-
-
-    seq_pd_clean = seq_pd    
-    calEnt_use = calEnt_gap   
-    max_mic = np.log2(5)     
-
-
-    if gaps_use.upper() == "N": 
-
-        all_site_label = list(seq_pd.columns)
-
-        seq_pd_clean = seq_pd[~seq_pd.isin(["-"])].dropna(axis=1) 
-        calEnt_use = calEnt  
-        max_mic = 2
-
-
-
-        record_gap_path = (run_record + "/"
-                          + "Record of deleted gap sites_" + run_id + ".txt")
-
-        seq_pd_clean_site = list(seq_pd_clean.columns)
-
-        with open(record_gap_path, "w",encoding="utf-8") as record_gap_file:
-
-            record_gap_file.write("These sites with gap(-) in the file of "
-                                  + aligned_out_path + "\n")
-
-            for each_site in all_site_label:
-                if each_site not in seq_pd_clean_site:
-                    record_gap_file.write("Site " + each_site + "\n")
-
-
-    if method.upper() == "P": 
-
-        seq_pd_clean_site_old = list(seq_pd_clean)
-
-        seq_pd_clean = seq_pd_clean.loc[:, (seq_pd_clean != seq_pd_clean.iloc[0]).any()]
-
-
-        seq_pd_clean_site_new = list(seq_pd_clean)
-
-        record_same_sites_path = (run_record + "/"
-                           + "Record of same sites in aligned sequence_"
-                           + run_id + ".txt")
-
-        with open(record_same_sites_path, "w", encoding="utf8") as same_sites_file:
-            same_sites_file.write("These same sites(no variation) in the file of "
-                                  + aligned_out_path + "\n")
-
-            for each_site in seq_pd_clean_site_old:
-                if each_site not in seq_pd_clean_site_new:
-                    same_sites_file.write("Site " + each_site + "\n")
-
-
-    sites_probability_data = pd.DataFrame() 
-
-    query_seq = seq_pd_clean[seq_pd_clean.index.str.contains(query_seq_prefix) == True]
-    
-    query_seq_count = query_seq.shape[0] 
-    
-
-    site_list = []
-
-
-    for each_lineage in lineage_name_list:
-
-        site_list = []
-
-        lineage_seq_df = seq_pd_clean[seq_pd_clean.index.str.contains(each_lineage) == True]
-
-
-        ent_probability = [] 
-
-        p_ent = 0 
-
-
-        for (columnName, columnData) in lineage_seq_df.iteritems():
-  
-            site_list.append(int(columnName))
-
-            lineage_site = list(columnData) 
-
-            IC = calEnt_use(columnData)
-
-            if query_seq_count == 1: 
-                query_nt = query_seq[columnName][0]  
-                query_nt_ratio = 1
-
-                query_nt_lineage_ratio = lineage_site.count(query_nt) / columnData.shape[0]
-
-                p_ent = query_nt_lineage_ratio * IC  * query_nt_ratio
-
-                ent_probability.append(p_ent)
-
-
-            else:
-
-                query_seq_site_list = list(query_seq[columnName])
-
-                query_seq_site_count = len(query_seq_site_list)
-
-                maxpro_nt = max(query_seq_site_list, key=query_seq_site_list.count)
-
-                query_nt_ratio = query_seq_site_list.count(maxpro_nt) / query_seq_site_count
-
-
-                query_nt_lineage_ratio = lineage_site.count(maxpro_nt) / columnData.shape[0] 
-
-                p_ent = query_nt_lineage_ratio * IC * query_nt_ratio 
-
-                ent_probability.append(p_ent)
+                    query_path_list.append(line)
 
+    if query_path_list == [] or "" in query_path_list:
+        print("Error, the query after '-q' or '--query-list' is missing!")
+        exit()
 
-        sites_probability_data["Site"] = site_list
-        sites_probability_data[each_lineage] = ent_probability
-
-        print(each_lineage + "'s calculation has been completed!" + "\n")
-
-
-    sites_probability_data.to_excel(excel_writer=site_ic_table,
-                                      index=False,
-                                      encoding="utf-8")
-
-
- 
-
-    lineage_count = len(lineage_name_list)
-
-    fig_high = int(max(site_list) * 3 / 10000) * 2
-
-
-    fig, ax =  plt.subplots(len(lineage_name_list), 1,
-                            figsize=(lineage_count,fig_high)) 
-
-    fig.suptitle("Query seq: " + query_seq_prefix,family="Arial")
-    fig.tight_layout()
-
-    cm1 = plt.cm.get_cmap("Reds")
-    plt.subplots_adjust(top=0.95)
-
-
-    for n in range(lineage_count):
-        each_lineage = lineage_name_list[n]
-        ax_n = ax[n]
-        y =  list(sites_probability_data[each_lineage])
-        xx = ax_n.scatter(site_list,y,c=y,
-                     label=each_lineage,s=5,
-                     cmap=cm1)
-
-        fig.colorbar(xx, ax = ax_n)
-
-        ax_n.set_ylabel("WIC",family="Arial")
-
-        ax_n.legend(loc="best")
+    startup_profile.mark("argument parsing and checks")
 
-        x1_label = ax_n.get_xticklabels()
-        [x1_label_temp.set_fontname("Arial") for x1_label_temp in
-         x1_label]
-        y1_label = ax_n.get_yticklabels()
-        [y1_label_temp.set_fontname("Arial") for y1_label_temp in
-         y1_label]
+    # the modules of calculations are imported once the arguments are
+    # checked, so that '-h' and wrong arguments return quickly
+    from sequence_align import (SeqAlign, RefAlign)
 
+    from checkpoint import (Checkpoint, fingerprint, file_fingerprint)
 
+    startup_profile.mark("alignment modules")
 
-    plt.xlabel("Site in alignment",family="Arial")
- 
+    from my_func import (resolve_file_path, make_dir)
 
-    plt.savefig(site_ic_fig)
-    plt.clf() 
+    from site_filter import SiteFilter
 
+    from stat_cache import LineageStatCache
 
-    print("VirusRecom starts scanning using sliding window ..." + "\n")
+    from lineage_pool import LineagePool
 
+    from virusrecom import (load_alignment, reference_stats,
+                            collapse_haplotypes)
 
+    startup_profile.mark("site filter and WIC modules")
 
-    sites_count = sites_probability_data.shape[0]
+    from recom_scan import RecomScan
 
-    step_probability_data = pd.DataFrame()
+    from sequence_scan import SequenceScan
 
+    from param_sweep import ParamSweep
 
-    slid_number = int(sites_count / step_size)
+    startup_profile.mark("recombination scan modules")
 
-    original_site_list = []
+    if myargs.profile_startup:
+        print(startup_profile.report())
 
+    run_report = RunReport(myargs.trace)
 
-    original_site_in_win = {}
+    print("\n" + "VirusRecom is running..." + "\n")
 
 
-    for each_lineage in lineage_name_list:
+    aligned_out_path = ""
 
-        each_lineage_setp_pro = []
+    out_dir = ""
 
-        lineage_ic_df = sites_probability_data[each_lineage]
+    query_seq_prefix = ""
 
-        original_site_list = []
+    query_prefix_list = []
 
+    run_record = ""
 
-        for n in range(slid_number):
+    lineage_name_list = []
 
-            start_row = step_size * n
 
-            end_row = min(start_row + windows_size, sites_count)
 
-            step_df = list(lineage_ic_df[start_row:end_row])
+    if seq_aligned_path == "":
 
 
-            mean_ic_per_win = np.mean(step_df)
+        query_path_list = [x.replace("\\", "/") for x in query_path_list]
 
+        for each_path in query_path_list:
+            query_seq_dir, each_prefix = resolve_file_path(each_path)
+            query_prefix_list.append(each_prefix)
 
-            each_lineage_setp_pro.append(mean_ic_per_win)
+        query_seq_dir, query_seq_prefix = resolve_file_path(query_path_list[0])
 
+        if query_list_path != "":
+            query_seq_dir = os.path.dirname(query_list_path.replace("\\", "/"))
 
-            label_site = int((start_row + end_row) / 2)
+        out_dir = query_seq_dir + "/" + "result_" + run_id
 
-            original_site = sites_probability_data.loc[label_site, "Site"]
+        if resume_dir != "":
+            out_dir = resume_dir
 
-            original_site_list.append(original_site)
+        run_record = out_dir + "/" + "run_record"
 
-            if end_row == sites_count:
-                break
+        make_dir(out_dir)
+        make_dir(run_record)
 
-        step_probability_data["Central position"] = original_site_list
-        step_probability_data[each_lineage] = each_lineage_setp_pro
+        checkpoint = Checkpoint(run_record + "/" + "checkpoint")
 
-        print(each_lineage + "'s scan has been completed!" + "\n")
+        aligned_out_path = (run_record + "/" + query_seq_prefix
+                            + "_" + run_id + "_merge_mafft.fasta")
 
 
-    step_probability_data.to_excel(
-        excel_writer=window_ic_table,
-        index=False,
-        encoding="utf-8")
+        if ref_msa_dir == "":
+            seq_align_task = SeqAlign(query_path_list,
+                                      lineage_file_dir,
+                                      run_record,
+                                      run_id,
+                                      thread_num,
+                                      aligned_out_path,
+                                      timeout=align_timeout or None,
+                                      run_report=run_report,
+                                      checkpoint=checkpoint)
 
+        else:
+            seq_align_task = RefAlign(query_path_list,
+                                      lineage_file_dir,
+                                      ref_msa_dir,
+                                      run_record,
+                                      run_id,
+                                      thread_num,
+                                      aligned_out_path,
+                                      add_fragments,
+                                      timeout=align_timeout or None,
+                                      run_report=run_report,
+                                      checkpoint=checkpoint)
 
-    fig, ax = plt.subplots()
-    ax.spines["right"].set_visible(False)
-    ax.spines["top"].set_visible(False)
+        with run_report.stage("alignment", queries=len(query_path_list)):
+            lineage_name_list = seq_align_task.run()
 
-    if gaps_use.upper() == "N":
 
-        plt.ylim((y_start, 2))
 
     else:
-        plt.ylim((y_start, 2.5))
-
-
-
-    for n in range(len(lineage_name_list)):
-        each_lineage = lineage_name_list[n]
-
-        try:
-            plt.plot(original_site_list, list(step_probability_data[each_lineage]),
-                 label=each_lineage,color=plt_corlor[n],linewidth=1)
-        except:
-            plt.plot(original_site_list,
-                     list(step_probability_data[each_lineage]),
-                     label=each_lineage, color="black",linewidth=1)
-        finally:
-            pass
-
-
-    plt.legend()
-
-    plt.margins(0)
-    plt.subplots_adjust(bottom=0.10)
-    plt.xlabel("Site in alignment",family="Arial")
-    plt.ylabel("Mean of weighted information content",family="Arial")
-    plt.title("Query seq: " + query_seq_prefix,family="Arial")
-
-
-    x1_label = ax.get_xticklabels()
-    [x1_label_temp.set_fontname("Arial") for x1_label_temp in
-     x1_label]
-    y1_label = ax.get_yticklabels()
-    [y1_label_temp.set_fontname("Arial") for y1_label_temp in
-     y1_label]
-
-
-    plt.savefig(window_ic_fig)
-
-    plt.clf()
-
-
-    recombination_frag = {} 
-
-
-    for each_lineage in lineage_name_list:
-
-
-        if not recombination_frag.__contains__(each_lineage):
-            recombination_frag[each_lineage] = []
-
-        potential_frag_list =[]
-
-        linegae_data_list = list(step_probability_data[each_lineage])
-
-        for n in range(len(linegae_data_list)):
-
-            start_row = step_size * n
-
-            end_row = min(start_row + windows_size, sites_count)
-
-            line_ic_all = list(step_probability_data.iloc[n, 1:])
-
-            if (linegae_data_list[n] == max(line_ic_all)
-                 and linegae_data_list[n] / max_mic >= recom_percentage):
-
-
-                windows_center = int((start_row + end_row)/ 2)
-
-                potential_frag_list.append(windows_center)
-
-        recombination_frag[each_lineage] = potential_frag_list
-
-
-    recom_region_dic = {}
-
-    for each_lineage in recombination_frag:
-        lineage_frag_list = recombination_frag[each_lineage]
-
-        if lineage_frag_list != []:
-
-            frag_count = len(lineage_frag_list)
-            # print(frag_count)
-
-            cursor_site = 1
-            cursor_center = lineage_frag_list[cursor_site -1]
-
-            detected_area = []
-
-            while cursor_site <= frag_count:
-
-                Flage = False
-
-                breakpoint_judgment = []
-
-                
-                for i in range(cursor_site -1, frag_count):
-
-                    region_left = max(0,int(cursor_center - step_size / 2))
-                    region_right = min(sites_count,int(lineage_frag_list[i] + step_size / 2))
-
-                    region_sites_count = region_right - region_left + 1
-    
-                    lineage_Ri_wic = sum(list(sites_probability_data[each_lineage][region_left:region_right]))
-
-                    max_lineage_ic = 0
-
-                    for lineage in lineage_name_list:
-                        if lineage != each_lineage:
-                            lineage_ic = sum(list(sites_probability_data[lineage][region_left:region_right]))
-                            if lineage_ic >= max_lineage_ic:
-                                max_lineage_ic = lineage_ic
-
-                    if (lineage_Ri_wic > max_lineage_ic
-                            and lineage_Ri_wic / (
-                                    region_sites_count * max_mic) >= recom_percentage):
-
-
-
-                        breakpoint_judgment.append([i+1,region_left,
-                                                    region_right,
-                                                    "True"])
-
-                        Flage = True
-                    #     print([each_lineage,i+1,region_left,region_right,"True"])
-                    #
-                    # else:
-                    #     print([each_lineage,i+1,region_left,region_right,"Flase"])
-
-
-                if cursor_site ==frag_count:
-                    break
-
-
-                if Flage == False:
-
-                    cursor_site = cursor_site + 1
-
-                    # print(cursor_site)
-                    cursor_center = lineage_frag_list[cursor_site - 1]
-
-                else:
-
-                    
-                    first_each_region = breakpoint_judgment[0]
-                    first_ri = first_each_region[2] - first_each_region[1] + 1
-
-                    if first_ri > max_recom_fragment:
-                        cursor_site = cursor_site + 1
-                        cursor_center = lineage_frag_list[cursor_site - 1]
-
-                    else: 
-
-                        max_Ri = breakpoint_judgment[-1]
-                        max_Ri_ri = max_Ri[2] - max_Ri[1] + 1 
-
-                        if max_Ri_ri <= max_recom_fragment: 
-                            detected_area.append([max_Ri[1], max_Ri[2]])
 
-                            break
-
-                        else:
-
-                            for n in range(len(breakpoint_judgment)):
-                                each_region = breakpoint_judgment[n]
-                                ri = each_region[2] - each_region[1] + 1
-
-                                if ri > max_recom_fragment:
-                                    local_max_Ri = breakpoint_judgment[n-1]
-                                    detected_area.append([local_max_Ri[1],
-                                                          local_max_Ri[2]])
-
-                                    last_breakpoint = breakpoint_judgment[n-1][0]
-
-                                    if last_breakpoint == cursor_site:
-                                        cursor_site = cursor_site + 1
-                                        cursor_center = lineage_frag_list[cursor_site - 1]
-
-                                    else:
-                                        cursor_site = last_breakpoint
-                                        cursor_center = lineage_frag_list[cursor_site - 1]
-
-                                    break
-
-            recom_region_dic[each_lineage] = detected_area
-
-
-    for i in list(recom_region_dic.keys()):
-        if recom_region_dic[i] == []:
-            del recom_region_dic[i]
-
-
-    parents_region = {}
-
-    for each_lineage in recom_region_dic:
-        region_list = recom_region_dic[each_lineage]
-
-        parents_region[each_lineage] = []
-
-        range_list = []
-
-        for each_region in region_list:
-            region_range = each_region[1] - each_region[0]
-
-            range_list.append(region_range)
-
-        parents_region[each_lineage].append(sum(range_list))
-
-    major_parent = max(parents_region, key=parents_region.get)
-
-    major_parent_ic = sum(list(sites_probability_data[major_parent]))
-    mean_major_parent = major_parent_ic / sites_count
-
-
-
-    print("Major parent: " + major_parent
-          + "(global mWIC: " + str(mean_major_parent) + ")" + "\n")
-
-
-    print("Other parents: " + "\n")
-    print("Recombination region map at polymorphic sites: " + "\n")
-
-    for each_lineage in recom_region_dic:
-
-        if each_lineage != major_parent:
-            print(each_lineage,recom_region_dic[each_lineage])
-
-
-    other_parental_markers = False
-
-
-    recombination_dic = {}
-    for each_lineage in recom_region_dic:
-
-        if each_lineage != major_parent:
-
-            recombination_dic[each_lineage] = []
-
-            recom_region_list = recom_region_dic[each_lineage]
-
-
-            for each_region in recom_region_list:
-                each_region_start = each_region[0]
-                each_region_end = each_region[1]
-
-                this_lineage_ic_count = list(sites_probability_data[each_lineage][each_region_start:each_region_end])
-
-                major_parent_ic_count = list(sites_probability_data[major_parent][each_region_start:each_region_end])
-
-                region_mwic = sum(this_lineage_ic_count) / (each_region_end - each_region_start + 1)
-
-                left_start_site_original = sites_probability_data.loc[
-                    each_region_start, "Site"] 
-
-                right_end_site_original = sites_probability_data.loc[
-                    min(each_region_end, sites_count - 1), "Site"] 
-
-
-                try:
+        aligned_out_path = seq_aligned_path.replace("\\", "/")
 
-                    zihe_test = stats.mannwhitneyu(this_lineage_ic_count,
-                                                             major_parent_ic_count,
-                                                             alternative="two-sided")
+        input_dir, input_prefix = resolve_file_path(aligned_out_path)
 
-                    p_value = zihe_test[1]
+        out_dir = input_dir + "/" + "result_" + run_id
 
+        if resume_dir != "":
+            out_dir = resume_dir
 
-                    recombination_dic[each_lineage].append([str(
-                        left_start_site_original) + " to " + str(
-                        right_end_site_original) + "(mWIC: " + str(region_mwic) + ")"
-                        ,"p_value: " + str(p_value)])
+        run_record = out_dir + "/" + "run_record"
 
-                    if p_value < 0.05:
-                        other_parental_markers = True
+        make_dir(out_dir)
+        make_dir(run_record)
 
+        checkpoint = Checkpoint(run_record + "/" + "checkpoint")
 
-                except:
 
-                    recombination_dic[each_lineage].append([str(
-                        left_start_site_original) + " to " + str(
-                        right_end_site_original), "p_value: 1"])
+        query_prefix_list = query_path_list
 
-                finally:
-                    pass
 
+        with open(lineage_file_dir) as lineage_file:
+            for line in lineage_file:
+                line = line.strip()
+                if line != "":
+                    lineage_name_list.append(line)
 
 
-    print("\n")
 
-    print("Recombination region map at aligned genomes: " + "\n")
+    print("VirusRecom starts calculating weighted information content from each lineage..."
+          + "\n")
 
-    for each_lineage in recombination_dic:
+    # only the rows of the query and lineages are read from a store
+    store_mark_list = None
 
-        if each_lineage != major_parent:
-            print(each_lineage, recombination_dic[each_lineage])
+    if seq_aligned_path != "":
+        store_mark_list = query_prefix_list + lineage_name_list
 
+    with run_report.stage("read alignment") as stage_counts:
+        seq_pd = load_alignment(aligned_out_path, store_mark_list, mark_match)
 
+        stage_counts["sequences"], stage_counts["sites"] = seq_pd.shape
 
-    recom_report_path =  (out_dir + "/" + run_id + "_"
-                          + "Possible recombination event in "
-                          + query_seq_prefix + ".txt")
+    # checkpoints of later stages build on the fingerprint of the rows read
+    data_fingerprint = fingerprint(file_fingerprint(aligned_out_path),
+                                   store_mark_list, mark_match)
 
+    with run_report.stage("filter sites") as stage_counts:
+        seq_pd_clean = SiteFilter(seq_pd, gaps_use, method, aligned_out_path,
+                                  run_record, run_id, checkpoint,
+                                  data_fingerprint).run()
 
-    with open(recom_report_path, "w", encoding="utf-8") as recom_report_file:
+        stage_counts["sites"] = seq_pd_clean.shape[1]
 
-        if other_parental_markers == False:
-            recom_report_file.write("No significant recombination events were found in "
-                                    + query_seq_prefix)
+    del seq_pd
 
+    # rows of the queries and lineages are searched once, the selections
+    # below are views of the matrix when the rows are contiguous
+    mark_index = seq_pd_clean.index_marks(query_prefix_list + lineage_name_list,
+                                          mark_match)
 
-        recom_report_file.write("Possible major parent: "
-                                + major_parent
-                                + "(global mWIC: " + str(mean_major_parent) + ")"
-                                + "\n" * 2
-                                + "Possible other parents:"
-                                + "\n")
+    for each_mark, other_mark, shared_count in mark_index.overlaps():
+        print("Warning, the marks '" + each_mark + "' and '" + other_mark
+              + "' both match " + str(shared_count)
+              + " sequences, they are used in both!" + "\n")
 
-        if mean_major_parent / max_mic < 0.5:
-            recom_report_file.write(
-                "Note, similarity of major parent is less than 50%!" + "\n")
+    if collapse:
+        with run_report.stage("collapse haplotypes",
+                              sequences=seq_pd_clean.shape[0]) as stage_counts:
+            seq_pd_clean = collapse_haplotypes(seq_pd_clean)
 
-        for key in recombination_dic:
-            event_list = recombination_dic[key]
+            stage_counts["haplotypes"] = seq_pd_clean.shape[0]
 
-            recom_report_file.write(key + "\t")
+        print(str(stage_counts["sequences"]) + " sequences were collapsed into "
+              + str(stage_counts["haplotypes"]) + " haplotypes." + "\n")
 
-            for each_envent in event_list:
+    site_list = [int(x) for x in seq_pd_clean.sites]
 
-                recom_report_file.write(", ".join(each_envent) + "\t")
+    filter_fingerprint = fingerprint(data_fingerprint, gaps_use.upper(),
+                                     method.upper(), collapse, lineage_name_list)
 
-            recom_report_file.write("\n")
+    lineage_pool = LineagePool(workers)
 
+    plotter = FigurePlotter(plot_format, plot_background)
 
-        recom_report_file.write("\n" + "Significance test of recombinant regions using Mann-Whitney U test with two-tailed probabilities, "
-                                "p-value less than 0.05 indicates a significant difference.")
+    lineage_num = len(lineage_name_list)
 
+    # statistics of reference lineages are shared by all queries
+    stat_cache = None
 
+    if cache_dir != "":
+        stat_cache = LineageStatCache(cache_dir, cache_size * 1024 * 1024)
 
+    with run_report.stage("reference statistics",
+                          lineages=lineage_num) as stage_counts:
+        lineage_stat_list = reference_stats(seq_pd_clean, lineage_name_list,
+                                            gaps_use, lineage_pool, stat_cache)
 
-    if method.upper() == "P" and breakpoints.upper() == "Y":
+        if cache_dir != "":
+            stage_counts["cache_hits"] = stat_cache.hit_count
 
-        print("\n" + "VirusRecom is running the algorithm of search for "
-                     "recombination breakpoint..."
+    if cache_dir != "":
+        print(str(stat_cache.hit_count) + " of "
+              + str(lineage_num) + " lineages were loaded from the cache."
               + "\n")
 
- 
-
-        break_p_map = (site_dir + "/" + run_id + "_"
-                     + query_seq_prefix
-                     + "_ -lg(p-value) for potential breakpoint.pdf")
-
-
-        break_p_data = (site_dir + "/" + run_id + "_"
-                     + query_seq_prefix
-                     + "_ -lg(p-value) for potential breakpoint.xlsx")
-
-
-        breakpoint_data = pd.DataFrame()
-
-
-        run_number = sites_count - breakwins + 1
-
-        central_pos_list = []
-        for lineage in lineage_name_list:
-
-            central_pos_list = []
-            negative_lg_p_list = []
-
-            for i in range (run_number):
-                start_site = i
-                end_site = i + breakwins
-
-                central_pos = int((start_site + end_site) / 2)
-
-
-                left_region  = list(sites_probability_data[lineage][start_site: central_pos-1])
-                right_region = list(sites_probability_data[lineage][central_pos + 1: end_site])
-
-                original_site = sites_probability_data.loc[central_pos, "Site"] 
-                central_pos_list.append(original_site)
-
-
-                try:
-
-                    zihe_test = stats.mannwhitneyu(left_region,right_region,
-                                                   alternative="two-sided")
-                    p_value = zihe_test[1]
-                    negative_lg_p = - np.log10(p_value)
-                    negative_lg_p_list.append(negative_lg_p)
-
-                except:
-                    negative_lg_p = 0
-                    negative_lg_p_list.append(negative_lg_p)
-
-                finally:
-                    pass
-
-            breakpoint_data["Site"] = central_pos_list
-            breakpoint_data[lineage] = negative_lg_p_list
-
-
-
-        breakpoint_data.to_excel(
-            excel_writer=break_p_data,
-            index=False,
-            encoding="utf-8")
-
-
-        fig_high2 = int(max(central_pos_list) * 3 / 10000) * 2
-
-        figs, axs = plt.subplots(lineage_count, 1, figsize=(lineage_count,
-        fig_high2))
-
-        figs.suptitle("Query seq: " + query_seq_prefix,family="Arial")
-        figs.tight_layout()
-
-        plt.subplots_adjust(top=0.95)
-
-        for n in range(lineage_count):
-            each_lineage = lineage_name_list[n]
-            ax_n = axs[n]
-            y = list(breakpoint_data[each_lineage])
 
+    for query_seq_prefix in query_prefix_list:
+
+        query_out_dir = out_dir
+
+        if query_list_path != "":
+            query_out_dir = out_dir + "/" + query_seq_prefix
+            make_dir(query_out_dir)
+
+            print("\n" + "Query: " + query_seq_prefix + "\n")
+
+
+        query_seq = seq_pd_clean.select_rows(query_seq_prefix)
+
+        query_fingerprint = fingerprint(filter_fingerprint, query_seq_prefix)
+
+        if sweep:
+            recom_scan_task = ParamSweep(query_seq_prefix,
+                                         query_seq,
+                                         site_list,
+                                         lineage_name_list,
+                                         lineage_stat_list,
+                                         query_out_dir,
+                                         run_id,
+                                         gaps_use,
+                                         sweep_value_list[0],
+                                         sweep_value_list[1],
+                                         sweep_value_list[2],
+                                         sweep_value_list[3],
+                                         lineage_pool,
+                                         output_format,
+                                         run_report,
+                                         checkpoint,
+                                         query_fingerprint)
+
+        elif per_sequence:
+            recom_scan_task = SequenceScan(query_seq_prefix,
+                                           query_seq,
+                                           site_list,
+                                           lineage_name_list,
+                                           lineage_stat_list,
+                                           query_out_dir,
+                                           run_id,
+                                           gaps_use,
+                                           windows_size,
+                                           step_size,
+                                           max_recom_fragment,
+                                           recom_percentage,
+                                           lineage_pool,
+                                           output_format,
+                                           run_report)
+
+        else:
+            recom_scan_task = RecomScan(query_seq_prefix,
+                                        query_seq.matrix,
+                                        site_list,
+                                        lineage_name_list,
+                                        lineage_stat_list,
+                                        query_out_dir,
+                                        run_id,
+                                        gaps_use,
+                                        method,
+                                        windows_size,
+                                        step_size,
+                                        max_recom_fragment,
+                                        recom_percentage,
+                                        breakpoints,
+                                        breakwins,
+                                        y_start,
+                                        lineage_pool,
+                                        output_format,
+                                        plotter,
+                                        run_report,
+                                        query_seq.weights,
+                                        checkpoint,
+                                        query_fingerprint)
+
+        query_stage = run_report.start_stage("query " + query_seq_prefix,
+                                             sequences=query_seq.shape[0])
+
+        if query_list_path == "":
+            recom_scan_task.run()
+
+        else:
+            # one failed query does not stop the others in batch mode
             try:
+                recom_scan_task.run()
+            except Exception as scan_error:
+                print("Error, the scan of " + query_seq_prefix + " failed: "
+                      + repr(scan_error) + "\n")
 
-                ax_n.plot(central_pos_list, y,
-                            label=query_seq_prefix + " : " + each_lineage,
-                             color=plt_corlor[n],)
-
-            except:
-                ax_n.plot(central_pos_list, y,
-                          label=query_seq_prefix + " : " + each_lineage,
-                          color="black", )
-
-            finally:
-                pass
-
-            ax_n.set_ylabel("-lg(P)",family="Arial")
-
-            ax_n.legend(loc="best")
-
-            x1_label = ax_n.get_xticklabels()
-            [x1_label_temp.set_fontname("Arial") for x1_label_temp in
-             x1_label]
-            y1_label = ax_n.get_yticklabels()
-            [y1_label_temp.set_fontname("Arial") for y1_label_temp in
-             y1_label]
-
+                query_stage["counts"]["error"] = repr(scan_error)
 
-        plt.xlabel("Site in alignment",family="Arial")
+        run_report.end_stage(query_stage)
 
-        plt.savefig(break_p_map)
+    if resume_dir != "":
+        print(str(len(checkpoint.hit_list)) + " stages were loaded from the "
+              + "checkpoints of " + resume_dir + "." + "\n")
 
-        plt.clf() 
+    with run_report.stage("close workers and figures"):
+        lineage_pool.close()
 
+        plotter.close()
 
-    plt.close()
+    run_report.save(run_record, run_id,
+                    {"argv": sys.argv[1:],
+                     "gaps_use": gaps_use,
+                     "method": method,
+                     "windows_size": windows_size,
+                     "step_size": step_size,
+                     "workers": workers,
+                     "queries": len(query_prefix_list),
+                     "lineages": lineage_num})
 
 
     duration = datetime.today().now() - start
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+
+"""
+Index of the rows of an alignment that match the marks of the lineages
+and queries.
+"""
+
+import re
+from bisect import bisect_right
+
+
+# 'contains': the mark is searched in the name as a regular expression (same
+# as pandas str.contains), 'substring': the mark appears literally in the
+# name, 'prefix': the name starts with the mark
+MARK_MATCH = ["contains", "substring", "prefix"]
+
+# numpy is imported inside the functions, main.py checks '--mark-match'
+# against MARK_MATCH before the heavy libraries are loaded
+
+REGEX_CHARS = set(".^$*+?{}[]\\|()")
+
+
+def row_selector(rows):
+    """
+    :param rows: sorted 1-D array of row indices
+    :return: a slice if the rows are contiguous, so that indexing a matrix
+             with it gives a view instead of a copy, otherwise the rows
+    """
+    if rows.shape[0] > 0 and rows[-1] - rows[0] + 1 == rows.shape[0]:
+        return slice(int(rows[0]), int(rows[-1]) + 1)
+
+    return rows
+
+
+class MarkIndex(object):
+
+    def __init__(self, names, mark_list, match="contains"):
+        """
+        Rows of every mark, searched once over all names
+        :param names: sequence names, one per row
+        :param mark_list: marks (a unique string) of lineages and queries
+        :param match: one of MARK_MATCH
+        """
+
+        super(MarkIndex, self).__init__()
+
+        if match not in MARK_MATCH:
+            raise ValueError("unknown match of marks: " + str(match))
+
+        self.names = names
+
+        self.match = match
+
+        # all names in one string, a literal mark is then found with
+        # str.find instead of testing every name
+        self.text = "\n" + "\n".join(names) + "\n"
+
+        self.line_start = [1]
+        for each_name in names:
+            self.line_start.append(self.line_start[-1] + len(each_name) + 1)
+
+        self.rows = {}
+
+        for each_mark in mark_list:
+            if each_mark not in self.rows:
+                self.rows[each_mark] = self.search(each_mark)
+
+    def _find_rows(self, needle, lead):
+        """
+        :param needle: literal string searched in self.text
+        :param lead: characters of needle before the name ('\\n' for prefix)
+        """
+        rows = []
+
+        if len(self.names) == 0:
+            return rows
+
+        pos = self.text.find(needle, self.line_start[0] - len(lead))
+
+        while pos != -1:
+            row = bisect_right(self.line_start, pos + len(lead)) - 1
+
+            rows.append(row)
+
+            if row + 1 >= len(self.names):
+                break
+
+            # one match per name is enough, go on from the next name
+            pos = self.text.find(needle, self.line_start[row + 1] - len(lead))
+
+        return rows
+
+    def search(self, mark):
+        """
+        :param mark: mark of lineage or query
+        :return: sorted 1-D array of row indices whose name matches the mark
+        """
+        import numpy as np
+
+        if self.match == "prefix":
+            rows = self._find_rows("\n" + mark, "\n")
+
+        elif self.match == "substring" or not (set(mark) & REGEX_CHARS):
+            rows = self._find_rows(mark, "")
+
+        else:
+            pattern = re.compile(mark)
+
+            rows = [n for n in range(len(self.names))
+                    if pattern.search(self.names[n])]
+
+        return np.array(rows, dtype=np.intp)
+
+    def row_index(self, mark):
+        """
+        :return: sorted 1-D array of row indices of the mark
+        """
+        if mark not in self.rows:
+            self.rows[mark] = self.search(mark)
+
+        return self.rows[mark]
+
+    def overlaps(self):
+        """
+        Marks sharing sequences, such sequences are counted in every lineage
+        whose mark they match
+        :return: list of (mark, other mark, number of shared sequences)
+        """
+        import numpy as np
+
+        mark_list = [x for x in self.rows if self.rows[x].shape[0] > 0]
+
+        if mark_list == []:
+            return []
+
+        match_count = np.bincount(
+            np.concatenate([self.rows[x] for x in mark_list]),
+            minlength=len(self.names))
+
+        # only the marks having a sequence matched more than once are compared
+        mark_list = [x for x in mark_list
+                     if (match_count[self.rows[x]] > 1).any()]
+
+        overlap_list = []
+
+        for n in range(len(mark_list)):
+            for other_mark in mark_list[n + 1:]:
+                shared_count = np.intersect1d(self.rows[mark_list[n]],
+                                              self.rows[other_mark]).shape[0]
+
+                if shared_count > 0:
+                    overlap_list.append((mark_list[n], other_mark,
+                                         shared_count))
+
+        return overlap_list
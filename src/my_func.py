@@ -11,7 +11,8 @@ Time: 2022/4/17 21:32
 import os
 
 import numpy as np
-import pandas as pd
+
+from seq_matrix import (SeqMatrix, encode_seq)
 
 
 def get_all_path(open_dir_path):
@@ -60,89 +61,65 @@ def resolve_file_path(file_path):
 
 
 
-def read_seq(file_path):
+def read_fasta(file_path):
     """
-    read sequence as data frame
+    Read records of a fasta file one by one, wrapped lines and CRLF are allowed
     :param file_path:
-    :return:
+    :return: generator of (seq_name, seq_bytes)
     """
-    seq_tab = []
-    max = 0
-    with open(file_path, "r", encoding="utf-8") as gen_file_input:
-
-        gen_file_list = gen_file_input.read().split(">")
-
-        for n in range(1, int(len(gen_file_list))):
-            seq = gen_file_list[n].strip()
-            st = []
-            seq_name = seq.split("\n")[0]
-            # print(seq_name)
-
-            seq_contain = seq.replace("\n", "").replace(seq_name, "").upper()
-
-            st.append(seq_name)
-
-            if len(seq_contain) >= max:
-                max = len(seq_contain)
-
-            for n in range(len(seq_contain)):
-                st.append(seq_contain[n: n + 1])
-
-            seq_tab.append(st)
+    seq_name = None
+    seq_chunk = []
 
+    with open(file_path, "rb") as fasta_input:
 
-    seq_sites_list = []
-    seq_sites_list.append("SeqName")
+        for line in fasta_input:
+            line = line.rstrip(b"\r\n")
 
-    for x in range(max):
-        seq_sites_list.append(str(x + 1))
+            if line.startswith(b">"):
+                if seq_name is not None:
+                    yield (seq_name, b"".join(seq_chunk))
 
-    seq_pands = pd.DataFrame(seq_tab,columns=seq_sites_list).set_index("SeqName")
+                seq_name = line[1:].decode("utf-8").strip()
+                seq_chunk = []
 
+            elif seq_name is not None:
+                seq_chunk.append(line.strip())
 
-    return seq_pands
+    if seq_name is not None:
+        yield (seq_name, b"".join(seq_chunk))
 
 
 
-def calEnt(siteData):
+def read_seq(file_path):
     """
-    Calculate the information content, no gaps
-    :param siteData:Pass in a dataframe with only one column
-    :return:
+    read sequence as a matrix of nucleotide codes, the file is scanned
+    twice so that only the final matrix is held in memory
+    :param file_path:
+    :return: SeqMatrix
     """
-    # print(siteData)
-    n = siteData.shape[0]
-    nt_count = siteData.value_counts()
-    # print(nt_count)
-
-    p = nt_count / n
-    # print(p)
-
-    ent = (-p * np.log2(p)).sum()
-
-    IC = 2 - ent
-
-    return IC
+    seq_count = 0
+    max = 0
 
+    for seq_name, seq_contain in read_fasta(file_path):
+        seq_count += 1
 
-def calEnt_gap(siteData):
-    """
-    Calculate the information content, including gaps
-    :param siteData:Pass in a dataframe with only one column
-    :return:
-    """
-    # print(siteData)
-    n = siteData.shape[0]
-    nt_count = siteData.value_counts()
-    # print(nt_count)
+        if len(seq_contain) >= max:
+            max = len(seq_contain)
 
-    p = nt_count / n
-    # print(p)
+    seq_name_list = []
+    seq_matrix = np.zeros((seq_count, max), dtype=np.uint8)
 
-    ent = (-p * np.log2(p)).sum()
+    n = 0
+    for seq_name, seq_contain in read_fasta(file_path):
+        seq_name_list.append(seq_name)
 
-    IC = np.log2(5) - ent
+        try:
+            seq_matrix[n, :len(seq_contain)] = encode_seq(seq_contain)
 
-    return IC
+        except ValueError as e:
+            print("Error, " + seq_name + " has " + str(e) + "!")
+            exit()
 
+        n += 1
 
+    return SeqMatrix(seq_name_list, seq_matrix)
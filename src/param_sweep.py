@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+
+"""
+Sweep of window size, step, maximum region and dominant percentage over
+one query, the results are summarised in one table.
+"""
+
+import itertools
+
+import pandas as pd
+
+from table_writer import write_table
+
+from run_report import RunReport
+
+from checkpoint import (Checkpoint, fingerprint)
+
+from sequence_scan import (SUMMARY_COLUMNS, summary_fields)
+
+import virusrecom
+
+
+class ParamSweep(object):
+
+    def __init__(self,
+                 query_seq_prefix,
+                 query_seq,
+                 site_list,
+                 lineage_name_list,
+                 lineage_stat_list,
+                 out_dir,
+                 run_id,
+                 gaps_use,
+                 windows_size_list,
+                 step_size_list,
+                 max_recom_fragment_list,
+                 recom_percentage_list,
+                 lineage_pool,
+                 output_format="xlsx",
+                 run_report=None,
+                 checkpoint=None,
+                 query_fingerprint=""):
+
+        """
+        Scan one query with every combination of window size, step size,
+        maximum region and cutoff, the WIC of sites is computed once
+        :param query_seq_prefix: mark (a unique string) of query
+        :param query_seq: SeqMatrix of query sequences
+        :param site_list: original site of each column in alignment
+        :param lineage_stat_list: reference statistics of each lineage,
+                                  see wic_engine.calc_lineage_stat
+        :param out_dir: dirpath of the results of this query
+        :param windows_size_list: values of '-w', see sweep_values.parse_sweep_values
+        :param step_size_list: values of '-s'
+        :param max_recom_fragment_list: values of '-mr'
+        :param recom_percentage_list: values of '-cp'
+        :param lineage_pool: LineagePool running the combinations
+        :param output_format: format of result tables, see TABLE_FORMATS
+        :param run_report: RunReport receiving the stages, optional
+        :param checkpoint: Checkpoint keeping the WIC of sites, optional
+        :param query_fingerprint: see RecomScan
+        """
+
+        super(ParamSweep, self).__init__()
+
+        self.query_seq_prefix = query_seq_prefix
+
+        self.query_seq = query_seq
+
+        self.site_list = site_list
+
+        self.lineage_name_list = lineage_name_list
+
+        self.lineage_stat_list = lineage_stat_list
+
+        self.out_dir = out_dir
+
+        self.run_id = run_id
+
+        self.gaps_use = gaps_use
+
+        self.combination_list = list(itertools.product(windows_size_list,
+                                                       step_size_list,
+                                                       max_recom_fragment_list,
+                                                       recom_percentage_list))
+
+        self.lineage_pool = lineage_pool
+
+        self.output_format = output_format
+
+        self.run_report = run_report or RunReport()
+
+        self.checkpoint = checkpoint or Checkpoint()
+
+        self.query_fingerprint = query_fingerprint
+
+    def run(self):
+        """
+        :return: the summary table (pandas.DataFrame), one row per combination
+        """
+        max_mic = virusrecom.max_information(self.gaps_use)
+
+        with self.run_report.stage("site WIC",
+                                   sequences=self.query_seq.shape[0],
+                                   sites=len(self.site_list),
+                                   lineages=len(self.lineage_name_list)):
+
+            # the same checkpoint as the one of RecomScan
+            site_wic = self.checkpoint.run(
+                self.query_seq_prefix + " site WIC",
+                fingerprint(self.query_fingerprint, "site WIC"),
+                virusrecom.site_wic, self.query_seq.matrix,
+                self.lineage_stat_list, self.query_seq.weights)
+
+        with self.run_report.stage("parameter sweep",
+                                   combinations=len(self.combination_list)):
+
+            result_list = virusrecom.sweep_parameters(site_wic,
+                                                      self.site_list,
+                                                      self.lineage_name_list,
+                                                      self.gaps_use,
+                                                      self.combination_list,
+                                                      self.lineage_pool)
+
+        summary_row_list = []
+
+        for combination, region_test in zip(self.combination_list, result_list):
+            summary_row_list.append(list(combination)
+                                    + summary_fields(region_test, max_mic))
+
+        summary_data = pd.DataFrame(
+            summary_row_list,
+            columns=["Window size (-w)", "Step size (-s)",
+                     "Maximum region (-mr)", "Cutoff (-cp)"] + SUMMARY_COLUMNS)
+
+        summary_table = (self.out_dir + "/" + self.run_id + "_"
+                         + self.query_seq_prefix + "_Parameter sweep")
+
+        with self.run_report.stage("write sweep table",
+                                   format=self.output_format):
+
+            write_table(summary_data, summary_table, self.output_format)
+
+        print(str(len(self.combination_list)) + " combinations of parameters "
+              + "were scanned for " + self.query_seq_prefix + ", see "
+              + summary_table + "." + self.output_format + "\n")
+
+        return summary_data
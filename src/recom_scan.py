@@ -0,0 +1,450 @@
+# -*- coding: utf-8 -*-
+
+"""
+Scan of one query lineage against the reference lineages, the results
+are written to tables, figures and a report.
+"""
+
+import pandas as pd
+
+from my_func import make_dir
+
+from wic_plot import (FigurePlotter, plot_site_wic, plot_window_wic,
+                      plot_breakpoint)
+
+from table_writer import write_table
+
+from run_report import RunReport
+
+from checkpoint import (Checkpoint, fingerprint)
+
+from lineage_scan import wic_prefix_sum
+
+from sequence_scan import summary_fields
+
+import virusrecom
+
+from virusrecom import (max_information, window_scan, detect_regions,
+                        test_regions, breakpoint_scan)
+
+
+class RecomScan(object):
+
+    def __init__(self,
+                 query_seq_prefix,
+                 query_seq_matrix,
+                 site_list,
+                 lineage_name_list,
+                 lineage_stat_list,
+                 out_dir,
+                 run_id,
+                 gaps_use,
+                 method,
+                 windows_size,
+                 step_size,
+                 max_recom_fragment,
+                 recom_percentage,
+                 breakpoints,
+                 breakwins,
+                 y_start,
+                 lineage_pool,
+                 output_format="xlsx",
+                 plotter=None,
+                 run_report=None,
+                 query_weights=None,
+                 checkpoint=None,
+                 query_fingerprint=""):
+
+        """
+        Scan the recombination of one query against the reference lineages
+        :param query_seq_prefix: mark (a unique string) of query
+        :param query_seq_matrix: code matrix of query sequences
+        :param site_list: original site of each column in alignment
+        :param lineage_stat_list: reference statistics of each lineage,
+                                  see wic_engine.calc_lineage_stat
+        :param out_dir: dirpath of the results of this query
+        :param lineage_pool: LineagePool running the per-lineage tasks
+        :param output_format: format of result tables, see TABLE_FORMATS
+        :param plotter: FigurePlotter drawing the figures, figures are drawn
+                        as PDF in this process if it is None
+        :param run_report: RunReport receiving the stages, optional
+        :param query_weights: number of sequences of each row of
+                              query_seq_matrix, optional
+        :param checkpoint: Checkpoint keeping the WIC of sites, the windows,
+                           the regions and the breakpoint scan, optional
+        :param query_fingerprint: fingerprint of the alignment, lineages and
+                                  query, the checkpoints build on it
+        """
+
+        super(RecomScan, self).__init__()
+
+        self.query_seq_prefix = query_seq_prefix
+
+        self.query_seq_matrix = query_seq_matrix
+
+        self.site_list = site_list
+
+        self.lineage_name_list = lineage_name_list
+
+        self.lineage_stat_list = lineage_stat_list
+
+        self.out_dir = out_dir
+
+        self.run_id = run_id
+
+        self.gaps_use = gaps_use
+
+        self.method = method
+
+        self.windows_size = windows_size
+
+        self.step_size = step_size
+
+        self.max_recom_fragment = max_recom_fragment
+
+        self.recom_percentage = recom_percentage
+
+        self.breakpoints = breakpoints
+
+        self.breakwins = breakwins
+
+        self.y_start = y_start
+
+        self.lineage_pool = lineage_pool
+
+        self.output_format = output_format
+
+        self.plotter = plotter
+
+        if self.plotter is None:
+            self.plotter = FigurePlotter()
+
+        self.run_report = run_report or RunReport()
+
+        self.query_weights = query_weights
+
+        self.checkpoint = checkpoint or Checkpoint()
+
+        self.query_fingerprint = query_fingerprint
+
+    def run(self):
+
+        query_seq_prefix = self.query_seq_prefix
+        query_seq_matrix = self.query_seq_matrix
+        site_list = self.site_list
+        lineage_name_list = self.lineage_name_list
+        lineage_stat_list = self.lineage_stat_list
+        out_dir = self.out_dir
+        run_id = self.run_id
+        gaps_use = self.gaps_use
+        method = self.method
+        windows_size = self.windows_size
+        step_size = self.step_size
+        max_recom_fragment = self.max_recom_fragment
+        recom_percentage = self.recom_percentage
+        breakpoints = self.breakpoints
+        breakwins = self.breakwins
+        y_start = self.y_start
+        lineage_pool = self.lineage_pool
+        output_format = self.output_format
+        plotter = self.plotter
+        run_report = self.run_report
+        checkpoint = self.checkpoint
+
+        max_mic = max_information(gaps_use)
+
+
+        site_dir = out_dir + "/" + "WICs of sites"
+
+        slide_window_dir = out_dir + "/" + "WICs of slide_window"
+
+        make_dir(site_dir)
+        make_dir(slide_window_dir)
+
+
+        site_ic_table = (site_dir + "/" + run_id + "_"
+                         + query_seq_prefix
+                         + "_WIC contribution from lineage in sites")
+
+        site_ic_fig = (site_dir + "/" + run_id + "_"
+                       + query_seq_prefix
+                       + "_WIC contribution from lineage in sites" + ".pdf")
+
+        window_ic_table = (slide_window_dir + "/" + run_id + "_"
+                           + query_seq_prefix
+                           + "_WIC contribution from lineage in sliding window")
+
+        window_ic_fig = (slide_window_dir + "/" + run_id + "_"
+                         + query_seq_prefix
+                         + "_WIC contribution from lineage in sliding window"
+                         + run_id + ".pdf")
+
+
+
+        sites_probability_data = pd.DataFrame()
+
+        lineage_num = len(lineage_name_list)
+
+        stage = run_report.start_stage("site WIC",
+                                       sequences=query_seq_matrix.shape[0],
+                                       sites=len(site_list),
+                                       lineages=lineage_num)
+
+        wic_fingerprint = fingerprint(self.query_fingerprint, "site WIC")
+
+        site_wic = checkpoint.run(query_seq_prefix + " site WIC",
+                                  wic_fingerprint,
+                                  virusrecom.site_wic,
+                                  query_seq_matrix, lineage_stat_list,
+                                  self.query_weights)
+
+        # sums of WIC over windows and regions come from the prefix sums
+        wic_cumsum = wic_prefix_sum(site_wic)
+
+        run_report.end_stage(stage)
+
+        sites_probability_data["Site"] = site_list
+
+        for n in range(len(lineage_name_list)):
+            each_lineage = lineage_name_list[n]
+
+            sites_probability_data[each_lineage] = site_wic[n]
+
+            print(each_lineage + "'s calculation has been completed!" + "\n")
+
+
+        stage = run_report.start_stage("write site table", format=output_format)
+
+        write_table(sites_probability_data, site_ic_table, output_format)
+
+        run_report.end_stage(stage)
+
+
+ 
+
+        stage = run_report.start_stage("plot site WIC",
+                                       background=plotter.background)
+
+        plotter.plot(plot_site_wic, site_ic_fig, query_seq_prefix,
+                     site_list, lineage_name_list, site_wic)
+
+        run_report.end_stage(stage)
+
+
+        print("VirusRecom starts scanning using sliding window ..." + "\n")
+
+
+
+        step_probability_data = pd.DataFrame()
+
+
+        stage = run_report.start_stage("window scan")
+
+        window_fingerprint = fingerprint(wic_fingerprint, windows_size,
+                                         step_size)
+
+        window_wic, original_site_list = checkpoint.run(
+            query_seq_prefix + " windows", window_fingerprint,
+            window_scan, site_wic, site_list, windows_size, step_size,
+            wic_cumsum)
+
+        run_report.end_stage(stage, windows=window_wic.shape[1])
+
+        step_probability_data["Central position"] = original_site_list
+
+        for n in range(lineage_num):
+            each_lineage = lineage_name_list[n]
+
+            step_probability_data[each_lineage] = window_wic[n]
+
+            print(each_lineage + "'s scan has been completed!" + "\n")
+
+
+        stage = run_report.start_stage("write window table", format=output_format)
+
+        write_table(step_probability_data, window_ic_table, output_format)
+
+        run_report.end_stage(stage)
+
+
+        stage = run_report.start_stage("plot window WIC",
+                                       background=plotter.background)
+
+        plotter.plot(plot_window_wic, window_ic_fig, query_seq_prefix,
+                     original_site_list, lineage_name_list, window_wic,
+                     gaps_use, y_start)
+
+        run_report.end_stage(stage)
+
+
+        stage = run_report.start_stage("region search")
+
+        detected_area_list = checkpoint.run(
+            query_seq_prefix + " regions",
+            fingerprint(window_fingerprint, gaps_use, recom_percentage,
+                        max_recom_fragment),
+            detect_regions, site_wic, window_wic, windows_size, step_size,
+            gaps_use, recom_percentage, max_recom_fragment, lineage_pool,
+            wic_cumsum)
+
+        run_report.end_stage(stage,
+                             regions=sum([len(x) for x in detected_area_list]))
+
+
+        recom_report_path =  (out_dir + "/" + run_id + "_"
+                              + "Possible recombination event in "
+                              + query_seq_prefix + ".txt")
+
+        # there is no major parent to test the regions against
+        if not any(detected_area_list):
+            note = summary_fields(None, max_mic)[-1]
+
+            print("No significant recombination events were found in "
+                  + query_seq_prefix + ": " + note + "\n")
+
+            with open(recom_report_path, "w",
+                      encoding="utf-8") as recom_report_file:
+                recom_report_file.write(
+                    "No significant recombination events were found in "
+                    + query_seq_prefix + "\n" * 2 + note + ".\n")
+
+            return (None, {})
+
+
+        stage = run_report.start_stage("Mann-Whitney U test of regions")
+
+        region_test = test_regions(site_wic, site_list, lineage_name_list,
+                                   detected_area_list)
+
+        run_report.end_stage(stage)
+
+        major_parent = region_test["major_parent"]
+
+        mean_major_parent = region_test["major_parent_mwic"]
+
+        recom_region_dic = region_test["recom_region"]
+
+        recombination_dic = region_test["recombination"]
+
+        other_parental_markers = region_test["significant"]
+
+
+        print("Major parent: " + major_parent
+              + "(global mWIC: " + str(mean_major_parent) + ")" + "\n")
+
+
+        print("Other parents: " + "\n")
+        print("Recombination region map at polymorphic sites: " + "\n")
+
+        for each_lineage in recom_region_dic:
+
+            if each_lineage != major_parent:
+                print(each_lineage,recom_region_dic[each_lineage])
+
+
+        print("\n")
+
+        print("Recombination region map at aligned genomes: " + "\n")
+
+        for each_lineage in recombination_dic:
+
+            if each_lineage != major_parent:
+                print(each_lineage, recombination_dic[each_lineage])
+
+
+
+        with open(recom_report_path, "w", encoding="utf-8") as recom_report_file:
+
+            if other_parental_markers == False:
+                recom_report_file.write("No significant recombination events were found in "
+                                        + query_seq_prefix)
+
+
+            recom_report_file.write("Possible major parent: "
+                                    + major_parent
+                                    + "(global mWIC: " + str(mean_major_parent) + ")"
+                                    + "\n" * 2
+                                    + "Possible other parents:"
+                                    + "\n")
+
+            if mean_major_parent / max_mic < 0.5:
+                recom_report_file.write(
+                    "Note, similarity of major parent is less than 50%!" + "\n")
+
+            for key in recombination_dic:
+                event_list = recombination_dic[key]
+
+                recom_report_file.write(key + "\t")
+
+                for each_envent in event_list:
+
+                    recom_report_file.write(", ".join(each_envent) + "\t")
+
+                recom_report_file.write("\n")
+
+
+            recom_report_file.write("\n" + "Significance test of recombinant regions using Mann-Whitney U test with two-tailed probabilities, "
+                                    "p-value less than 0.05 indicates a significant difference.")
+
+
+
+
+        if method.upper() == "P" and breakpoints.upper() == "Y":
+
+            print("\n" + "VirusRecom is running the algorithm of search for "
+                         "recombination breakpoint..."
+                  + "\n")
+
+ 
+
+            break_p_map = (site_dir + "/" + run_id + "_"
+                         + query_seq_prefix
+                         + "_ -lg(p-value) for potential breakpoint.pdf")
+
+
+            break_p_data = (site_dir + "/" + run_id + "_"
+                         + query_seq_prefix
+                         + "_ -lg(p-value) for potential breakpoint")
+
+
+            breakpoint_data = pd.DataFrame()
+
+
+            stage = run_report.start_stage("breakpoint scan",
+                                           window_size=breakwins)
+
+            central_pos_list, negative_lg_p_matrix = checkpoint.run(
+                query_seq_prefix + " breakpoint scan",
+                fingerprint(wic_fingerprint, breakwins),
+                breakpoint_scan, site_wic, site_list, breakwins, lineage_pool)
+
+            run_report.end_stage(stage, windows=len(central_pos_list))
+
+            breakpoint_data["Site"] = central_pos_list
+
+            for n in range(lineage_num):
+                breakpoint_data[lineage_name_list[n]] = negative_lg_p_matrix[n]
+
+
+
+            stage = run_report.start_stage("write breakpoint table",
+                                           format=output_format)
+
+            write_table(breakpoint_data, break_p_data, output_format)
+
+            run_report.end_stage(stage)
+
+
+            stage = run_report.start_stage("plot breakpoint",
+                                           background=plotter.background)
+
+            plotter.plot(plot_breakpoint, break_p_map, query_seq_prefix,
+                         central_pos_list, lineage_name_list,
+                         negative_lg_p_matrix)
+
+            run_report.end_stage(stage)
+
+
+
+
+        return (major_parent, recombination_dic)
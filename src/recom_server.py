@@ -0,0 +1,698 @@
+# -*- coding: utf-8 -*-
+
+"""
+Analysis server of VirusRecom. Reference panels (an alignment and the marks
+of its lineages) are loaded once and kept in memory, queries aligned to a
+panel are then scanned over a local HTTP or Unix-socket API, such as:
+
+    python recom_server.py -p panel1 alignment.fasta lineage_name_list.txt
+                           --port 8765 --jobs 4
+
+    curl -X POST http://127.0.0.1:8765/scan
+         -d '{"panel": "panel1", "query": ">XE_1\\nACGT...\\n", "window": 100}'
+
+"""
+
+import os
+import sys
+import json
+import time
+import queue
+import socket
+import argparse
+import threading
+from collections import deque
+from http.server import (BaseHTTPRequestHandler, ThreadingHTTPServer)
+from socketserver import (ThreadingMixIn, UnixStreamServer)
+
+import numpy as np
+
+import virusrecom
+
+from seq_matrix import (SeqMatrix, encode_seq, GAP_CODE, PAD_CODE)
+
+from site_filter import site_masks
+
+from mark_index import MARK_MATCH
+
+from lineage_pool import LineagePool
+
+from lineage_scan import wic_prefix_sum
+
+from sequence_scan import summary_fields
+
+
+# parameters of a scan request and their defaults, the same as main.py
+SCAN_DEFAULTS = {"method": "p",
+                 "window": 100,
+                 "step": 20,
+                 "max_region": 1000,
+                 "percentage": 0.9,
+                 "per_sequence": False}
+
+# number of finished requests kept for the latency percentiles
+LATENCY_HISTORY = 1000
+
+
+class RequestError(Exception):
+    """
+    The request can not be scanned, it is answered with status 400
+    """
+
+
+def parse_fasta_text(fasta_text):
+    """
+    :param fasta_text: str of fasta records, wrapped lines and CRLF are allowed
+    :return: list of (seq_name, seq_bytes)
+    """
+    record_list = []
+
+    for line in fasta_text.splitlines():
+        line = line.strip()
+
+        if line.startswith(">"):
+            record_list.append((line[1:].strip(), []))
+
+        elif line != "" and record_list != []:
+            record_list[-1][1].append(line)
+
+    return [(x[0], "".join(x[1]).encode("ascii", errors="replace"))
+            for x in record_list]
+
+
+class ReferencePanel(object):
+
+    def __init__(self, name, aligned_path, lineage_name_list, gaps_use="n",
+                 mark_match="contains", workers=1):
+        """
+        Reference lineages kept in memory. Their statistics are computed once
+        over all sites, a request keeps the sites its filter keeps.
+        :param name: name of the panel used in requests
+        :param aligned_path: filepath of aligned sequences, or dirpath of a
+                             store, see virusrecom.load_alignment
+        :param lineage_name_list: marks (a unique string) of lineages
+        :param gaps_use: 'y' reserve gaps, 'n' delete gaps
+        :param mark_match: see mark_index.MARK_MATCH
+        :param workers: processes computing the reference statistics
+        """
+
+        super(ReferencePanel, self).__init__()
+
+        self.name = name
+
+        self.aligned_path = aligned_path
+
+        self.lineage_name_list = lineage_name_list
+
+        self.gaps_use = gaps_use
+
+        seq_matrix = virusrecom.load_alignment(aligned_path, lineage_name_list,
+                                               mark_match)
+
+        self.sequence_count = seq_matrix.shape[0]
+
+        self.sites_count = seq_matrix.shape[1]
+
+        # gaps and polymorphism are judged over the panel and the query
+        # together, as if the query were in the alignment given to '-a'
+        if seq_matrix.site_masks is not None:
+            self.gap_mask, self.poly_mask = seq_matrix.site_masks
+        else:
+            self.gap_mask, self.poly_mask = site_masks(seq_matrix.matrix)
+
+        seq_matrix.index_marks(lineage_name_list, mark_match)
+
+        seq_matrix = virusrecom.collapse_haplotypes(seq_matrix)
+
+        # a monomorphic site of the panel has the nucleotide of any row
+        self.first_row = np.array(seq_matrix.matrix[0])
+
+        with LineagePool(workers) as lineage_pool:
+            self.lineage_stat_list = virusrecom.reference_stats(
+                seq_matrix, lineage_name_list, gaps_use, lineage_pool)
+
+    def info(self):
+        return {"name": self.name,
+                "alignment": self.aligned_path,
+                "lineages": self.lineage_name_list,
+                "sequences": self.sequence_count,
+                "sites": self.sites_count,
+                "gaps_use": self.gaps_use}
+
+    def query_matrix(self, fasta_text):
+        """
+        :param fasta_text: str of query sequences aligned to the panel
+        :return: SeqMatrix of the query
+        """
+        record_list = parse_fasta_text(fasta_text)
+
+        if record_list == []:
+            raise RequestError("the query has no sequence")
+
+        matrix = np.full((len(record_list), self.sites_count), PAD_CODE,
+                         dtype=np.uint8)
+
+        for n in range(len(record_list)):
+            seq_name, seq_contain = record_list[n]
+
+            if len(seq_contain) > self.sites_count:
+                raise RequestError(seq_name + " is longer than the "
+                                   + str(self.sites_count)
+                                   + " sites of the panel " + self.name
+                                   + ", align it with MAFFT --add --keeplength")
+
+            try:
+                matrix[n, :len(seq_contain)] = encode_seq(seq_contain)
+
+            except ValueError as e:
+                raise RequestError(seq_name + " has " + str(e))
+
+        return SeqMatrix([x[0] for x in record_list], matrix)
+
+    def scan(self, fasta_text, method="p", window=100, step=20,
+             max_region=1000, percentage=0.9, per_sequence=False):
+        """
+        Scan one query against the lineages of the panel
+        :param fasta_text: str of query sequences aligned to the panel
+        :param per_sequence: scan each query sequence on its own
+        :return: dict of the results, see scan_result
+        """
+        if method.upper() not in ["P", "A"]:
+            raise RequestError("the method must be 'p' or 'a'")
+
+        query_seq = self.query_matrix(fasta_text)
+
+        query_code = query_seq.matrix
+
+        query_seq.site_masks = (
+            self.gap_mask | (query_code == PAD_CODE).any(axis=0)
+            | (query_code == GAP_CODE).any(axis=0),
+            self.poly_mask | (query_code != self.first_row).any(axis=0))
+
+        query_seq, gap_sites, same_sites = virusrecom.filter_sites(
+            query_seq, self.gaps_use, method)
+
+        if query_seq.shape[1] == 0:
+            raise RequestError("no site is left after the filter of sites")
+
+        site_list = [int(x) for x in query_seq.sites]
+
+        site_index = query_seq.sites - 1
+
+        lineage_stat_list = [(nt_count[site_index], seq_count,
+                              site_ic[site_index])
+                             for nt_count, seq_count, site_ic
+                             in self.lineage_stat_list]
+
+        max_mic = virusrecom.max_information(self.gaps_use)
+
+        result = {"panel": self.name,
+                  "sequences": query_seq.shape[0],
+                  "sites": len(site_list)}
+
+        if per_sequence:
+            region_test_list = virusrecom.scan_sequences(
+                query_seq.matrix, site_list, self.lineage_name_list,
+                lineage_stat_list, self.gaps_use, window, step, max_region,
+                percentage)
+
+            result["results"] = []
+
+            for n, region_test in enumerate(region_test_list):
+                each_result = {"sequence": query_seq.names[n]}
+                each_result.update(scan_result(region_test, max_mic))
+
+                result["results"].append(each_result)
+
+            return result
+
+        wic_matrix = virusrecom.site_wic(query_seq.matrix, lineage_stat_list)
+
+        wic_cumsum = wic_prefix_sum(wic_matrix)
+
+        window_wic, window_site = virusrecom.window_scan(wic_matrix, site_list,
+                                                         window, step,
+                                                         wic_cumsum)
+
+        detected_area_list = virusrecom.detect_regions(
+            wic_matrix, window_wic, window, step, self.gaps_use, percentage,
+            max_region, None, wic_cumsum)
+
+        region_test = None
+
+        if any(detected_area_list):
+            region_test = virusrecom.test_regions(wic_matrix,
+                                                  np.asarray(site_list),
+                                                  self.lineage_name_list,
+                                                  detected_area_list)
+
+        result.update(scan_result(region_test, max_mic))
+
+        return result
+
+
+def scan_result(region_test, max_mic):
+    """
+    :param region_test: see virusrecom.test_regions, None if no lineage
+                        dominates any window
+    :param max_mic: the maximum information content of a site
+    :return: dict of major_parent, major_parent_mwic, recombination
+             ({other parent: [[region in alignment (mWIC), p-value], ...]}),
+             significant and note, the same as the report of RecomScan
+    """
+    summary_list = summary_fields(region_test, max_mic)
+
+    recombination_dic = {}
+    if region_test is not None:
+        recombination_dic = region_test["recombination"]
+
+    return {"major_parent": summary_list[0],
+            "major_parent_mwic": summary_list[1],
+            "recombination": recombination_dic,
+            "significant": summary_list[4] == "Yes",
+            "note": summary_list[5]}
+
+
+def check_scan_params(request):
+    """
+    :param request: dict of the request
+    :return: dict of the parameters of SCAN_DEFAULTS, the missing ones take
+             the defaults
+    :raise RequestError: a parameter has the wrong JSON type or range
+    """
+    params = dict(SCAN_DEFAULTS)
+
+    params.update([(x, request[x]) for x in SCAN_DEFAULTS if x in request])
+
+    if not isinstance(params["method"], str):
+        raise RequestError("the method must be 'p' or 'a'")
+
+    if not isinstance(params["per_sequence"], bool):
+        raise RequestError("per_sequence must be true or false")
+
+    # bool is a subclass of int, true is not a window size
+    for each_param in ["window", "step", "max_region"]:
+        value = params[each_param]
+
+        if (not isinstance(value, int) or isinstance(value, bool)
+                or value <= 0):
+            raise RequestError(each_param + " must be an integer greater than 0")
+
+    value = params["percentage"]
+
+    if (not isinstance(value, (int, float)) or isinstance(value, bool)
+            or not 0 < value <= 1):
+        raise RequestError("percentage must be greater than 0 and at most 1")
+
+    params["percentage"] = float(value)
+
+    return params
+
+
+class ServerMetrics(object):
+
+    def __init__(self):
+        """
+        Counts of requests, queue depth and latency of the server
+        """
+
+        super(ServerMetrics, self).__init__()
+
+        self.lock = threading.Lock()
+
+        self.start_time = time.time()
+
+        self.counts = {"accepted": 0, "completed": 0, "failed": 0,
+                       "rejected": 0}
+
+        self.queued = 0
+
+        self.running = 0
+
+        self.max_queued = 0
+
+        # (seconds waiting in the queue, seconds of the scan) of each request
+        self.latency_list = deque(maxlen=LATENCY_HISTORY)
+
+    def add(self, count_name):
+        with self.lock:
+            self.counts[count_name] += 1
+
+    def enqueue(self):
+        with self.lock:
+            self.counts["accepted"] += 1
+            self.queued += 1
+            self.max_queued = max(self.max_queued, self.queued)
+
+    def start(self):
+        with self.lock:
+            self.queued -= 1
+            self.running += 1
+
+    def finish(self, wait_time, scan_time, failed=False):
+        with self.lock:
+            self.running -= 1
+            self.counts["failed" if failed else "completed"] += 1
+            self.latency_list.append((wait_time, scan_time))
+
+    def snapshot(self):
+        """
+        :return: dict of the metrics, the latencies (seconds) are taken over
+                 the last LATENCY_HISTORY requests
+        """
+        with self.lock:
+            latency_array = np.array(list(self.latency_list)).reshape(-1, 2)
+
+            metrics = {"uptime": time.time() - self.start_time,
+                       "requests": dict(self.counts),
+                       "queue_depth": self.queued,
+                       "max_queue_depth": self.max_queued,
+                       "running": self.running}
+
+        for name, latency in [("queue_wait", latency_array[:, 0]),
+                              ("scan", latency_array[:, 1]),
+                              ("total", latency_array.sum(axis=1))]:
+            if latency.shape[0] == 0:
+                metrics[name + "_seconds"] = None
+                continue
+
+            metrics[name + "_seconds"] = {
+                "mean": float(latency.mean()),
+                "p50": float(np.percentile(latency, 50)),
+                "p95": float(np.percentile(latency, 95)),
+                "max": float(latency.max())}
+
+        return metrics
+
+
+class ScanQueue(object):
+
+    def __init__(self, panel_dic, jobs=1, queue_size=100):
+        """
+        Requests wait in a queue in the order of arrival, at most 'jobs' of
+        them are scanned at the same time
+        :param panel_dic: {name: ReferencePanel}
+        :param jobs: number of scans running at the same time
+        :param queue_size: number of requests waiting, more are rejected
+        """
+
+        super(ScanQueue, self).__init__()
+
+        self.panel_dic = panel_dic
+
+        self.job_queue = queue.Queue(maxsize=queue_size)
+
+        self.metrics = ServerMetrics()
+
+        self.thread_list = []
+
+        for n in range(max(1, jobs)):
+            each_thread = threading.Thread(target=self._work, daemon=True)
+            each_thread.start()
+
+            self.thread_list.append(each_thread)
+
+    def _work(self):
+        while True:
+            job = self.job_queue.get()
+
+            start_time = time.time()
+
+            self.metrics.start()
+
+            try:
+                job["result"] = job["panel"].scan(job["query"],
+                                                  **job["params"])
+            except Exception as scan_error:
+                job["error"] = scan_error
+
+            end_time = time.time()
+
+            self.metrics.finish(start_time - job["time"],
+                                end_time - start_time,
+                                "error" in job)
+
+            job["done"].set()
+
+    def submit(self, request):
+        """
+        :param request: dict of panel, query (fasta text) and the parameters
+                        of SCAN_DEFAULTS
+        :return: dict of the results, see ReferencePanel.scan
+        :raise RequestError: wrong request
+        :raise queue.Full: the queue is full
+        """
+        if not isinstance(request, dict):
+            raise RequestError("the request must be a JSON object")
+
+        if request.get("panel") not in self.panel_dic:
+            raise RequestError("unknown panel: " + str(request.get("panel")))
+
+        if not isinstance(request.get("query"), str):
+            raise RequestError("the query (fasta text) is missing")
+
+        unknown_list = [x for x in request
+                        if x not in ["panel", "query"] + list(SCAN_DEFAULTS)]
+
+        if unknown_list != []:
+            raise RequestError("unknown parameters: " + ", ".join(unknown_list))
+
+        params = check_scan_params(request)
+
+        job = {"panel": self.panel_dic[request["panel"]],
+               "query": request["query"],
+               "params": params,
+               "time": time.time(),
+               "done": threading.Event()}
+
+        try:
+            self.job_queue.put_nowait(job)
+        except queue.Full:
+            self.metrics.add("rejected")
+            raise
+
+        self.metrics.enqueue()
+
+        job["done"].wait()
+
+        if "error" in job:
+            raise job["error"]
+
+        return job["result"]
+
+
+class ScanHandler(BaseHTTPRequestHandler):
+
+    # set by serve
+    scan_queue = None
+
+    def address_string(self):
+        # clients of a Unix socket have no address
+        if isinstance(self.client_address, tuple):
+            return self.client_address[0]
+
+        return "unix"
+
+    def _reply(self, status, content):
+        body = json.dumps(content).encode("utf-8")
+
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+
+        self.wfile.write(body)
+
+    def do_GET(self):
+        scan_queue = self.scan_queue
+
+        if self.path == "/health":
+            self._reply(200, {"status": "ok"})
+
+        elif self.path == "/panels":
+            self._reply(200, [scan_queue.panel_dic[x].info()
+                              for x in scan_queue.panel_dic])
+
+        elif self.path == "/metrics":
+            self._reply(200, scan_queue.metrics.snapshot())
+
+        else:
+            self._reply(404, {"error": "unknown path " + self.path})
+
+    def do_POST(self):
+        if self.path != "/scan":
+            self._reply(404, {"error": "unknown path " + self.path})
+            return
+
+        try:
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+            result = self.scan_queue.submit(json.loads(body.decode("utf-8")))
+
+        except (RequestError, ValueError) as request_error:
+            self._reply(400, {"error": str(request_error)})
+
+        except queue.Full:
+            self._reply(503, {"error": "the queue of requests is full"})
+
+        except Exception as scan_error:
+            self._reply(500, {"error": repr(scan_error)})
+
+        else:
+            self._reply(200, result)
+
+
+class UnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+
+    daemon_threads = True
+
+
+def serve(panel_dic, host="127.0.0.1", port=8765, socket_path="", jobs=1,
+          queue_size=100):
+    """
+    Answer requests until the server is stopped (Ctrl+C)
+    :param panel_dic: {name: ReferencePanel}
+    :param socket_path: filepath of a Unix socket, used instead of host
+                        and port if given
+    """
+    ScanHandler.scan_queue = ScanQueue(panel_dic, jobs, queue_size)
+
+    if socket_path != "":
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+
+        server = UnixHTTPServer(socket_path, ScanHandler)
+
+        print("VirusRecom server is listening on " + socket_path + "\n")
+
+    else:
+        server = ThreadingHTTPServer((host, port), ScanHandler)
+
+        print("VirusRecom server is listening on http://" + host + ":"
+              + str(server.server_address[1]) + "\n")
+
+    try:
+        server.serve_forever()
+
+    except KeyboardInterrupt:
+        pass
+
+    finally:
+        server.server_close()
+
+        if socket_path != "" and os.path.exists(socket_path):
+            os.remove(socket_path)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        prog="VirusRecom server",
+        description="Keep reference panels in memory and scan the queries "
+                    "sent to a local HTTP or Unix-socket API.")
+
+    parser.add_argument("-p", dest="panel", nargs=3, action="append",
+                        metavar=("NAME", "ALIGNMENT", "LINEAGE"),
+                        help = "A reference panel: its name, the FilePath of the "
+                               "aligned sequences (or a store made by seq_store.py) "
+                               "and the FilePath of the lineage marks (one per "
+                               "line, as '-l' of '-a' mode). Can be repeated.",
+                        default=[])
+
+    parser.add_argument("-g", dest="gap",
+                        help = "Gaps (-) in the alignment were used in analysis? "
+                               "'-g y': reserve gaps, '-g n': delete gaps.",
+                        type=str, default="n")
+
+    parser.add_argument("--mark-match", dest="mark_match",
+                        help = "How a lineage mark matches the sequence names, "
+                               "see VirusRecom '--mark-match'. Default is contains.",
+                        type=str, default="contains")
+
+    parser.add_argument("--workers", dest="workers",
+                        help = "Number of processes used for the reference "
+                               "statistics of the panels, default is 1.",
+                        type=int, default=1)
+
+    parser.add_argument("--jobs", dest="jobs",
+                        help = "Number of requests scanned at the same time, "
+                               "default is 1.",
+                        type=int, default=1)
+
+    parser.add_argument("--queue-size", dest="queue_size",
+                        help = "Number of requests waiting to be scanned, more "
+                               "requests are answered with status 503. Default "
+                               "is 100.",
+                        type=int, default=100)
+
+    parser.add_argument("--host", dest="host",
+                        help = "Address of the HTTP server, default is 127.0.0.1.",
+                        type=str, default="127.0.0.1")
+
+    parser.add_argument("--port", dest="port",
+                        help = "Port of the HTTP server, default is 8765.",
+                        type=int, default=8765)
+
+    parser.add_argument("--socket", dest="socket",
+                        help = "FilePath of a Unix socket to listen on instead "
+                               "of the HTTP port.",
+                        type=str, default="")
+
+    myargs = parser.parse_args(sys.argv[1:])
+
+    gaps_use = myargs.gap
+
+    mark_match = myargs.mark_match.lower()
+
+    if myargs.panel == []:
+        print("Error, no reference panel is given after '-p'!")
+        exit()
+
+    if gaps_use.upper() not in ["N", "Y"]:
+        print("Error, the parameter after '-g' is incorrect!")
+        exit()
+
+    if mark_match not in MARK_MATCH:
+        print("Error, the parameter after '--mark-match' is incorrect!")
+        exit()
+
+    if myargs.jobs < 1 or myargs.queue_size < 1:
+        print("Error, '--jobs' and '--queue-size' must be greater than 0!")
+        exit()
+
+    if myargs.socket != "" and not hasattr(socket, "AF_UNIX"):
+        print("Error, Unix sockets are not supported on this system!")
+        exit()
+
+    panel_dic = {}
+
+    for panel_name, aligned_path, lineage_path in myargs.panel:
+
+        if panel_name in panel_dic:
+            print("Error, the panel " + panel_name + " is given twice!")
+            exit()
+
+        lineage_name_list = []
+
+        with open(lineage_path) as lineage_file:
+            for line in lineage_file:
+                line = line.strip()
+                if line != "":
+                    lineage_name_list.append(line)
+
+        start_time = time.time()
+
+        panel_dic[panel_name] = ReferencePanel(panel_name,
+                                               aligned_path.replace("\\", "/"),
+                                               lineage_name_list,
+                                               gaps_use,
+                                               mark_match,
+                                               myargs.workers)
+
+        print("Panel " + panel_name + ": " + str(len(lineage_name_list))
+              + " lineages, " + str(panel_dic[panel_name].sites_count)
+              + " sites, loaded in " + "%.2f" % (time.time() - start_time)
+              + " seconds." + "\n")
+
+    serve(panel_dic, myargs.host, myargs.port, myargs.socket, myargs.jobs,
+          myargs.queue_size)
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+
+"""
+Time, CPU and memory of every stage of a run, saved as JSON.
+"""
+
+import os
+import sys
+import json
+import time
+from contextlib import contextmanager
+
+
+def peak_rss_kb():
+    """
+    Peak resident memory (KB) of this process, None if not available
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    if sys.platform == "darwin":
+        peak_rss = peak_rss // 1024
+
+    return peak_rss
+
+
+def cpu_seconds():
+    """
+    CPU time of this process and of its finished child processes (MAFFT),
+    the workers of LineagePool are counted once they are shut down
+    """
+    cpu_times = os.times()
+
+    return (cpu_times.user + cpu_times.system
+            + cpu_times.children_user + cpu_times.children_system)
+
+
+class RunReport(object):
+
+    def __init__(self, trace=False):
+        """
+        Wall time, CPU time, peak RSS increase and item counts of each stage
+        :param trace: keep the stages as spans of Chrome trace format
+        """
+
+        super(RunReport, self).__init__()
+
+        self.trace = trace
+
+        self.start_time = time.perf_counter()
+
+        self.stage_list = []
+
+        self.depth = 0
+
+    def start_stage(self, stage_name, **counts):
+        """
+        Start a stage, stages can be nested
+        :param stage_name: name of the stage
+        :param counts: item counts of the stage, such as sites=1000
+        :return: the stage, pass it to end_stage
+        """
+        stage = {"name": stage_name,
+                 "depth": self.depth,
+                 "counts": dict(counts),
+                 "_wall_start": time.perf_counter(),
+                 "_cpu_start": cpu_seconds(),
+                 "_rss_start": peak_rss_kb()}
+
+        self.depth += 1
+
+        return stage
+
+    def end_stage(self, stage, **counts):
+        """
+        :param stage: returned by start_stage
+        :param counts: more item counts of the stage
+        """
+        self.depth -= 1
+
+        stage["counts"].update(counts)
+
+        wall_start = stage.pop("_wall_start")
+        cpu_start = stage.pop("_cpu_start")
+        rss_start = stage.pop("_rss_start")
+
+        stage["start"] = wall_start - self.start_time
+        stage["wall_time"] = time.perf_counter() - wall_start
+        stage["cpu_time"] = cpu_seconds() - cpu_start
+
+        stage["peak_rss_delta_kb"] = None
+        if rss_start is not None:
+            stage["peak_rss_delta_kb"] = peak_rss_kb() - rss_start
+
+        self.stage_list.append(stage)
+
+    @contextmanager
+    def stage(self, stage_name, **counts):
+        """
+        Measure the code in a with-block, see start_stage, more counts can
+        be added to the yielded dict
+        """
+        stage = self.start_stage(stage_name, **counts)
+
+        try:
+            yield stage["counts"]
+
+        finally:
+            self.end_stage(stage)
+
+    def save(self, run_record, run_id, run_info=None):
+        """
+        Write the run report, and the trace if trace is True, into run_record
+        :param run_info: dict of the options of this run, optional
+        :return: filepath of the run report
+        """
+        stage_list = sorted(self.stage_list, key=lambda x: x["start"])
+
+        report_path = (run_record + "/" + "Record of run report_"
+                       + run_id + ".json")
+
+        with open(report_path, "w", encoding="utf-8") as report_file:
+            json.dump({"run_id": run_id,
+                       "run_info": run_info or {},
+                       "wall_time": time.perf_counter() - self.start_time,
+                       "peak_rss_kb": peak_rss_kb(),
+                       "stages": stage_list},
+                      report_file, indent=2)
+
+        if self.trace:
+            # complete events ("ph": "X") of Chrome trace format, they can be
+            # opened in chrome://tracing or https://ui.perfetto.dev
+            trace_event_list = []
+
+            for stage in stage_list:
+                trace_event_list.append({"name": stage["name"],
+                                         "cat": "virusrecom",
+                                         "ph": "X",
+                                         "ts": stage["start"] * 1e6,
+                                         "dur": stage["wall_time"] * 1e6,
+                                         "pid": os.getpid(),
+                                         "tid": 0,
+                                         "args": dict(stage["counts"],
+                                                      cpu_time=stage["cpu_time"])})
+
+            with open(run_record + "/" + "Trace_" + run_id + ".json", "w",
+                      encoding="utf-8") as trace_file:
+                json.dump({"traceEvents": trace_event_list,
+                           "displayTimeUnit": "ms"}, trace_file)
+
+        return report_path
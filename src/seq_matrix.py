@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+
+"""
+Aligned sequences as a 2-D matrix of nucleotide codes.
+"""
+
+import numpy as np
+
+from mark_index import (MarkIndex, row_selector)
+
+
+# code 0 is reserved for the padding of sequences shorter than the alignment
+PAD_CODE = 0
+
+# A/C/G/T, gap, N and the IUPAC ambiguity codes, each one keeps its own code
+NT_ALPHABET = "ACGT-NRYKMSWBDHVU"
+
+# any other character in the alignment is rejected by encode_seq
+UNKNOWN_CODE = 255
+
+GAP_CODE = NT_ALPHABET.index("-") + 1
+
+N_CODE = NT_ALPHABET.index("N") + 1
+
+ALPHABET_SIZE = len(NT_ALPHABET) + 1
+
+
+def _build_encode_table():
+    table = np.full(256, UNKNOWN_CODE, dtype=np.uint8)
+
+    for n in range(len(NT_ALPHABET)):
+        nt = NT_ALPHABET[n]
+        table[ord(nt)] = n + 1
+        table[ord(nt.lower())] = n + 1
+
+    return table
+
+
+ENCODE_TABLE = _build_encode_table()
+
+DECODE_TABLE = np.array(list(" " + NT_ALPHABET))
+
+
+def encode_seq(seq):
+    """
+    Encode a nucleotide sequence to an array of small integers
+    :param seq: str or bytes of sequence
+    :return: 1-D uint8 array
+    :raise ValueError: the sequence has a character out of NT_ALPHABET
+    """
+    if isinstance(seq, str):
+        seq = seq.encode("utf-8")
+
+    codes = ENCODE_TABLE[np.frombuffer(seq, dtype=np.uint8)]
+
+    # merging the unknown characters into one code would change the
+    # information content, so they are not allowed
+    unknown = np.flatnonzero(codes == UNKNOWN_CODE)
+
+    if len(unknown) > 0:
+        raise ValueError("the unknown symbol '"
+                         + seq[unknown[0]:unknown[0] + 1].decode("latin-1")
+                         + "' at site " + str(unknown[0] + 1)
+                         + ", only " + NT_ALPHABET + " are allowed")
+
+    return codes
+
+
+def decode_seq(codes):
+    """
+    Decode an array of codes back to the sequence string
+    :param codes: 1-D uint8 array
+    :return: str
+    """
+    return "".join(DECODE_TABLE[codes]).rstrip()
+
+
+class SeqMatrix(object):
+
+    def __init__(self, names, matrix, sites=None, site_masks=None,
+                 mark_index=None, weights=None, members=None):
+        """
+        Aligned sequences stored as a 2-D uint8 matrix
+        :param names: sequence names, one per row
+        :param matrix: 2-D uint8 array, rows are sequences and columns are sites
+        :param sites: original site (1-based) in alignment of each column
+        :param site_masks: gap and polymorphism masks of the whole alignment
+                           (see site_filter.site_masks), given when only some
+                           of its rows are loaded from a store
+        :param mark_index: MarkIndex of names, built on first use if None
+        :param weights: number of sequences each row stands for, see
+                        haplotype.collapse_haplotypes, None if every row is
+                        one sequence
+        :param members: names of the sequences each row stands for, given
+                        with weights
+        """
+
+        super(SeqMatrix, self).__init__()
+
+        self.names = list(names)
+
+        self.matrix = matrix
+
+        if sites is None:
+            sites = np.arange(1, matrix.shape[1] + 1)
+
+        self.sites = np.asarray(sites)
+
+        self.site_masks = site_masks
+
+        self.mark_index = mark_index
+
+        self.weights = weights
+
+        self.members = members
+
+    @property
+    def shape(self):
+        return self.matrix.shape
+
+    def index_marks(self, mark_list, match="contains"):
+        """
+        Search the rows of all marks once, later row_index and select_rows
+        look them up
+        :param mark_list: marks of lineages and queries
+        :param match: see mark_index.MARK_MATCH
+        :return: MarkIndex
+        """
+        self.mark_index = MarkIndex(self.names, mark_list, match)
+
+        return self.mark_index
+
+    def row_index(self, mark):
+        """
+        Rows whose name matches the mark, by default the mark is searched
+        as pandas str.contains does
+        :param mark: mark (a unique string) of lineage
+        :return: 1-D array of row indices
+        """
+        if self.mark_index is None:
+            self.mark_index = MarkIndex(self.names, [])
+
+        return self.mark_index.row_index(mark)
+
+    def row_weights(self, mark):
+        """
+        :param mark: mark (a unique string) of lineage
+        :return: weights of the rows of the mark, None if rows are not weighted
+        """
+        if self.weights is None:
+            return None
+
+        return self.weights[self.row_index(mark)]
+
+    def row_selector(self, mark):
+        """
+        :param mark: mark (a unique string) of lineage
+        :return: slice if the rows of the mark are contiguous, otherwise
+                 1-D array of row indices, see mark_index.row_selector
+        """
+        return row_selector(self.row_index(mark))
+
+    def select_rows(self, mark):
+        """
+        Sub-matrix of the sequences containing the mark, it is a view of
+        this matrix if their rows are contiguous
+        :param mark: mark (a unique string) of lineage
+        :return: SeqMatrix
+        """
+        rows = self.row_index(mark)
+
+        members = None
+        if self.members is not None:
+            members = [self.members[n] for n in rows]
+
+        return SeqMatrix([self.names[n] for n in rows],
+                         self.matrix[row_selector(rows)], self.sites,
+                         weights=self.row_weights(mark),
+                         members=members)
+
+    def select_sites(self, site_mask):
+        """
+        Sub-matrix of the columns kept by a boolean mask
+        :param site_mask: 1-D bool array, one value per column
+        :return: SeqMatrix
+        """
+        return SeqMatrix(self.names,
+                         self.matrix[:, site_mask],
+                         self.sites[site_mask],
+                         mark_index=self.mark_index,
+                         weights=self.weights,
+                         members=self.members)
+
+    def decode(self, row):
+        return decode_seq(self.matrix[row])
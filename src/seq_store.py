@@ -0,0 +1,299 @@
+# -*- coding: utf-8 -*-
+
+"""
+On-disk store of an aligned sequence set, for alignments larger than memory.
+The nucleotide codes are saved site-major (one row per site) in a raw uint8
+file that is opened with numpy.memmap, the names are kept in a sidecar index.
+Convert an aligned fasta once:
+
+    python seq_store.py -a alignment.fasta -o alignment_store
+
+then give the store to VirusRecom with '-a alignment_store'.
+
+"""
+
+import os
+import sys
+import json
+import shutil
+import argparse
+
+import numpy as np
+
+from seq_matrix import (SeqMatrix, encode_seq, NT_ALPHABET, GAP_CODE,
+                        PAD_CODE)
+
+from my_func import read_fasta
+
+from mark_index import (MarkIndex, row_selector)
+
+
+# bump it when the layout of the store changes
+STORE_VERSION = "2"
+
+STORE_INFO = "info.json"
+
+STORE_NAMES = "names.txt"
+
+STORE_MATRIX = "site_matrix.u8"
+
+STORE_GAP_MASK = "gap_mask.npy"
+
+STORE_POLY_MASK = "poly_mask.npy"
+
+# bytes of sequences encoded in memory at once
+BATCH_BYTES = 64 * 1024 * 1024
+
+
+def is_store(path):
+    """
+    :param path: filepath given after '-a'
+    :return: True if it is a directory made by ingest_alignment
+    """
+    return os.path.isfile(os.path.join(path, STORE_INFO))
+
+
+def _write_batch(site_matrix, start, batch, first_seq, gap_mask, poly_mask):
+    """
+    Write a batch of sequences (rows) into the columns of the site-major
+    matrix, and update the gap and polymorphism masks in place
+    """
+    site_matrix[:, start:start + batch.shape[0]] = batch.T
+
+    gap_mask |= ((batch == GAP_CODE) | (batch == PAD_CODE)).any(axis=0)
+
+    poly_mask |= (batch != first_seq).any(axis=0)
+
+
+def ingest_alignment(fasta_path, store_dir, batch_bytes=BATCH_BYTES):
+    """
+    Convert an aligned fasta into a store, the fasta is read twice and at
+    most batch_bytes of sequences are held in memory. Gaps and
+    polymorphism of every site are recorded over all sequences, so that
+    the sites are filtered the same way when only some rows are loaded.
+    :param fasta_path: filepath of aligned sequences (*.fasta format)
+    :param store_dir: dirpath of the store, it must not exist
+    :param batch_bytes: bytes of sequences encoded at once
+    :return: (number of sequences, number of sites)
+    :raise ValueError: no sequence, or a sequence has an unknown symbol
+    """
+    seq_count = 0
+    sites_count = 0
+
+    for seq_name, seq_contain in read_fasta(fasta_path):
+        seq_count += 1
+
+        if len(seq_contain) >= sites_count:
+            sites_count = len(seq_contain)
+
+    if seq_count == 0:
+        raise ValueError("no sequence in " + fasta_path)
+
+    # write into a temporary directory first, so that an interrupted
+    # ingest never leaves a store that looks complete
+    temp_dir = store_dir.rstrip("/\\") + ".tmp" + str(os.getpid())
+
+    os.makedirs(temp_dir)
+
+    site_matrix = np.memmap(os.path.join(temp_dir, STORE_MATRIX),
+                            dtype=np.uint8, mode="w+",
+                            shape=(sites_count, seq_count))
+
+    gap_mask = np.zeros(sites_count, dtype=bool)
+    poly_mask = np.zeros(sites_count, dtype=bool)
+
+    first_seq = None
+
+    batch_rows = max(1, batch_bytes // sites_count)
+
+    batch = np.zeros((min(batch_rows, seq_count), sites_count), dtype=np.uint8)
+
+    with open(os.path.join(temp_dir, STORE_NAMES), "w",
+              encoding="utf-8") as names_file:
+
+        start = 0
+        rows = 0
+
+        for seq_name, seq_contain in read_fasta(fasta_path):
+            names_file.write(seq_name + "\n")
+
+            batch[rows] = PAD_CODE
+
+            try:
+                batch[rows, :len(seq_contain)] = encode_seq(seq_contain)
+
+            except ValueError as e:
+                names_file.close()
+                shutil.rmtree(temp_dir, ignore_errors=True)
+                raise ValueError(seq_name + " has " + str(e))
+
+            if first_seq is None:
+                first_seq = batch[0].copy()
+
+            rows += 1
+
+            if rows == batch.shape[0]:
+                _write_batch(site_matrix, start, batch[:rows], first_seq,
+                             gap_mask, poly_mask)
+
+                start += rows
+                rows = 0
+
+        if rows > 0:
+            _write_batch(site_matrix, start, batch[:rows], first_seq,
+                         gap_mask, poly_mask)
+
+    site_matrix.flush()
+
+    del site_matrix
+
+    np.save(os.path.join(temp_dir, STORE_GAP_MASK), gap_mask)
+    np.save(os.path.join(temp_dir, STORE_POLY_MASK), poly_mask)
+
+    with open(os.path.join(temp_dir, STORE_INFO), "w",
+              encoding="utf-8") as info_file:
+        json.dump({"version": STORE_VERSION,
+                   "alphabet": NT_ALPHABET,
+                   "layout": "site-major",
+                   "seq_count": seq_count,
+                   "sites_count": sites_count,
+                   "source": os.path.abspath(fasta_path)},
+                  info_file, indent=2)
+
+    try:
+        os.rename(temp_dir, store_dir)
+    except OSError:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        raise
+
+    return (seq_count, sites_count)
+
+
+class SeqStore(object):
+
+    def __init__(self, store_dir):
+        """
+        Read-only view of a store made by ingest_alignment, nothing but the
+        names and the site masks is read until rows are loaded
+        :param store_dir: dirpath of the store
+        """
+
+        super(SeqStore, self).__init__()
+
+        self.store_dir = store_dir
+
+        with open(os.path.join(store_dir, STORE_INFO), "r",
+                  encoding="utf-8") as info_file:
+            info = json.load(info_file)
+
+        if (info.get("version") != STORE_VERSION
+                or info.get("alphabet") != NT_ALPHABET):
+            raise ValueError(store_dir + " was made by another version of "
+                             "VirusRecom, please ingest the alignment again")
+
+        self.seq_count = info["seq_count"]
+
+        self.sites_count = info["sites_count"]
+
+        with open(os.path.join(store_dir, STORE_NAMES), "r",
+                  encoding="utf-8") as names_file:
+            self.names = [line.rstrip("\n") for line in names_file]
+
+        if len(self.names) != self.seq_count:
+            raise ValueError("the name index of " + store_dir
+                             + " does not match its sequences")
+
+        # the pages are shared by all runs reading the store on one node
+        self.site_matrix = np.memmap(os.path.join(store_dir, STORE_MATRIX),
+                                     dtype=np.uint8, mode="r",
+                                     shape=(self.sites_count, self.seq_count))
+
+        self.site_masks = (np.load(os.path.join(store_dir, STORE_GAP_MASK)),
+                           np.load(os.path.join(store_dir, STORE_POLY_MASK)))
+
+    def row_index(self, mark_list, match="contains"):
+        """
+        Rows whose name matches any of the marks
+        :param mark_list: list of marks of queries and lineages
+        :param match: see mark_index.MARK_MATCH
+        :return: sorted 1-D array of row indices
+        """
+        mark_index = MarkIndex(self.names, mark_list, match)
+
+        return np.unique(np.concatenate(
+            [mark_index.row_index(x) for x in mark_list]
+            + [np.zeros(0, dtype=np.intp)]))
+
+    def load(self, mark_list=None, match="contains", chunk_sites=4096):
+        """
+        Load the sequences matching the marks, only their bytes of each
+        site are read from the store
+        :param mark_list: list of marks, None loads all sequences without
+                          copying them (a transposed view of the store)
+        :param match: see mark_index.MARK_MATCH
+        :param chunk_sites: number of sites copied together
+        :return: SeqMatrix of all sites, its site_masks are those of the
+                 whole alignment
+        """
+        if mark_list is None:
+            return SeqMatrix(self.names, self.site_matrix.T,
+                             site_masks=self.site_masks)
+
+        rows = self.row_index(mark_list, match)
+
+        selector = row_selector(rows)
+
+        seq_matrix = np.empty((rows.shape[0], self.sites_count), dtype=np.uint8)
+
+        for start in range(0, self.sites_count, chunk_sites):
+            seq_matrix[:, start:start + chunk_sites] = (
+                self.site_matrix[start:start + chunk_sites, selector].T)
+
+        return SeqMatrix([self.names[n] for n in rows], seq_matrix,
+                         site_masks=self.site_masks)
+
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        prog="VirusRecom ingest",
+        description="Convert an aligned sequence set into a memory-mapped "
+                    "store that VirusRecom reads with '-a'.")
+
+    parser.add_argument("-a", dest="alignment",
+                        help = "FilePath of an aligned sequence set(*.fasta format).",
+                        type=str, default="")
+
+    parser.add_argument("-o", dest="store",
+                        help = "DirPath of the store to create, it must not exist. "
+                               "Default is the filepath of the alignment with the "
+                               "suffix '_store'.",
+                        type=str, default="")
+
+    myargs = parser.parse_args(sys.argv[1:])
+
+    fasta_path = myargs.alignment.replace("\\", "/")
+
+    if fasta_path == "" or not os.path.isfile(fasta_path):
+        print("Error, the alignment after '-a' is missing!")
+        exit()
+
+    store_dir = myargs.store.replace("\\", "/")
+
+    if store_dir == "":
+        store_dir = os.path.splitext(fasta_path)[0] + "_store"
+
+    if os.path.exists(store_dir):
+        print("Error, " + store_dir + " already exists!")
+        exit()
+
+    try:
+        seq_count, sites_count = ingest_alignment(fasta_path, store_dir)
+
+    except ValueError as e:
+        print("Error, " + str(e) + "!")
+        exit()
+
+    print(str(seq_count) + " sequences of " + str(sites_count)
+          + " sites were saved in " + store_dir)
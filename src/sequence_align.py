@@ -9,10 +9,111 @@ Time: 2022/5/20 20:18
 """
 import sys
 import os
-import subprocess
+import json
+import hashlib
 import platform
+from datetime import datetime
 
-from my_func import (make_dir, get_all_path, resolve_file_path)
+from my_func import (make_dir, get_all_path, resolve_file_path,
+                     read_fasta)
+
+from aligner_runner import (AlignerRunner, AlignerTimeout)
+
+from run_report import RunReport
+
+from checkpoint import (Checkpoint, fingerprint, file_fingerprint)
+
+
+def mafft_exe_path():
+    """
+    FilePath of the MAFFT shipped in external_program
+    :return:
+    """
+    current_path = os.path.dirname(os.path.abspath(sys.argv[0]))
+    current_path = os.path.dirname(current_path)
+
+    if platform.system().lower() == "windows":
+
+        current_path = current_path.replace("\\", "/")
+
+        return current_path + r"/external_program/mafft/windows/mafft.bat"
+
+    elif platform.system().lower() == "linux":
+
+        return current_path + r"/external_program/mafft/linux/bin/mafft"
+
+    elif platform.system().lower() == "darwin" or platform.system().lower() == "macos":
+
+        return current_path + r"/external_program/mafft/macos/mafft.bat"
+
+    return ""
+
+
+def run_mafft(mafft_option_list, aligned_out_path, timeout=None,
+              record_path="", run_report=None):
+    """
+    Run MAFFT, the alignment is written to aligned_out_path
+    :param mafft_option_list: options and input files of MAFFT
+    :param aligned_out_path:
+    :param timeout: seconds before MAFFT is stopped, None is no limit
+    :param record_path: JSON file collecting the cost of each run, optional
+    :param run_report: RunReport receiving the stage of MAFFT, optional
+    :return: dict of wall time, CPU time and peak RSS, see AlignerRunner.run
+    """
+    mafft_argv = [mafft_exe_path()] + mafft_option_list
+
+    print(" ".join(mafft_argv) + " > " + aligned_out_path)
+
+    run_report = run_report or RunReport()
+
+    try:
+        with run_report.stage("MAFFT") as stage_counts:
+            align_stat = AlignerRunner(mafft_argv, aligned_out_path,
+                                       timeout=timeout, name="MAFFT").run()
+
+            stage_counts["mafft_peak_rss_kb"] = align_stat["peak_rss_kb"]
+
+    except AlignerTimeout as timeout_error:
+        print("Error, " + str(timeout_error) + "!")
+        exit()
+
+    if align_stat["returncode"] != 0:
+        print("Error, MAFFT exited with code "
+              + str(align_stat["returncode"]) + "!")
+        exit()
+
+    print("MAFFT took " + "%.2f" % align_stat["wall_time"] + " seconds"
+          + ("" if align_stat["cpu_time"] is None
+             else " (CPU " + "%.2f" % align_stat["cpu_time"] + " seconds, peak RSS "
+             + str(align_stat["peak_rss_kb"]) + " KB)")
+          + "\n")
+
+    if record_path != "":
+        align_stat_list = []
+
+        if os.path.isfile(record_path):
+            with open(record_path, "r", encoding="utf-8") as record_file:
+                align_stat_list = json.load(record_file)
+
+        align_stat_list.append(align_stat)
+
+        with open(record_path, "w", encoding="utf-8") as record_file:
+            json.dump(align_stat_list, record_file, indent=2)
+
+    return align_stat
+
+
+def write_prefixed_fasta(out_file, fasta_path, prefix):
+    """
+    Copy the records of a fasta file to out_file, each name gets the prefix
+    :param out_file: file opened in binary mode
+    :param fasta_path:
+    :param prefix: such as the lineage name
+    :return:
+    """
+    for seq_name, seq_contain in read_fasta(fasta_path):
+        out_file.write((">" + prefix + "_" + seq_name + "\n").encode("utf-8"))
+        out_file.write(seq_contain + b"\n")
 
 
 class SeqAlign(object):
@@ -23,12 +124,20 @@ class SeqAlign(object):
                  run_record,
                  run_id,
                  thread_num,
-                 out_file):
+                 out_file,
+                 timeout=None,
+                 run_report=None,
+                 checkpoint=None):
 
         """
         Run the sequence alignment
-        :param query_lineage_path: filepath of query sequence 
+        :param query_lineage_path: filepath of query sequence, or a list of
+                                   filepaths when many queries are scanned
         :param other_lineage_dir:  dirpath of other lineages
+        :param timeout: seconds before MAFFT is stopped, None is no limit
+        :param run_report: RunReport receiving the stages, optional
+        :param checkpoint: Checkpoint of the merged and aligned sequences,
+                           optional
         """
 
         super(SeqAlign, self).__init__()
@@ -45,13 +154,24 @@ class SeqAlign(object):
 
         self.out_file = out_file
 
+        self.timeout = timeout
+
+        self.run_report = run_report or RunReport()
+
+        self.checkpoint = checkpoint or Checkpoint()
+
     def run(self):
 
         lineage_name_list = []
 
-        query_seq_path = self.query_seq_path.replace("\\", "/")
+        query_path_list = self.query_seq_path
+
+        if isinstance(query_path_list, str):
+            query_path_list = [query_path_list]
 
-        query_seq_dir, query_seq_prefix = resolve_file_path(query_seq_path)
+        query_path_list = [x.replace("\\", "/") for x in query_path_list]
+
+        query_seq_dir, query_seq_prefix = resolve_file_path(query_path_list[0])
 
 
         lineage_file_dir = self.lineage_file_dir.replace("\\", "/")
@@ -62,100 +182,315 @@ class SeqAlign(object):
                               + "_" + self.run_id
                               + "_merge.fasta")
 
-        seq_for_mafft_file = open(seq_for_mafft_path,"w",encoding="utf-8")
+        merge_fingerprint = fingerprint(
+            "merge", [(resolve_file_path(x)[1], file_fingerprint(x))
+                      for x in query_path_list],
+            lineage_fingerprint(lineage_file_list))
 
+        align_fingerprint = fingerprint(merge_fingerprint, "--inputorder",
+                                        "--auto")
 
-        with open(query_seq_path) as query_seq:
-            seq_for_mafft_file.write(query_seq.read().replace(">",">"
-                                             + query_seq_prefix + "_")
-                                     + "\n")
+        merged_name_list = self.checkpoint.load_file("merged sequences",
+                                                     merge_fingerprint,
+                                                     seq_for_mafft_path)
 
+        if merged_name_list is not None:
+            lineage_name_list = merged_name_list
 
-        for each_path in lineage_file_list:
+        else:
+            with self.run_report.stage("merge sequences") as stage_counts:
 
-            each_path = each_path.replace("\\","/")
+                seq_for_mafft_file = open(seq_for_mafft_path,"wb")
 
-            input_data_dir, out_prefix = resolve_file_path(each_path)
-            lineage_name_list.append(out_prefix)
 
-            with open(each_path,"r",encoding="utf-8") as lineage_file_input:
+                for query_seq_path in query_path_list:
 
-                seq_for_mafft_file.write(lineage_file_input.read().replace(">",">" + out_prefix + "_")
-                                         + "\n")
+                    query_seq_dir, query_seq_prefix = resolve_file_path(query_seq_path)
 
-        seq_for_mafft_file.close()
+                    write_prefixed_fasta(seq_for_mafft_file, query_seq_path,
+                                         query_seq_prefix)
 
 
+                for each_path in lineage_file_list:
+
+                    each_path = each_path.replace("\\","/")
+
+                    input_data_dir, out_prefix = resolve_file_path(each_path)
+                    lineage_name_list.append(out_prefix)
+
+                    write_prefixed_fasta(seq_for_mafft_file, each_path, out_prefix)
+
+                seq_for_mafft_file.close()
+
+                stage_counts["files"] = len(query_path_list) + len(lineage_file_list)
+
+            self.checkpoint.save_file("merged sequences", merge_fingerprint,
+                                      seq_for_mafft_path, lineage_name_list)
 
-        print("Running MAFFT for sequence alignment..." + "\n")
 
         aligned_out_path = self.out_file 
 
-        commd_list = [] 
+        if self.checkpoint.load_file("aligned sequences", align_fingerprint,
+                                     aligned_out_path) is not None:
+            return lineage_name_list
+
+        print("Running MAFFT for sequence alignment..." + "\n")
+
+        run_mafft(["--inputorder",
+                   "--auto",
+                   "--thread", str(self.thread_num),
+                   seq_for_mafft_path],
+                  aligned_out_path,
+                  timeout=self.timeout,
+                  record_path=(self.run_record + "/" + "Record of alignment cost_"
+                               + self.run_id + ".json"),
+                  run_report=self.run_report)
+
+        self.checkpoint.save_file("aligned sequences", align_fingerprint,
+                                  aligned_out_path)
+
+        print("Sequence alignment has been completed!" + "\n")
+
+
+        return lineage_name_list
+
+
+def lineage_fingerprint(lineage_file_list):
+    """
+    Hash of the names and contents of the lineage files
+    :param lineage_file_list:
+    :return: str
+    """
+    file_hash = hashlib.blake2b(digest_size=20)
+
+    prefix_path_list = []
+    for each_path in lineage_file_list:
+        input_data_dir, out_prefix = resolve_file_path(each_path)
+        prefix_path_list.append((out_prefix, each_path))
+
+    for out_prefix, each_path in sorted(prefix_path_list):
+        file_hash.update((out_prefix + "\n").encode("utf-8"))
+
+        with open(each_path, "rb") as lineage_file:
+            for chunk in iter(lambda: lineage_file.read(1 << 20), b""):
+                file_hash.update(chunk)
 
-        current_path = ""
+    return file_hash.hexdigest()
+
+
+class RefAlign(object):
+
+    def __init__(self,
+                 query_lineage_path,
+                 other_lineage_dir,
+                 ref_msa_dir,
+                 run_record,
+                 run_id,
+                 thread_num,
+                 out_file,
+                 add_fragments=False,
+                 timeout=None,
+                 run_report=None,
+                 checkpoint=None):
+
+        """
+        Add query sequences to a persisted alignment of the reference
+        lineages (MAFFT --add --keeplength), the reference alignment is
+        only rebuilt when the lineage files change
+        :param query_lineage_path: filepath of query sequence, or a list of
+                                   filepaths when many queries are scanned
+        :param other_lineage_dir:  dirpath of other lineages
+        :param ref_msa_dir: dirpath keeping the versions of reference alignment
+        :param add_fragments: the queries are fragments (MAFFT --addfragments)
+        :param timeout: seconds before each MAFFT run is stopped, None is no limit
+        :param run_report: RunReport receiving the stages, optional
+        :param checkpoint: Checkpoint of the merged and aligned query
+                           sequences, optional
+        """
+
+        super(RefAlign, self).__init__()
+
+        self.query_seq_path = query_lineage_path
+
+        self.lineage_file_dir = other_lineage_dir
+
+        self.ref_msa_dir = ref_msa_dir.replace("\\", "/")
+
+        self.run_record = run_record
+
+        self.run_id = run_id
+
+        self.thread_num = thread_num
+
+        self.out_file = out_file
+
+        self.timeout = timeout
+
+        self.run_report = run_report or RunReport()
+
+        self.add_fragments = add_fragments
+
+        self.checkpoint = checkpoint or Checkpoint()
+
+
+    def reference(self):
+        """
+        Reference alignment matching the current lineage files, built if needed
+        :return: (filepath of reference alignment, lineage_name_list)
+        """
+        make_dir(self.ref_msa_dir)
+
+        info_path = self.ref_msa_dir + "/reference_info.json"
+
+        ref_info = {"current": 0, "versions": []}
+
+        if os.path.isfile(info_path):
+            with open(info_path, "r", encoding="utf-8") as info_file:
+                ref_info = json.load(info_file)
+
+        lineage_file_dir = self.lineage_file_dir.replace("\\", "/")
+
+        lineage_file_list = [x.replace("\\", "/")
+                             for x in get_all_path(lineage_file_dir)]
+
+        lineage_hash = lineage_fingerprint(lineage_file_list)
+
+        for each_version in ref_info["versions"]:
+            ref_msa_path = self.ref_msa_dir + "/" + each_version["alignment"]
+
+            if (each_version["fingerprint"] == lineage_hash
+                    and os.path.isfile(ref_msa_path)):
+
+                print("Using version " + str(each_version["version"])
+                      + " of the reference alignment: " + ref_msa_path + "\n")
+
+                return (ref_msa_path, each_version["lineage_name_list"])
+
+
+        version = max([x["version"] for x in ref_info["versions"]] + [0]) + 1
+
+        ref_merge_path = (self.ref_msa_dir + "/reference_v"
+                          + str(version) + "_merge.fasta")
+
+        ref_msa_path = (self.ref_msa_dir + "/reference_v"
+                        + str(version) + ".fasta")
+
+        lineage_name_list = []
+
+        with self.run_report.stage("merge reference sequences",
+                                  files=len(lineage_file_list)):
+
+            with open(ref_merge_path, "wb") as ref_merge_file:
+
+                for each_path in lineage_file_list:
+
+                    input_data_dir, out_prefix = resolve_file_path(each_path)
+                    lineage_name_list.append(out_prefix)
+
+                    write_prefixed_fasta(ref_merge_file, each_path, out_prefix)
+
+
+        print("Running MAFFT for version " + str(version)
+              + " of the reference alignment..." + "\n")
+
+        run_mafft(["--inputorder",
+                   "--auto",
+                   "--thread", str(self.thread_num),
+                   ref_merge_path],
+                  ref_msa_path,
+                  timeout=self.timeout,
+                  record_path=(self.run_record + "/" + "Record of alignment cost_"
+                               + self.run_id + ".json"),
+                  run_report=self.run_report)
+
+        ref_info["versions"].append(
+            {"version": version,
+             "fingerprint": lineage_hash,
+             "lineage_name_list": lineage_name_list,
+             "alignment": "reference_v" + str(version) + ".fasta",
+             "created": str(datetime.today().now())})
+
+        ref_info["current"] = version
+
+        with open(info_path + ".tmp", "w", encoding="utf-8") as info_file:
+            json.dump(ref_info, info_file, indent=2)
+
+        os.replace(info_path + ".tmp", info_path)
+
+        return (ref_msa_path, lineage_name_list)
+
+    def run(self):
 
-        if platform.system().lower() == "windows":
+        query_path_list = self.query_seq_path
 
+        if isinstance(query_path_list, str):
+            query_path_list = [query_path_list]
 
-            current_path = os.path.dirname(os.path.abspath(sys.argv[0]))
-            current_path = os.path.dirname(current_path)
-            current_path = current_path.replace("\\", "/")
-  
+        query_path_list = [x.replace("\\", "/") for x in query_path_list]
 
-            run_exe = current_path + r"/external_program/mafft/windows/mafft.bat"
+        query_seq_dir, query_seq_prefix = resolve_file_path(query_path_list[0])
 
-            commd_list.append(run_exe)
 
-        elif platform.system().lower() == "linux":
-            current_path = os.path.dirname(os.path.abspath(sys.argv[0]))
+        ref_msa_path, lineage_name_list = self.reference()
 
-            current_path = os.path.dirname(current_path)
 
-            commd_list.append(current_path
-                              + r"/external_program/mafft/linux/bin/mafft")
+        query_for_mafft_path = (self.run_record + "/" + query_seq_prefix
+                                + "_" + self.run_id
+                                + "_query.fasta")
 
+        merge_fingerprint = fingerprint(
+            "merge query", [(resolve_file_path(x)[1], file_fingerprint(x))
+                            for x in query_path_list])
 
-        elif platform.system().lower() == "darwin" or platform.system().lower() == "macos":
-            current_path = os.path.dirname(os.path.abspath(sys.argv[0]))
-            current_path = os.path.dirname(current_path)
+        if self.checkpoint.load_file("merged query sequences",
+                                     merge_fingerprint,
+                                     query_for_mafft_path) is None:
 
-            commd_list.append(current_path
-                              + r"/external_program/mafft/macos/mafft.bat")
+            with self.run_report.stage("merge query sequences",
+                                      files=len(query_path_list)):
 
+                with open(query_for_mafft_path, "wb") as query_for_mafft_file:
 
-        commd_list.append(" --inputorder")
-        commd_list.append(" --auto")
-        commd_list.append(" --thread " + str(self.thread_num) + " ")
-        commd_list.append(seq_for_mafft_path + " > " + aligned_out_path)
+                    for query_seq_path in query_path_list:
 
-        mafft_commd = ""
+                        query_seq_dir, query_seq_prefix = resolve_file_path(query_seq_path)
 
+                        write_prefixed_fasta(query_for_mafft_file, query_seq_path,
+                                             query_seq_prefix)
 
-        for x in commd_list:
-            mafft_commd += x
+            self.checkpoint.save_file("merged query sequences",
+                                      merge_fingerprint, query_for_mafft_path)
 
-        print(mafft_commd)
 
-        process = subprocess.Popen(mafft_commd,
-                                   stdout=subprocess.PIPE,
-                                   stderr=subprocess.STDOUT,
-                                   universal_newlines=True,
-                                   shell=True)
+        add_option = "--add"
+        if self.add_fragments:
+            add_option = "--addfragments"
 
+        align_fingerprint = fingerprint(merge_fingerprint,
+                                        file_fingerprint(ref_msa_path),
+                                        add_option, "--keeplength")
 
-        while True:
+        if self.checkpoint.load_file("aligned sequences", align_fingerprint,
+                                     self.out_file) is not None:
+            return lineage_name_list
 
-            output = process.stdout.readline()
-            if process.poll() is not None:
-                break
+        print("Running MAFFT to add the query sequences to the reference alignment..."
+              + "\n")
 
-            elif output:
-                print(output)
+        run_mafft([add_option, query_for_mafft_path,
+                   "--keeplength",
+                   "--thread", str(self.thread_num),
+                   ref_msa_path],
+                  self.out_file,
+                  timeout=self.timeout,
+                  record_path=(self.run_record + "/" + "Record of alignment cost_"
+                               + self.run_id + ".json"),
+                  run_report=self.run_report)
 
-        process.terminate()
+        self.checkpoint.save_file("aligned sequences", align_fingerprint,
+                                  self.out_file)
 
         print("Sequence alignment has been completed!" + "\n")
 
 
-        return lineage_name_list
\ No newline at end of file
+        return lineage_name_list
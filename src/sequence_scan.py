@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+
+"""
+Scan of every query sequence on its own, the results are summarised in
+one table.
+"""
+
+import pandas as pd
+
+from table_writer import write_table
+
+from run_report import RunReport
+
+from virusrecom import (max_information, scan_sequences)
+
+
+# columns of summary_fields
+SUMMARY_COLUMNS = ["Major parent", "Major parent global mWIC", "Other parents",
+                   "Recombination regions (p-value)",
+                   "Significant (p-value < 0.05)", "Note"]
+
+
+def summary_fields(region_test, max_mic):
+    """
+    One row of a summary table
+    :param region_test: see virusrecom.test_regions, None if no lineage
+                        dominates any window
+    :param max_mic: the maximum information content of a site
+    :return: list of the values of SUMMARY_COLUMNS
+    """
+    if region_test is None:
+        return ["", "", "", "", "No", "No lineage dominates any window"]
+
+    mean_major_parent = region_test["major_parent_mwic"]
+
+    recombination_dic = region_test["recombination"]
+
+    event_list = []
+
+    for each_lineage in recombination_dic:
+        for each_event in recombination_dic[each_lineage]:
+            event_list.append(each_lineage + ": " + ", ".join(each_event))
+
+    note = ""
+    if mean_major_parent / max_mic < 0.5:
+        note = "Similarity of major parent is less than 50%"
+
+    return [region_test["major_parent"],
+            mean_major_parent,
+            ", ".join(recombination_dic),
+            "; ".join(event_list),
+            "Yes" if region_test["significant"] else "No",
+            note]
+
+
+class SequenceScan(object):
+
+    def __init__(self,
+                 query_seq_prefix,
+                 query_seq,
+                 site_list,
+                 lineage_name_list,
+                 lineage_stat_list,
+                 out_dir,
+                 run_id,
+                 gaps_use,
+                 windows_size,
+                 step_size,
+                 max_recom_fragment,
+                 recom_percentage,
+                 lineage_pool,
+                 output_format="xlsx",
+                 run_report=None):
+
+        """
+        Scan every sequence matching the query mark on its own against the
+        reference lineages, the results are written to one summary table
+        with one row per sequence (identical sequences share the result)
+        :param query_seq_prefix: mark (a unique string) of query
+        :param query_seq: SeqMatrix of query sequences, its rows may be
+                          weighted haplotypes
+        :param site_list: original site of each column in alignment
+        :param lineage_stat_list: reference statistics of each lineage,
+                                  see wic_engine.calc_lineage_stat
+        :param out_dir: dirpath of the results of this query
+        :param lineage_pool: LineagePool running the per-lineage tasks
+        :param output_format: format of result tables, see TABLE_FORMATS
+        :param run_report: RunReport receiving the stages, optional
+        """
+
+        super(SequenceScan, self).__init__()
+
+        self.query_seq_prefix = query_seq_prefix
+
+        self.query_seq = query_seq
+
+        self.site_list = site_list
+
+        self.lineage_name_list = lineage_name_list
+
+        self.lineage_stat_list = lineage_stat_list
+
+        self.out_dir = out_dir
+
+        self.run_id = run_id
+
+        self.gaps_use = gaps_use
+
+        self.windows_size = windows_size
+
+        self.step_size = step_size
+
+        self.max_recom_fragment = max_recom_fragment
+
+        self.recom_percentage = recom_percentage
+
+        self.lineage_pool = lineage_pool
+
+        self.output_format = output_format
+
+        self.run_report = run_report or RunReport()
+
+    def run(self):
+        """
+        :return: the summary table (pandas.DataFrame), one row per sequence
+        """
+        query_seq = self.query_seq
+
+        max_mic = max_information(self.gaps_use)
+
+        seq_count = query_seq.shape[0]
+
+        seq_weights = [1] * seq_count
+        if query_seq.weights is not None:
+            seq_weights = query_seq.weights.tolist()
+
+        seq_members = [[x] for x in query_seq.names]
+        if query_seq.members is not None:
+            seq_members = query_seq.members
+
+        summary_row_list = []
+
+        significant_count = 0
+
+        stage = self.run_report.start_stage("scan of each sequence",
+                                            sequences=seq_count,
+                                            lineages=len(self.lineage_name_list))
+
+        result_list = scan_sequences(query_seq.matrix,
+                                     self.site_list,
+                                     self.lineage_name_list,
+                                     self.lineage_stat_list,
+                                     self.gaps_use,
+                                     self.windows_size,
+                                     self.step_size,
+                                     self.max_recom_fragment,
+                                     self.recom_percentage,
+                                     self.lineage_pool)
+
+        for n, region_test in enumerate(result_list):
+
+            if region_test is not None and region_test["significant"]:
+                significant_count += seq_weights[n]
+
+            summary_field_list = summary_fields(region_test, max_mic)
+
+            for each_name in seq_members[n]:
+                summary_row_list.append([each_name, seq_weights[n]]
+                                        + summary_field_list)
+
+        self.run_report.end_stage(stage, significant=significant_count)
+
+        summary_data = pd.DataFrame(
+            summary_row_list,
+            columns=["Sequence", "Identical sequences"] + SUMMARY_COLUMNS)
+
+        summary_table = (self.out_dir + "/" + self.run_id + "_"
+                         + self.query_seq_prefix
+                         + "_Recombination of each sequence")
+
+        stage = self.run_report.start_stage("write sequence summary table",
+                                            format=self.output_format)
+
+        write_table(summary_data, summary_table, self.output_format)
+
+        self.run_report.end_stage(stage)
+
+        print(str(significant_count) + " of " + str(sum(seq_weights))
+              + " sequences of " + self.query_seq_prefix
+              + " have significant recombination events, see "
+              + summary_table + "." + self.output_format + "\n")
+
+        return summary_data
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+
+"""
+Removal of the gap and monomorphic sites of an alignment.
+"""
+
+import numpy as np
+
+from seq_matrix import (SeqMatrix, GAP_CODE, PAD_CODE)
+
+from checkpoint import Checkpoint
+
+
+def site_masks(code_matrix, chunk_size=8192):
+    """
+    Gap and polymorphism of every site in one pass over the alignment
+    :param code_matrix: 2-D uint8 array, rows are sequences and columns are sites
+    :param chunk_size: number of sites checked together
+    :return: (1-D bool array, True if the site has a gap or padding,
+              1-D bool array, True if the sequences differ in the site)
+    """
+    sites_count = code_matrix.shape[1]
+
+    gap_mask = np.zeros(sites_count, dtype=bool)
+    poly_mask = np.zeros(sites_count, dtype=bool)
+
+    for start in range(0, sites_count, chunk_size):
+        chunk = code_matrix[:, start:start + chunk_size]
+
+        gap_mask[start:start + chunk_size] = (
+            (chunk == GAP_CODE) | (chunk == PAD_CODE)).any(axis=0)
+
+        poly_mask[start:start + chunk_size] = (chunk != chunk[0]).any(axis=0)
+
+    return (gap_mask, poly_mask)
+
+
+def write_site_record(record_path, title, sites):
+    """
+    Record the original sites removed by a filter
+    :param record_path: filepath of record
+    :param title: first line of record
+    :param sites: 1-D array of original sites
+    """
+    with open(record_path, "w", encoding="utf-8") as record_file:
+        record_file.write(title + "\n")
+
+        record_file.write("".join(["Site " + str(x) + "\n"
+                                   for x in sites.tolist()]))
+
+
+def filter_sites(seq_matrix, gaps_use="n", method="p"):
+    """
+    Delete the sites with gaps ('-g n') and the monomorphic sites ('-m p')
+    :param seq_matrix: SeqMatrix of the alignment
+    :param gaps_use: 'y' reserve gaps, 'n' delete gaps
+    :param method: 'p' polymorphic sites only, 'a' all sites
+    :return: (SeqMatrix of kept sites, its sites map each column to the
+              original site in alignment,
+              1-D array of original sites deleted for gaps,
+              1-D array of original sites deleted for no variation)
+    """
+    if seq_matrix.site_masks is not None:
+        gap_mask, poly_mask = seq_matrix.site_masks
+    else:
+        gap_mask, poly_mask = site_masks(seq_matrix.matrix)
+
+    keep_mask = np.ones(gap_mask.shape[0], dtype=bool)
+
+    gap_sites = seq_matrix.sites[:0]
+    same_sites = seq_matrix.sites[:0]
+
+    if gaps_use.upper() == "N":
+        gap_sites = seq_matrix.sites[gap_mask]
+
+        keep_mask &= ~gap_mask
+
+    if method.upper() == "P":
+        same_sites = seq_matrix.sites[keep_mask & ~poly_mask]
+
+        keep_mask &= poly_mask
+
+    # the original sites fit in 32 bits
+    kept_sites = seq_matrix.sites[keep_mask].astype(np.int32)
+
+    return (SeqMatrix(seq_matrix.names,
+                      seq_matrix.matrix[:, keep_mask],
+                      kept_sites,
+                      mark_index=seq_matrix.mark_index,
+                      weights=seq_matrix.weights,
+                      members=seq_matrix.members),
+            gap_sites,
+            same_sites)
+
+
+class SiteFilter(object):
+
+    def __init__(self, seq_matrix, gaps_use, method, aligned_path,
+                 run_record, run_id, checkpoint=None, data_fingerprint=""):
+        """
+        Delete the sites with gaps ('-g n') and the monomorphic sites ('-m p'),
+        the deleted sites are recorded in run_record
+        :param seq_matrix: SeqMatrix of the alignment
+        :param gaps_use: 'y' reserve gaps, 'n' delete gaps
+        :param method: 'p' polymorphic sites only, 'a' all sites
+        :param aligned_path: filepath of the alignment, used in records
+        :param checkpoint: Checkpoint of the gap and polymorphism masks,
+                           optional
+        :param data_fingerprint: fingerprint of the rows of seq_matrix
+        """
+
+        super(SiteFilter, self).__init__()
+
+        self.seq_matrix = seq_matrix
+
+        self.gaps_use = gaps_use
+
+        self.method = method
+
+        self.aligned_path = aligned_path
+
+        self.run_record = run_record
+
+        self.run_id = run_id
+
+        self.checkpoint = checkpoint or Checkpoint()
+
+        self.data_fingerprint = data_fingerprint
+
+    def run(self):
+        """
+        :return: SeqMatrix of kept sites, see filter_sites
+        """
+        # an alignment store keeps its own masks
+        if self.seq_matrix.site_masks is None:
+            self.seq_matrix.site_masks = self.checkpoint.run(
+                "site masks", self.data_fingerprint,
+                site_masks, self.seq_matrix.matrix)
+
+        seq_matrix_clean, gap_sites, same_sites = filter_sites(
+            self.seq_matrix, self.gaps_use, self.method)
+
+        if self.gaps_use.upper() == "N":
+
+            write_site_record(self.run_record + "/"
+                              + "Record of deleted gap sites_"
+                              + self.run_id + ".txt",
+                              "These sites with gap(-) in the file of "
+                              + self.aligned_path,
+                              gap_sites)
+
+        if self.method.upper() == "P":
+
+            write_site_record(self.run_record + "/"
+                              + "Record of same sites in aligned sequence_"
+                              + self.run_id + ".txt",
+                              "These same sites(no variation) in the file of "
+                              + self.aligned_path,
+                              same_sites)
+
+        return seq_matrix_clean
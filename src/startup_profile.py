@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+
+"""
+Import time of the heavy libraries at startup.
+"""
+
+import sys
+import time
+
+
+# libraries whose import dominates the startup of VirusRecom
+HEAVY_LIBRARIES = ["numpy", "pandas", "scipy", "matplotlib"]
+
+
+def loaded_libraries():
+    return [x for x in HEAVY_LIBRARIES if x in sys.modules]
+
+
+class StartupProfile(object):
+
+    def __init__(self, start_time):
+        """
+        Time of each step before the calculations start
+        :param start_time: time.perf_counter() when main.py was loaded
+        """
+
+        super(StartupProfile, self).__init__()
+
+        self.start_time = start_time
+
+        self.last_time = start_time
+
+        self.last_loaded = loaded_libraries()
+
+        # [step name, seconds, heavy libraries imported in the step]
+        self.step_list = []
+
+    def mark(self, step_name):
+        """
+        End a step, the step started at the end of the previous step
+        :param step_name: name of the step
+        """
+        now = time.perf_counter()
+
+        now_loaded = loaded_libraries()
+
+        self.step_list.append([step_name, now - self.last_time,
+                               [x for x in now_loaded
+                                if x not in self.last_loaded]])
+
+        self.last_time = now
+        self.last_loaded = now_loaded
+
+    def report(self):
+        """
+        :return: str, one line per step
+        """
+        report_lines = ["Startup profile (seconds):"]
+
+        for step_name, step_time, new_loaded in self.step_list:
+            report_lines.append("  " + step_name.ljust(32)
+                                + "%8.3f" % step_time
+                                + ("" if new_loaded == []
+                                   else "  (imports " + ", ".join(new_loaded) + ")"))
+
+        report_lines.append("  " + "total".ljust(32)
+                            + "%8.3f" % (self.last_time - self.start_time))
+
+        not_loaded = [x for x in HEAVY_LIBRARIES if x not in self.last_loaded]
+        if not_loaded != []:
+            report_lines.append("  Not imported yet: " + ", ".join(not_loaded))
+
+        return "\n".join(report_lines) + "\n"
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+
+"""
+On-disk cache of the reference statistics of lineages, keyed by the
+content of their sequences.
+"""
+
+import os
+import json
+import shutil
+import hashlib
+
+import numpy as np
+
+from seq_matrix import NT_ALPHABET
+
+from lineage_pool import attach_array
+
+
+# bump it when the layout or the meaning of the cached tables changes
+CACHE_VERSION = "2"
+
+
+def lineage_stat_key(lineage_matrix, site_list, max_ic, weights=None):
+    """
+    Key of the reference statistics of one lineage, a hash of the lineage
+    sequences, the alignment coordinates and the options
+    :param lineage_matrix: code matrix of the lineage
+    :param site_list: original site of each column
+    :param max_ic: 2 if gaps were deleted, log2(5) if gaps were reserved
+    :param weights: number of sequences of each row (haplotype), optional
+    :return: str
+    """
+    key_hash = hashlib.blake2b(digest_size=20)
+
+    key_hash.update((CACHE_VERSION + "|" + NT_ALPHABET + "|"
+                     + repr(float(max_ic)) + "|"
+                     + str(lineage_matrix.shape)).encode("utf-8"))
+
+    key_hash.update(np.ascontiguousarray(site_list, dtype=np.int64).tobytes())
+
+    key_hash.update(np.ascontiguousarray(lineage_matrix).tobytes())
+
+    if weights is not None:
+        key_hash.update(b"weights")
+        key_hash.update(np.ascontiguousarray(weights, dtype=np.int64).tobytes())
+
+    return key_hash.hexdigest()
+
+
+def lineage_stat_key_task(matrix_ref, rows, site_list, max_ic, weights=None):
+    """
+    Task of LineagePool, lineage_stat_key on rows of the shared alignment
+    """
+    return lineage_stat_key(attach_array(matrix_ref)[rows], site_list, max_ic,
+                            weights)
+
+
+class LineageStatCache(object):
+
+    def __init__(self, cache_dir, max_size):
+        """
+        On-disk cache of reference statistics of lineages, the tables are
+        saved as .npy files and loaded memory-mapped
+        :param cache_dir: dirpath of cache
+        :param max_size: the maximum size (bytes) of cache, the least
+                         recently used entries are deleted beyond it
+        """
+
+        super(LineageStatCache, self).__init__()
+
+        self.cache_dir = cache_dir.replace("\\", "/")
+
+        self.max_size = max_size
+
+        # number of entries loaded by this object
+        self.hit_count = 0
+
+        if os.path.isdir(self.cache_dir) == False:
+            os.makedirs(self.cache_dir)
+
+    def entry_dir(self, key):
+        return self.cache_dir + "/" + key
+
+    def load(self, key):
+        """
+        :param key: see lineage_stat_key
+        :return: see wic_engine.calc_lineage_stat, None if not cached
+        """
+        entry_dir = self.entry_dir(key)
+
+        try:
+            with open(entry_dir + "/info.json", "r", encoding="utf-8") as info_file:
+                seq_count = json.load(info_file)["seq_count"]
+
+            nt_count = np.load(entry_dir + "/nt_count.npy", mmap_mode="r")
+
+            site_ic = np.load(entry_dir + "/site_ic.npy", mmap_mode="r")
+
+        except (OSError, ValueError, KeyError):
+            return None
+
+        self.hit_count += 1
+
+        # the modification time records the last use
+        try:
+            os.utime(entry_dir)
+        except OSError:
+            pass
+
+        return (nt_count, seq_count, site_ic)
+
+    def save(self, key, lineage_stat):
+        """
+        :param key: see lineage_stat_key
+        :param lineage_stat: see wic_engine.calc_lineage_stat
+        """
+        nt_count, seq_count, site_ic = lineage_stat
+
+        entry_dir = self.entry_dir(key)
+
+        if os.path.isdir(entry_dir):
+            return
+
+        # write into a temporary directory first, so that a concurrent run
+        # never sees half of an entry
+        temp_dir = entry_dir + ".tmp" + str(os.getpid())
+
+        os.makedirs(temp_dir)
+
+        np.save(temp_dir + "/nt_count.npy", np.asarray(nt_count))
+        np.save(temp_dir + "/site_ic.npy", np.asarray(site_ic))
+
+        with open(temp_dir + "/info.json", "w", encoding="utf-8") as info_file:
+            json.dump({"seq_count": int(seq_count)}, info_file)
+
+        try:
+            os.rename(temp_dir, entry_dir)
+        except OSError:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    def evict(self):
+        """
+        Delete the least recently used entries until the cache fits max_size
+        """
+        entry_list = []
+
+        total_size = 0
+
+        for key in os.listdir(self.cache_dir):
+            entry_dir = self.entry_dir(key)
+
+            if not os.path.isdir(entry_dir) or ".tmp" in key:
+                continue
+
+            # another run may evict the same entry at the same time
+            try:
+                entry_size = 0
+                for file_name in os.listdir(entry_dir):
+                    entry_size += os.path.getsize(entry_dir + "/" + file_name)
+
+                entry_list.append((os.path.getmtime(entry_dir), entry_size,
+                                   entry_dir))
+
+            except OSError:
+                continue
+
+            total_size += entry_size
+
+        entry_list.sort()
+
+        for last_use, entry_size, entry_dir in entry_list:
+            if total_size <= self.max_size:
+                break
+
+            shutil.rmtree(entry_dir, ignore_errors=True)
+
+            total_size -= entry_size
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+
+"""
+Parsing of the values of the parameter sweep, kept apart from the heavy
+imports so that main.py checks them first.
+"""
+
+# no heavy library is imported here, main.py checks the sweep options
+# before the modules of calculations are loaded
+
+
+def parse_sweep_values(text, value_type=int):
+    """
+    Values of one swept parameter
+    :param text: list 'a,b,c' or range 'start:stop:step' (stop is included),
+                 both can be combined, such as '50,100:300:100'
+    :param value_type: int or float
+    :return: list of values in the given order, without repeats
+    """
+    value_list = []
+
+    for part in text.split(","):
+        part = part.strip()
+
+        if part == "":
+            continue
+
+        if ":" not in part:
+            value_list.append(value_type(part))
+            continue
+
+        range_part = part.split(":")
+
+        if len(range_part) != 3:
+            raise ValueError("a range is written as start:stop:step, not "
+                             + part)
+
+        start, stop, step = [value_type(x) for x in range_part]
+
+        if step <= 0 or stop < start:
+            raise ValueError("the range " + part + " is empty")
+
+        step_num = int(round((stop - start) / step))
+
+        for n in range(step_num + 1):
+            # rounding keeps 0.1 + 0.2 as 0.3 in ranges of float
+            value = value_type(round(start + n * step, 10))
+
+            if value <= stop:
+                value_list.append(value)
+
+    if value_list == []:
+        raise ValueError("no value is given")
+
+    return list(dict.fromkeys(value_list))
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+
+"""
+Writing of result tables in the formats of --table-format.
+"""
+
+import importlib.util
+
+
+# output format of result tables and the suffix of their files
+TABLE_FORMATS = {"xlsx": ".xlsx",
+                 "csv": ".csv",
+                 "tsv": ".tsv",
+                 "parquet": ".parquet",
+                 "arrow": ".arrow"}
+
+
+def check_table_format(table_format):
+    """
+    :param table_format: key of TABLE_FORMATS
+    :return: error message, "" if the format can be written
+    """
+    if table_format not in TABLE_FORMATS:
+        return ("the parameter after '--output-format' is incorrect, use one of "
+                + ", ".join(TABLE_FORMATS.keys()))
+
+    if (table_format in ["parquet", "arrow"]
+            and importlib.util.find_spec("pyarrow") is None):
+        return ("'--output-format " + table_format
+                + "' requires the package pyarrow, please install it first")
+
+    return ""
+
+
+def write_table(data, table_path, table_format="xlsx"):
+    """
+    Write a result table
+    :param data: DataFrame
+    :param table_path: filepath of table without suffix
+    :param table_format: key of TABLE_FORMATS
+    :return: filepath of table
+    """
+    table_path = table_path + TABLE_FORMATS[table_format]
+
+    if table_format == "xlsx":
+        data.to_excel(excel_writer=table_path,
+                      index=False,
+                      encoding="utf-8")
+
+    elif table_format == "csv":
+        data.to_csv(table_path, index=False, encoding="utf-8")
+
+    elif table_format == "tsv":
+        data.to_csv(table_path, sep="\t", index=False, encoding="utf-8")
+
+    elif table_format == "parquet":
+        data.to_parquet(table_path, index=False)
+
+    else:
+        # Arrow IPC (Feather V2) file, it can be memory-mapped when read
+        data.reset_index(drop=True).to_feather(table_path)
+
+    return table_path
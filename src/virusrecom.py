@@ -0,0 +1,530 @@
+# -*- coding: utf-8 -*-
+
+"""
+Stages of VirusRecom as functions working on arrays in memory, main.py
+writes their results to files. Example:
+
+    import virusrecom
+
+    seq_matrix = virusrecom.load_alignment("alignment.fasta")
+    seq_matrix, gap_sites, same_sites = virusrecom.filter_sites(seq_matrix, "n", "p")
+    lineage_stat_list = virusrecom.reference_stats(seq_matrix, ["LA_", "LB_"], "n")
+    result = virusrecom.scan_query(seq_matrix.select_rows("XE_").matrix,
+                                   seq_matrix.sites, ["LA_", "LB_"],
+                                   lineage_stat_list, "n")
+
+"""
+
+import numpy as np
+
+from my_func import read_seq
+
+from seq_store import (is_store, SeqStore)
+
+from site_filter import filter_sites
+
+from haplotype import collapse_haplotypes
+
+from wic_engine import (query_major_nt, calc_lineage_wic, lineage_stat_task)
+
+from stat_cache import lineage_stat_key_task
+
+from lineage_pool import (LineagePool, attach_array)
+
+from lineage_scan import (wic_prefix_sum, scan_windows, dominant_windows,
+                          search_recom_region_task, scan_breakpoint_task)
+
+
+__all__ = ["load_alignment", "filter_sites", "collapse_haplotypes",
+           "max_information", "reference_stats", "site_wic",
+           "sequence_site_wic", "window_scan", "detect_regions",
+           "test_regions", "breakpoint_scan", "sweep_parameters",
+           "scan_sequences", "scan_query"]
+
+
+def load_alignment(aligned_path, mark_list=None, match="contains"):
+    """
+    :param aligned_path: filepath of aligned sequences (*.fasta format), or
+                         dirpath of a store made by seq_store.ingest_alignment
+    :param mark_list: marks of queries and lineages, only the matching rows
+                      of a store are loaded, all rows if it is None. A fasta
+                      is always read whole.
+    :param match: see mark_index.MARK_MATCH
+    :return: SeqMatrix
+    """
+    if is_store(aligned_path):
+        return SeqStore(aligned_path).load(mark_list, match)
+
+    return read_seq(aligned_path)
+
+
+def max_information(gaps_use):
+    """
+    :param gaps_use: 'y' reserve gaps, 'n' delete gaps
+    :return: the maximum information content of a site
+    """
+    if gaps_use.upper() == "N":
+        return 2
+
+    return np.log2(5)
+
+
+def reference_stats(seq_matrix, lineage_name_list, gaps_use="n",
+                    lineage_pool=None, stat_cache=None):
+    """
+    Reference statistics of each lineage, they are shared by all queries
+    :param seq_matrix: SeqMatrix of the filtered alignment, its rows may be
+                       weighted haplotypes (see collapse_haplotypes)
+    :param lineage_name_list: marks (a unique string) of lineages
+    :param lineage_pool: LineagePool, run serially if it is None
+    :param stat_cache: LineageStatCache, optional
+    :return: list of statistics, see wic_engine.calc_lineage_stat
+    """
+    lineage_pool = lineage_pool or LineagePool(1)
+
+    max_mic = max_information(gaps_use)
+
+    site_list = [int(x) for x in seq_matrix.sites]
+
+    seq_matrix_ref = lineage_pool.share(seq_matrix.matrix)
+
+    # slices for contiguous lineages, so that no rows are copied
+    lineage_row_list = [seq_matrix.row_selector(each_lineage)
+                        for each_lineage in lineage_name_list]
+
+    lineage_weight_list = [seq_matrix.row_weights(each_lineage)
+                           for each_lineage in lineage_name_list]
+
+    lineage_num = len(lineage_name_list)
+
+    lineage_stat_list = [None] * lineage_num
+
+    if stat_cache is not None:
+
+        stat_key_list = lineage_pool.map(lineage_stat_key_task,
+                                         [seq_matrix_ref] * lineage_num,
+                                         lineage_row_list,
+                                         [site_list] * lineage_num,
+                                         [max_mic] * lineage_num,
+                                         lineage_weight_list)
+
+        lineage_stat_list = [stat_cache.load(x) for x in stat_key_list]
+
+    stat_miss_list = [n for n in range(lineage_num)
+                      if lineage_stat_list[n] is None]
+
+    new_stat_list = lineage_pool.map(lineage_stat_task,
+                                     [seq_matrix_ref] * len(stat_miss_list),
+                                     [lineage_row_list[n] for n in stat_miss_list],
+                                     [max_mic] * len(stat_miss_list),
+                                     [lineage_weight_list[n] for n in stat_miss_list])
+
+    for n, lineage_stat in zip(stat_miss_list, new_stat_list):
+        lineage_stat_list[n] = lineage_stat
+
+        if stat_cache is not None:
+            stat_cache.save(stat_key_list[n], lineage_stat)
+
+    if stat_cache is not None:
+        stat_cache.evict()
+
+    lineage_pool.release(seq_matrix_ref)
+
+    return lineage_stat_list
+
+
+def site_wic(query_matrix, lineage_stat_list, query_weights=None):
+    """
+    Weighted information content from each lineage in every site
+    :param query_matrix: code matrix of query sequences
+    :param lineage_stat_list: see reference_stats
+    :param query_weights: number of sequences of each query row, optional
+    :return: 2-D array (lineages x sites)
+    """
+    major_nt, query_nt_ratio = query_major_nt(query_matrix, query_weights)
+
+    return np.array([calc_lineage_wic(x, major_nt, query_nt_ratio)
+                     for x in lineage_stat_list])
+
+
+def sequence_site_wic(query_matrix, lineage_stat_list):
+    """
+    Weighted information content of every query sequence on its own, the
+    same as site_wic of each sequence alone (its nucleotide is the major
+    one with proportion 1)
+    :param query_matrix: code matrix of query sequences
+    :param lineage_stat_list: see reference_stats
+    :return: 3-D array (sequences x lineages x sites)
+    """
+    seq_count, sites_count = query_matrix.shape
+
+    wic_tensor = np.empty((seq_count, len(lineage_stat_list), sites_count))
+
+    site_index = np.arange(sites_count)
+
+    for n in range(len(lineage_stat_list)):
+        nt_count, lineage_seq_count, site_ic = lineage_stat_list[n]
+
+        wic_tensor[:, n, :] = (nt_count[site_index, query_matrix]
+                               / lineage_seq_count) * site_ic
+
+    return wic_tensor
+
+
+def window_scan(wic_matrix, site_list, windows_size, step_size,
+                wic_cumsum=None):
+    """
+    Mean WIC of each lineage in sliding windows, see lineage_scan.scan_windows
+    :return: (2-D array (lineages x windows) of mean WIC,
+              1-D array of central position in alignment)
+    """
+    return scan_windows(wic_matrix, site_list, windows_size, step_size,
+                        wic_cumsum)
+
+
+def detect_regions(wic_matrix, window_wic, windows_size, step_size, gaps_use,
+                   recom_percentage, max_recom_fragment, lineage_pool=None,
+                   wic_cumsum=None):
+    """
+    Recombination regions of each lineage, searched from the windows it
+    dominates
+    :param wic_matrix: 2-D array (lineages x sites) of WIC
+    :param window_wic: 2-D array (lineages x windows) of mean WIC
+    :param lineage_pool: LineagePool, run serially if it is None
+    :param wic_cumsum: see lineage_scan.wic_prefix_sum, computed if it is None
+    :return: list (one per lineage) of list of [region_left, region_right],
+             the bounds are column indices of wic_matrix
+    """
+    lineage_pool = lineage_pool or LineagePool(1)
+
+    max_mic = max_information(gaps_use)
+
+    lineage_num = wic_matrix.shape[0]
+
+    lineage_frag_list = dominant_windows(window_wic, wic_matrix.shape[1],
+                                         windows_size, step_size, max_mic,
+                                         recom_percentage)
+
+    if wic_cumsum is None:
+        wic_cumsum = wic_prefix_sum(wic_matrix)
+
+    wic_ref = lineage_pool.share(wic_matrix)
+    wic_cumsum_ref = lineage_pool.share(wic_cumsum)
+
+    detected_area_list = lineage_pool.map(
+        search_recom_region_task,
+        [wic_ref] * lineage_num,
+        range(lineage_num),
+        lineage_frag_list,
+        [step_size] * lineage_num,
+        [max_mic] * lineage_num,
+        [recom_percentage] * lineage_num,
+        [max_recom_fragment] * lineage_num,
+        [wic_cumsum_ref] * lineage_num)
+
+    lineage_pool.release(wic_cumsum_ref)
+    lineage_pool.release(wic_ref)
+
+    return detected_area_list
+
+
+def test_regions(wic_matrix, site_list, lineage_name_list, detected_area_list):
+    """
+    Major parent and Mann-Whitney U test of the regions of other parents
+    against the major parent
+    :param wic_matrix: 2-D array (lineages x sites) of WIC
+    :param site_list: original site of each column
+    :param detected_area_list: see detect_regions
+    :return: dict of
+             major_parent: mark of the major parent,
+             major_parent_mwic: global mWIC of the major parent,
+             recom_region: {lineage: regions in column indices},
+             recombination: {other parent: [[region in alignment (mWIC),
+                                             p-value], ...]},
+             significant: True if any region has p-value < 0.05
+    """
+    # scipy is only loaded when a region is tested
+    import scipy.stats as stats
+
+    sites_count = wic_matrix.shape[1]
+
+    lineage_row = {}
+
+    recom_region_dic = {}
+
+    for n in range(len(lineage_name_list)):
+        lineage_row[lineage_name_list[n]] = n
+
+        if detected_area_list[n] != []:
+            recom_region_dic[lineage_name_list[n]] = detected_area_list[n]
+
+
+    parents_region = {}
+
+    for each_lineage in recom_region_dic:
+        region_list = recom_region_dic[each_lineage]
+
+        parents_region[each_lineage] = [sum([x[1] - x[0] for x in region_list])]
+
+    major_parent = max(parents_region, key=parents_region.get)
+
+    major_parent_wic = wic_matrix[lineage_row[major_parent]].tolist()
+
+    mean_major_parent = sum(major_parent_wic) / sites_count
+
+
+    other_parental_markers = False
+
+    recombination_dic = {}
+
+    for each_lineage in recom_region_dic:
+
+        if each_lineage != major_parent:
+
+            recombination_dic[each_lineage] = []
+
+            lineage_wic = wic_matrix[lineage_row[each_lineage]].tolist()
+
+            for each_region in recom_region_dic[each_lineage]:
+                each_region_start = each_region[0]
+                each_region_end = each_region[1]
+
+                this_lineage_ic_count = lineage_wic[each_region_start:each_region_end]
+
+                major_parent_ic_count = major_parent_wic[each_region_start:each_region_end]
+
+                region_mwic = sum(this_lineage_ic_count) / (each_region_end - each_region_start + 1)
+
+                left_start_site_original = int(site_list[each_region_start])
+
+                right_end_site_original = int(
+                    site_list[min(each_region_end, sites_count - 1)])
+
+                try:
+
+                    zihe_test = stats.mannwhitneyu(this_lineage_ic_count,
+                                                   major_parent_ic_count,
+                                                   alternative="two-sided")
+
+                    p_value = zihe_test[1]
+
+                    recombination_dic[each_lineage].append([str(
+                        left_start_site_original) + " to " + str(
+                        right_end_site_original) + "(mWIC: " + str(region_mwic) + ")"
+                        ,"p_value: " + str(p_value)])
+
+                    if p_value < 0.05:
+                        other_parental_markers = True
+
+                except:
+
+                    recombination_dic[each_lineage].append([str(
+                        left_start_site_original) + " to " + str(
+                        right_end_site_original), "p_value: 1"])
+
+    return {"major_parent": major_parent,
+            "major_parent_mwic": mean_major_parent,
+            "recom_region": recom_region_dic,
+            "recombination": recombination_dic,
+            "significant": other_parental_markers}
+
+
+def breakpoint_scan(wic_matrix, site_list, breakwins, lineage_pool=None):
+    """
+    -lg(p-value) of Mann-Whitney U test around every site of each lineage
+    :param wic_matrix: 2-D array (lineages x sites) of WIC
+    :param site_list: original site of each column
+    :param breakwins: window size
+    :param lineage_pool: LineagePool, run serially if it is None
+    :return: (list of central position in alignment,
+              list (one per lineage) of list of -lg(p-value))
+    """
+    lineage_pool = lineage_pool or LineagePool(1)
+
+    lineage_num = wic_matrix.shape[0]
+
+    wic_ref = lineage_pool.share(wic_matrix)
+
+    breakpoint_scan_list = lineage_pool.map(scan_breakpoint_task,
+                                            [wic_ref] * lineage_num,
+                                            range(lineage_num),
+                                            [site_list] * lineage_num,
+                                            [breakwins] * lineage_num)
+
+    lineage_pool.release(wic_ref)
+
+    central_pos_list = []
+    if breakpoint_scan_list != []:
+        central_pos_list = breakpoint_scan_list[-1][0]
+
+    return (central_pos_list, [x[1] for x in breakpoint_scan_list])
+
+
+def sweep_task(wic_ref, wic_cumsum_ref, site_list, lineage_name_list,
+               gaps_use, windows_size, step_size, max_recom_fragment,
+               recom_percentage):
+    """
+    Task of LineagePool, window scan, region search and test of one
+    combination of parameters on the shared WIC
+    :return: see test_regions, None if no lineage dominates any window
+    """
+    wic_matrix = attach_array(wic_ref)
+
+    wic_cumsum = attach_array(wic_cumsum_ref)
+
+    window_wic, window_site = window_scan(wic_matrix, site_list, windows_size,
+                                          step_size, wic_cumsum)
+
+    detected_area_list = detect_regions(wic_matrix, window_wic, windows_size,
+                                        step_size, gaps_use, recom_percentage,
+                                        max_recom_fragment, None, wic_cumsum)
+
+    if not any(detected_area_list):
+        return None
+
+    return test_regions(wic_matrix, site_list, lineage_name_list,
+                        detected_area_list)
+
+
+def sweep_parameters(wic_matrix, site_list, lineage_name_list, gaps_use,
+                     combination_list, lineage_pool=None):
+    """
+    Regions and tests of many combinations of parameters from one site WIC,
+    the combinations run in parallel on the pool
+    :param wic_matrix: 2-D array (lineages x sites) of WIC, see site_wic
+    :param site_list: original site of each column
+    :param combination_list: list of (windows_size, step_size,
+                             max_recom_fragment, recom_percentage)
+    :param lineage_pool: LineagePool, run serially if it is None
+    :return: list of the results of test_regions, one per combination,
+             None if no lineage dominates any window
+    """
+    lineage_pool = lineage_pool or LineagePool(1)
+
+    site_list = np.asarray(site_list)
+
+    combination_num = len(combination_list)
+
+    wic_ref = lineage_pool.share(wic_matrix)
+    wic_cumsum_ref = lineage_pool.share(wic_prefix_sum(wic_matrix))
+
+    result_list = lineage_pool.map(sweep_task,
+                                   [wic_ref] * combination_num,
+                                   [wic_cumsum_ref] * combination_num,
+                                   [site_list] * combination_num,
+                                   [lineage_name_list] * combination_num,
+                                   [gaps_use] * combination_num,
+                                   [x[0] for x in combination_list],
+                                   [x[1] for x in combination_list],
+                                   [x[2] for x in combination_list],
+                                   [x[3] for x in combination_list])
+
+    lineage_pool.release(wic_cumsum_ref)
+    lineage_pool.release(wic_ref)
+
+    return result_list
+
+
+def scan_sequences(query_matrix, site_list, lineage_name_list,
+                   lineage_stat_list, gaps_use="n", windows_size=100,
+                   step_size=20, max_recom_fragment=1000, recom_percentage=0.9,
+                   lineage_pool=None, chunk_bytes=256 * 1024 * 1024):
+    """
+    Scan every query sequence on its own. The WIC and the sliding windows
+    of a chunk of sequences are computed together, the regions are then
+    searched and tested sequence by sequence.
+    :param query_matrix: code matrix of query sequences
+    :param site_list: original site of each column
+    :param lineage_stat_list: see reference_stats
+    :param chunk_bytes: memory of the WIC of the sequences computed together
+    :return: generator of the results of test_regions, one per sequence in
+             the order of query_matrix, None if no lineage dominates any
+             window of the sequence
+    """
+    site_list = np.asarray(site_list)
+
+    seq_count, sites_count = query_matrix.shape
+
+    lineage_num = len(lineage_stat_list)
+
+    # float64 WIC and its longdouble prefix sums of each sequence
+    seq_bytes = max(1, lineage_num * (sites_count + 1) * 24)
+
+    chunk_size = max(1, chunk_bytes // seq_bytes)
+
+    for start in range(0, seq_count, chunk_size):
+        wic_tensor = sequence_site_wic(query_matrix[start:start + chunk_size],
+                                       lineage_stat_list)
+
+        chunk_count = wic_tensor.shape[0]
+
+        wic_rows = wic_tensor.reshape(chunk_count * lineage_num, sites_count)
+
+        wic_cumsum = wic_prefix_sum(wic_rows)
+
+        window_wic, window_site = window_scan(wic_rows, site_list,
+                                              windows_size, step_size,
+                                              wic_cumsum)
+
+        for n in range(chunk_count):
+            rows = slice(n * lineage_num, (n + 1) * lineage_num)
+
+            detected_area_list = detect_regions(wic_tensor[n], window_wic[rows],
+                                                windows_size, step_size,
+                                                gaps_use, recom_percentage,
+                                                max_recom_fragment,
+                                                lineage_pool, wic_cumsum[rows])
+
+            if not any(detected_area_list):
+                yield None
+                continue
+
+            yield test_regions(wic_tensor[n], site_list, lineage_name_list,
+                               detected_area_list)
+
+
+def scan_query(query_matrix, site_list, lineage_name_list, lineage_stat_list,
+               gaps_use="n", windows_size=100, step_size=20,
+               max_recom_fragment=1000, recom_percentage=0.9,
+               breakwins=None, lineage_pool=None, query_weights=None):
+    """
+    All stages of one query, nothing is written to files
+    :param query_matrix: code matrix of query sequences
+    :param site_list: original site of each column
+    :param lineage_stat_list: see reference_stats
+    :param breakwins: window size of breakpoint scan, None skips it
+    :param query_weights: number of sequences of each query row, optional
+    :return: dict of site_wic, window_wic, window_site and the results of
+             test_regions, plus breakpoint_site and breakpoint_lg_p if the
+             breakpoint scan runs, None if no lineage dominates any window
+             (same as scan_sequences)
+    """
+    site_list = np.asarray(site_list)
+
+    wic_matrix = site_wic(query_matrix, lineage_stat_list, query_weights)
+
+    wic_cumsum = wic_prefix_sum(wic_matrix)
+
+    window_wic, window_site = window_scan(wic_matrix, site_list, windows_size,
+                                          step_size, wic_cumsum)
+
+    detected_area_list = detect_regions(wic_matrix, window_wic, windows_size,
+                                        step_size, gaps_use, recom_percentage,
+                                        max_recom_fragment, lineage_pool,
+                                        wic_cumsum)
+
+    if not any(detected_area_list):
+        return None
+
+    result = test_regions(wic_matrix, site_list, lineage_name_list,
+                          detected_area_list)
+
+    result["site_wic"] = wic_matrix
+    result["window_wic"] = window_wic
+    result["window_site"] = window_site
+
+    if breakwins is not None:
+        result["breakpoint_site"], result["breakpoint_lg_p"] = breakpoint_scan(
+            wic_matrix, site_list, breakwins, lineage_pool)
+
+    return result
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+
+"""
+Nucleotide counts, information content and weighted information content
+(WIC) of code matrices.
+"""
+
+import numpy as np
+
+from seq_matrix import (ALPHABET_SIZE, PAD_CODE)
+
+from lineage_pool import attach_array
+
+
+# cells of the code matrix counted together with weights
+WEIGHTED_CHUNK_CELLS = 1 << 22
+
+
+def count_nt(code_matrix, weights=None, chunk_size=8192):
+    """
+    Count each nucleotide code in every site
+    :param code_matrix: 2-D uint8 array, rows are sequences and columns are sites
+    :param weights: number of sequences of each row (haplotype), optional
+    :param chunk_size: the maximum number of sites counted together with
+                       weights, fewer if the rows are many
+    :return: 2-D int array (sites x alphabet)
+    """
+    rows, sites_count = code_matrix.shape
+
+    if weights is not None and (np.asarray(weights) == 1).all():
+        weights = None
+
+    if weights is None:
+        nt_count = np.zeros((sites_count, ALPHABET_SIZE), dtype=np.int64)
+
+        for code in range(ALPHABET_SIZE):
+            nt_count[:, code] = np.count_nonzero(code_matrix == code, axis=0)
+
+        return nt_count
+
+    # every (code, site) pair of a chunk is one bin of np.bincount, so all
+    # codes are counted in one pass; counts below 2**53 are exact in float64
+    weights = np.asarray(weights, dtype=np.float64)
+
+    chunk_size = max(1, min(chunk_size, WEIGHTED_CHUNK_CELLS // max(1, rows)))
+
+    nt_count = np.empty((sites_count, ALPHABET_SIZE), dtype=np.int64)
+
+    for start in range(0, sites_count, chunk_size):
+        chunk = code_matrix[:, start:start + chunk_size]
+
+        width = chunk.shape[1]
+
+        bins = chunk.astype(np.intp) * width + np.arange(width)
+
+        chunk_count = np.bincount(bins.ravel(),
+                                  weights=np.repeat(weights, width),
+                                  minlength=ALPHABET_SIZE * width)
+
+        nt_count[start:start + width] = np.rint(
+            chunk_count.reshape(ALPHABET_SIZE, width).T)
+
+    return nt_count
+
+
+def weight_sum(code_matrix, weights=None):
+    """
+    :return: number of sequences of the rows of code_matrix
+    """
+    if weights is None:
+        return code_matrix.shape[0]
+
+    return int(np.sum(weights))
+
+
+def calc_ic(nt_count, seq_count, max_ic):
+    """
+    Information content of every site, max_ic - Shannon entropy of the
+    nucleotides (gaps are one of them if max_ic = log2(5))
+    :param nt_count: count tables (... x sites x alphabet)
+    :param seq_count: sequence number of each table
+    :param max_ic: the maximum information content
+    :return: array (... x sites)
+    """
+    # padding is not counted, the most frequent nucleotide is summed first
+    nt_count = -np.sort(-nt_count[..., PAD_CODE + 1:], axis=-1)
+
+    seq_count = np.asarray(seq_count, dtype=np.float64)[..., None]
+
+    ent = np.zeros(nt_count.shape[:-1])
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for code in range(nt_count.shape[-1]):
+            p = nt_count[..., code] / seq_count
+            ent = ent + np.where(p > 0, -p * np.log2(p), 0)
+
+    return max_ic - ent
+
+
+def query_major_nt(query_matrix, weights=None):
+    """
+    Most frequent nucleotide of the query sequences in every site,
+    the first one that appears wins a tie (same as max(list, key=list.count))
+    :param query_matrix: code matrix of query sequences
+    :param weights: number of sequences of each row, the rows must keep the
+                    order of first appearance (see collapse_haplotypes)
+    :return: (1-D array of nucleotide codes, 1-D array of its proportion)
+    """
+    query_count = count_nt(query_matrix, weights)
+
+    max_count = query_count.max(axis=1)
+
+    rows = query_matrix.shape[0]
+
+    first_row = np.full(query_count.shape, rows)
+    for code in range(ALPHABET_SIZE):
+        code_mask = query_matrix == code
+        first_row[:, code] = np.where(code_mask.any(axis=0),
+                                      code_mask.argmax(axis=0), rows)
+
+    first_row[query_count != max_count[:, None]] = rows + 1
+
+    major_nt = first_row.argmin(axis=1)
+
+    return (major_nt, max_count / weight_sum(query_matrix, weights))
+
+
+def calc_lineage_stat(lineage_matrix, max_ic, weights=None):
+    """
+    Reference statistics of one lineage, they do not depend on the query
+    :param lineage_matrix: code matrix of the lineage
+    :param max_ic: 2 if gaps were deleted, log2(5) if gaps were reserved
+    :param weights: number of sequences of each row (haplotype), optional
+    :return: (2-D array (sites x alphabet) of nucleotide count,
+              sequence number of the lineage,
+              1-D array (sites) of information content)
+    """
+    nt_count = count_nt(lineage_matrix, weights)
+
+    seq_count = weight_sum(lineage_matrix, weights)
+
+    site_ic = calc_ic(nt_count, seq_count, max_ic)
+
+    # the count never exceeds the sequence number, keep the table small
+    nt_count = nt_count.astype(np.min_scalar_type(seq_count))
+
+    return (nt_count, seq_count, site_ic)
+
+
+def lineage_stat_task(matrix_ref, rows, max_ic, weights=None):
+    """
+    Task of LineagePool, calc_lineage_stat on rows of the shared alignment
+    :param matrix_ref: reference of the shared code matrix
+    :param rows: row indices of the lineage
+    :param weights: number of sequences of each row, optional
+    :return: see calc_lineage_stat
+    """
+    lineage_matrix = attach_array(matrix_ref)[rows]
+
+    return calc_lineage_stat(lineage_matrix, max_ic, weights)
+
+
+def calc_lineage_wic(lineage_stat, major_nt, query_nt_ratio):
+    """
+    Weighted information content from one lineage in every site
+    :param lineage_stat: see calc_lineage_stat
+    :param major_nt: most frequent nucleotide of query, see query_major_nt
+    :param query_nt_ratio: proportion of major_nt in query
+    :return: 1-D array (sites)
+    """
+    nt_count, seq_count, site_ic = lineage_stat
+
+    site_index = np.arange(nt_count.shape[0])
+
+    query_nt_lineage_ratio = nt_count[site_index, major_nt] / seq_count
+
+    return query_nt_lineage_ratio * site_ic * query_nt_ratio
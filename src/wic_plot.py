@@ -0,0 +1,345 @@
+# -*- coding: utf-8 -*-
+
+"""
+Figures of the WIC of sites and windows and of the breakpoint scan.
+"""
+
+import os
+
+from plt_corlor_list import plt_corlor
+
+
+# numpy and matplotlib are imported when the first figure is drawn, runs
+# without figures never load matplotlib
+
+PLOT_FORMATS = ["pdf", "png"]
+
+# resolution of PNG figures and of the rasterized points in PDF figures
+PLOT_DPI = 200
+
+
+def load_pyplot():
+    """
+    Import matplotlib with the agg backend
+    :return: module matplotlib.pyplot
+    """
+    import matplotlib
+
+    matplotlib.use("agg")
+
+    import matplotlib.pyplot as plt
+
+    return plt
+
+
+def decimate_minmax(x, y, bins):
+    """
+    Keep only the lowest and the highest point in each of bins equal
+    slices of the x axis, a series much longer than the pixel width of
+    the figure then looks the same with far fewer points
+    :param x: 1-D array in ascending order
+    :param y: 1-D array
+    :param bins: number of slices, about the pixel width of the axes
+    :return: (x, y) of the kept points, in the original order
+    """
+    import numpy as np
+
+    x = np.asarray(x)
+    y = np.asarray(y, dtype=np.float64)
+
+    if bins <= 0 or y.shape[0] <= 2 * bins:
+        return (x, y)
+
+    x_span = float(x[-1] - x[0])
+    if x_span <= 0:
+        return (x, y)
+
+    bin_id = np.minimum(((x - x[0]) / x_span * bins).astype(np.int64),
+                        bins - 1)
+
+    # sorted by bin and then by value, the first and the last point of
+    # each bin are its minimum and maximum
+    order = np.lexsort((y, bin_id))
+
+    bin_start = np.flatnonzero(np.diff(bin_id[order], prepend=-1))
+    bin_end = np.append(bin_start[1:], order.shape[0]) - 1
+
+    keep = np.unique(np.concatenate((order[bin_start], order[bin_end])))
+
+    return (x[keep], y[keep])
+
+
+def decimate_grid(x, y, x_bins, y_bins):
+    """
+    Keep one point per cell of a x_bins x y_bins grid, for scatters whose
+    points in one pixel column take many different values
+    :param x: 1-D array
+    :param y: 1-D array
+    :return: (x, y) of the kept points, in the original order
+    """
+    import numpy as np
+
+    x = np.asarray(x)
+    y = np.asarray(y, dtype=np.float64)
+
+    if y.shape[0] <= 2 * x_bins:
+        return (x, y)
+
+    def to_bin(value, bins):
+        value = np.nan_to_num(value.astype(np.float64))
+        value_span = float(value.max() - value.min())
+        if value_span <= 0:
+            return np.zeros(value.shape[0], dtype=np.int64)
+
+        return np.minimum(((value - value.min()) / value_span
+                           * bins).astype(np.int64), bins - 1)
+
+    cell_id = to_bin(x, x_bins) * y_bins + to_bin(y, y_bins)
+
+    keep = np.sort(np.unique(cell_id, return_index=True)[1])
+
+    return (x[keep], y[keep])
+
+
+def plot_site_wic(fig_path, query_seq_prefix, site_list, lineage_name_list,
+                  site_wic, dpi=PLOT_DPI):
+    """
+    Scatter of WIC from each lineage in every site, one axes per lineage
+    :param site_wic: 2-D array (lineages x sites) of WIC
+    """
+    plt = load_pyplot()
+
+    lineage_count = len(lineage_name_list)
+
+    fig_high = max(2, int(max(site_list) * 3 / 10000) * 2)
+
+
+    fig, ax =  plt.subplots(lineage_count, 1,
+                            figsize=(lineage_count,fig_high),
+                            squeeze=False)
+
+    fig.suptitle("Query seq: " + query_seq_prefix,family="Arial")
+    fig.tight_layout()
+
+    cm1 = plt.cm.get_cmap("Reds")
+    plt.subplots_adjust(top=0.95)
+
+
+    for n in range(lineage_count):
+        each_lineage = lineage_name_list[n]
+        ax_n = ax[n][0]
+
+        x, y = decimate_grid(site_list, site_wic[n], int(lineage_count * dpi),
+                             int(fig_high * dpi / lineage_count))
+
+        xx = ax_n.scatter(x,y,c=y,
+                     label=each_lineage,s=5,
+                     cmap=cm1,rasterized=True)
+
+        fig.colorbar(xx, ax = ax_n)
+
+        ax_n.set_ylabel("WIC",family="Arial")
+
+        ax_n.legend(loc="best")
+
+        x1_label = ax_n.get_xticklabels()
+        [x1_label_temp.set_fontname("Arial") for x1_label_temp in
+         x1_label]
+        y1_label = ax_n.get_yticklabels()
+        [y1_label_temp.set_fontname("Arial") for y1_label_temp in
+         y1_label]
+
+
+
+    plt.xlabel("Site in alignment",family="Arial")
+
+
+    plt.savefig(fig_path, dpi=dpi)
+    plt.close(fig)
+
+
+def plot_window_wic(fig_path, query_seq_prefix, original_site_list,
+                    lineage_name_list, window_wic, gaps_use, y_start,
+                    dpi=PLOT_DPI):
+    """
+    Lines of mean WIC from each lineage in sliding windows
+    :param window_wic: 2-D array (lineages x windows) of mean WIC
+    """
+    plt = load_pyplot()
+
+    fig, ax = plt.subplots()
+    ax.spines["right"].set_visible(False)
+    ax.spines["top"].set_visible(False)
+
+    if gaps_use.upper() == "N":
+
+        plt.ylim((y_start, 2))
+
+    else:
+        plt.ylim((y_start, 2.5))
+
+
+    axes_width = int(fig.get_figwidth() * dpi)
+
+    for n in range(len(lineage_name_list)):
+        each_lineage = lineage_name_list[n]
+
+        x, y = decimate_minmax(original_site_list, window_wic[n], axes_width)
+
+        try:
+            plt.plot(x, y,
+                 label=each_lineage,color=plt_corlor[n],linewidth=1)
+        except:
+            plt.plot(x, y,
+                     label=each_lineage, color="black",linewidth=1)
+        finally:
+            pass
+
+
+    plt.legend()
+
+    plt.margins(0)
+    plt.subplots_adjust(bottom=0.10)
+    plt.xlabel("Site in alignment",family="Arial")
+    plt.ylabel("Mean of weighted information content",family="Arial")
+    plt.title("Query seq: " + query_seq_prefix,family="Arial")
+
+
+    x1_label = ax.get_xticklabels()
+    [x1_label_temp.set_fontname("Arial") for x1_label_temp in
+     x1_label]
+    y1_label = ax.get_yticklabels()
+    [y1_label_temp.set_fontname("Arial") for y1_label_temp in
+     y1_label]
+
+
+    plt.savefig(fig_path, dpi=dpi)
+    plt.close(fig)
+
+
+def plot_breakpoint(fig_path, query_seq_prefix, central_pos_list,
+                    lineage_name_list, negative_lg_p_matrix,
+                    dpi=PLOT_DPI):
+    """
+    Lines of -lg(p-value) of breakpoint scan, one axes per lineage
+    :param negative_lg_p_matrix: 2-D array (lineages x windows) of -lg(p-value)
+    """
+    plt = load_pyplot()
+
+    lineage_count = len(lineage_name_list)
+
+    fig_high2 = max(2, int(max(central_pos_list) * 3 / 10000) * 2)
+
+    figs, axs = plt.subplots(lineage_count, 1, figsize=(lineage_count,
+    fig_high2), squeeze=False)
+
+    figs.suptitle("Query seq: " + query_seq_prefix,family="Arial")
+    figs.tight_layout()
+
+    plt.subplots_adjust(top=0.95)
+
+    for n in range(lineage_count):
+        each_lineage = lineage_name_list[n]
+        ax_n = axs[n][0]
+
+        x, y = decimate_minmax(central_pos_list, negative_lg_p_matrix[n],
+                               int(lineage_count * dpi))
+
+        try:
+
+            ax_n.plot(x, y,
+                        label=query_seq_prefix + " : " + each_lineage,
+                         color=plt_corlor[n],rasterized=True)
+
+        except:
+            ax_n.plot(x, y,
+                      label=query_seq_prefix + " : " + each_lineage,
+                      color="black",rasterized=True)
+
+        finally:
+            pass
+
+        ax_n.set_ylabel("-lg(P)",family="Arial")
+
+        ax_n.legend(loc="best")
+
+        x1_label = ax_n.get_xticklabels()
+        [x1_label_temp.set_fontname("Arial") for x1_label_temp in
+         x1_label]
+        y1_label = ax_n.get_yticklabels()
+        [y1_label_temp.set_fontname("Arial") for y1_label_temp in
+         y1_label]
+
+
+    plt.xlabel("Site in alignment",family="Arial")
+
+    plt.savefig(fig_path, dpi=dpi)
+
+    plt.close(figs)
+
+
+class FigurePlotter(object):
+
+    def __init__(self, plot_format="pdf", background=False):
+        """
+        Draw the figures of results, in this process or in a background
+        process while the calculations continue
+        :param plot_format: 'pdf', 'png', or 'none' to skip all figures
+        :param background: draw in a background process
+        """
+
+        super(FigurePlotter, self).__init__()
+
+        self.plot_format = plot_format
+
+        self.background = background
+
+        self.executor = None
+
+        self.future_list = []
+
+    def plot(self, plot_func, fig_path, *args):
+        """
+        :param plot_func: plot_site_wic, plot_window_wic or plot_breakpoint
+        :param fig_path: filepath of figure, its suffix follows plot_format
+        :param args: the other parameters of plot_func
+        """
+        if self.plot_format == "none":
+            return
+
+        fig_path = os.path.splitext(fig_path)[0] + "." + self.plot_format
+
+        if not self.background:
+            plot_func(fig_path, *args)
+            return
+
+        if self.executor is None:
+            from concurrent.futures import ProcessPoolExecutor
+
+            self.executor = ProcessPoolExecutor(max_workers=1)
+
+        self.future_list.append(
+            (fig_path, self.executor.submit(plot_func, fig_path, *args)))
+
+    def close(self):
+        """
+        Wait for the figures drawn in background
+        """
+        for fig_path, future in self.future_list:
+            try:
+                future.result()
+            except Exception as plot_error:
+                print("Error, failed to draw " + fig_path + ": "
+                      + str(plot_error))
+
+        self.future_list = []
+
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()